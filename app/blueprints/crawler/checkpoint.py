@@ -0,0 +1,144 @@
+# checkpoint.py
+"""
+Crawl checkpoints: enough of a running crawl to carry on after the web
+worker that ran it is gone (a deploy, a restart, a crash).
+
+Every CRAWL_CHECKPOINT_SECONDS a crawl writes its parameters, counters,
+results, its visited/queued fingerprint sets and every frontier entry to
+instance/crawl_checkpoints/<crawl_id>.sqlite3. The file is built under a
+temporary name and renamed over the old one, so a worker killed while
+writing leaves the previous checkpoint whole. Pages that were in flight
+when the checkpoint was taken are listed in it and fetched again on
+resume; every other fetched page stays fetched.
+
+A crawl that finishes deletes its checkpoint; one that fails or is cut
+short keeps it. Checkpoints older than CRAWL_CHECKPOINT_MAX_AGE_HOURS are
+pruned when the list of resumable crawls is read. A running crawl holds
+an flock on <crawl_id>.lock, so a crawl still running in another worker
+process (a rolling deploy) is neither listed nor resumed twice.
+"""
+import json
+import os
+import sqlite3
+import time
+
+try:
+    import fcntl
+except ImportError:   # not POSIX: no guard against resuming a crawl twice
+    fcntl = None
+
+from app.blueprints.main.fetch_utils import _env_int
+from app.blueprints.main.storage import instance_path
+
+CHECKPOINT_SECONDS = _env_int("CRAWL_CHECKPOINT_SECONDS", 60)
+CHECKPOINT_MAX_AGE = _env_int("CRAWL_CHECKPOINT_MAX_AGE_HOURS", 7 * 24) * 3600
+_DIR = "crawl_checkpoints"
+
+
+class Checkpoint:
+    def __init__(self, crawl_id: str):
+        self.crawl_id = crawl_id
+        self.path = instance_path(_DIR, f"{crawl_id}.sqlite3")
+        self._lock_path = instance_path(_DIR, f"{crawl_id}.lock")
+        self._lock_fd = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def claim(self) -> bool:
+        """Mark the crawl as running here until release(); False if it runs elsewhere."""
+        if fcntl is None or self._lock_fd is not None:
+            return True
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def release(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)   # the flock goes with the descriptor (or the process)
+            self._lock_fd = None
+
+    def running(self) -> bool:
+        """Whether some process (this one included) is running the crawl now."""
+        if not self.claim():
+            return True
+        self.release()
+        return False
+
+    def save(self, state: dict, sets: dict, frontier):
+        """
+        state: JSON-able values by name (meta, progress, counters, results);
+        sets: FingerprintSet/BloomFilter by name; frontier: anything with snapshot().
+        """
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        if tmp.exists():
+            tmp.unlink()
+        db = sqlite3.connect(tmp)
+        try:
+            with db:
+                db.execute("CREATE TABLE state (key TEXT PRIMARY KEY, value TEXT)")
+                db.execute("CREATE TABLE sets (name TEXT PRIMARY KEY, data BLOB)")
+                db.execute("CREATE TABLE frontier (seq INTEGER PRIMARY KEY, url TEXT, depth INTEGER, score REAL)")
+                db.executemany("INSERT INTO state VALUES (?, ?)",
+                               [(k, json.dumps(v)) for k, v in {**state, "saved_at": time.time()}.items()])
+                db.executemany("INSERT INTO sets VALUES (?, ?)", [(k, s.to_bytes()) for k, s in sets.items()])
+                db.executemany("INSERT INTO frontier (url, depth, score) VALUES (?, ?, ?)", frontier.snapshot())
+        finally:
+            db.close()
+        os.replace(tmp, self.path)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+
+    def load(self) -> dict:
+        """The saved state values by name (see save())."""
+        db = self._connect()
+        try:
+            return {k: json.loads(v) for k, v in db.execute("SELECT key, value FROM state")}
+        finally:
+            db.close()
+
+    def set_bytes(self, name: str) -> bytes:
+        db = self._connect()
+        try:
+            return db.execute("SELECT data FROM sets WHERE name = ?", (name,)).fetchone()[0]
+        finally:
+            db.close()
+
+    def entries(self):
+        """(url, depth, score) frontier entries in pop order, read as they are consumed."""
+        db = self._connect()
+        try:
+            yield from db.execute("SELECT url, depth, score FROM frontier ORDER BY seq")
+        finally:
+            db.close()
+
+    def delete(self):
+        for p in (self.path, self.path.with_name(self.path.name + ".tmp"), self._lock_path):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+
+def list_checkpoints() -> list:
+    """[(crawl_id, state)] of crawls that can be resumed, newest first; drops expired ones."""
+    out = []
+    for p in instance_path(_DIR).glob("*.sqlite3"):
+        ckpt = Checkpoint(p.stem)
+        try:
+            if ckpt.running():
+                continue
+            if time.time() - p.stat().st_mtime > CHECKPOINT_MAX_AGE:
+                ckpt.delete()
+                continue
+            out.append((ckpt.crawl_id, ckpt.load()))
+        except (OSError, sqlite3.Error, ValueError):
+            continue   # half-written or unreadable: skip it
+    out.sort(key=lambda item: item[1].get("saved_at", 0), reverse=True)
+    return out
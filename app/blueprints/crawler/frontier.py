@@ -0,0 +1,330 @@
+# frontier.py
+"""
+Compact crawl state: the BFS frontier and the "seen" sets.
+
+The sets hold dedupe keys (canonical URLs); frontier entries are the URLs
+to fetch, as they were found, so a push can name its key separately.
+
+URLs are remembered as 64-bit fingerprints (blake2b of the canonical
+URL) in an open-addressing table of machine words - 12 to 24 bytes a
+URL instead of a str in a set (150+). A crawl that has discovered millions of
+links stays small; two URLs sharing a fingerprint is a ~1e-7 event at a
+million URLs, and costs one page that is never fetched.
+
+For "already queued", a BloomFilter can be used instead (CRAWL_SEEN_BLOOM=1):
+~1.8 bytes a URL at 0.1% false positives, each one a page skipped.
+
+The Frontier keeps up to CRAWL_FRONTIER_MEM entries in memory and
+spills the rest, in order, to a SQLite file under instance/crawl_frontier/
+that is deleted when the crawl ends. PriorityFrontier is the best-first
+variant: it pops the highest-scored entry and spills the lowest-scored.
+
+Both sets serialize to bytes (to_bytes / load_set) and a frontier lists
+its entries in pop order (snapshot) for crawl checkpoints (checkpoint.py).
+"""
+from array import array
+from collections import deque
+import hashlib
+import heapq
+import itertools
+import math
+import os
+import sqlite3
+
+from app.blueprints.main.fetch_utils import _env_int
+from app.blueprints.main.storage import instance_path
+
+FRONTIER_MEM = _env_int("CRAWL_FRONTIER_MEM", 20000)        # frontier entries kept in memory
+SEEN_BLOOM = (os.environ.get("CRAWL_SEEN_BLOOM") or "0") not in ("0", "false", "no")
+BLOOM_CAPACITY = _env_int("CRAWL_BLOOM_CAPACITY", 2_000_000)  # URLs before the error rate climbs
+_SPILL_BATCH = 1000
+
+
+def fingerprint(url: str) -> int:
+    """Non-zero 64-bit fingerprint of a (canonical) URL."""
+    fp = int.from_bytes(hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+    return fp or 1   # 0 marks an empty slot
+
+
+class FingerprintSet:
+    """Exact set of URLs, stored as fingerprints (linear probing in an array('Q'))."""
+    LOAD = 0.7
+
+    def __init__(self, capacity: int = 1024):
+        size = 1 << max(4, math.ceil(math.log2(capacity / self.LOAD)))
+        self._slots = array("Q", bytes(8 * size))
+        self._mask = size - 1
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def nbytes(self) -> int:
+        return self._slots.itemsize * len(self._slots)
+
+    def _find(self, fp: int) -> int:
+        slots, mask = self._slots, self._mask
+        i = fp & mask
+        while True:
+            v = slots[i]
+            if v == fp or v == 0:
+                return i
+            i = (i + 1) & mask
+
+    def __contains__(self, url: str) -> bool:
+        return self._slots[self._find(fingerprint(url))] != 0
+
+    def add(self, url: str) -> bool:
+        """Add a URL; False if it was already there."""
+        fp = fingerprint(url)
+        i = self._find(fp)
+        if self._slots[i]:
+            return False
+        self._slots[i] = fp
+        self._n += 1
+        if self._n > self.LOAD * len(self._slots):
+            self._grow()
+        return True
+
+    def to_bytes(self) -> bytes:
+        return b"F" + self._n.to_bytes(8, "little") + self._slots.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "FingerprintSet":
+        s = cls.__new__(cls)
+        s._n = int.from_bytes(data[1:9], "little")
+        s._slots = array("Q")
+        s._slots.frombytes(data[9:])
+        s._mask = len(s._slots) - 1
+        return s
+
+    def _grow(self):
+        old = self._slots
+        self._slots = array("Q", bytes(16 * len(old)))
+        self._mask = len(self._slots) - 1
+        for fp in old:
+            if fp:
+                self._slots[self._find(fp)] = fp
+
+
+class BloomFilter:
+    """Approximate set: no false negatives, `error_rate` false positives up to `capacity` URLs."""
+    def __init__(self, capacity: int = BLOOM_CAPACITY, error_rate: float = 0.001):
+        bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._bits = bytearray((bits + 7) // 8)
+        self._m = len(self._bits) * 8
+        self._k = max(1, round(bits / capacity * math.log(2)))
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    def to_bytes(self) -> bytes:
+        return b"B" + self._n.to_bytes(8, "little") + self._k.to_bytes(2, "little") + bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        b = cls.__new__(cls)
+        b._n = int.from_bytes(data[1:9], "little")
+        b._k = int.from_bytes(data[9:11], "little")
+        b._bits = bytearray(data[11:])
+        b._m = len(b._bits) * 8
+        return b
+
+    def _positions(self, url: str):
+        # double hashing (Kirsch-Mitzenmacher): k positions from one 64-bit fingerprint
+        fp = fingerprint(url)
+        h1, h2 = fp & 0xFFFFFFFF, (fp >> 32) | 1
+        return [(h1 + i * h2) % self._m for i in range(self._k)]
+
+    def __contains__(self, url: str) -> bool:
+        bits = self._bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(url))
+
+    def add(self, url: str) -> bool:
+        """Add a URL; False if it was (probably) already there."""
+        bits, new = self._bits, False
+        for p in self._positions(url):
+            byte, mask = p >> 3, 1 << (p & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        self._n += new
+        return new
+
+
+def load_set(data: bytes):
+    """A FingerprintSet or BloomFilter back from its to_bytes()."""
+    return (BloomFilter if data[:1] == b"B" else FingerprintSet).from_bytes(data)
+
+
+class Frontier:
+    """
+    FIFO of (url, depth), deduplicated on push. Past `mem_limit` entries, new
+    ones go to a SQLite spill file and come back in order once the in-memory
+    part has been consumed.
+    """
+    def __init__(self, name: str, mem_limit: int = FRONTIER_MEM, seen=None):
+        self.seen = seen if seen is not None else (BloomFilter() if SEEN_BLOOM else FingerprintSet())
+        self.mem_limit = max(1, mem_limit)
+        self._path = str(instance_path("crawl_frontier", f"{name}.sqlite3"))
+        self._mem = deque()
+        self._out = []        # spilled entries not written yet
+        self._on_disk = 0     # written and not read back
+        self._db = None
+
+    def __len__(self):
+        return len(self._mem) + len(self._out) + self._on_disk
+
+    @property
+    def spilled(self) -> int:
+        """Entries currently waiting on disk."""
+        return len(self._out) + self._on_disk
+
+    def push(self, url: str, depth: int, score: float = 0.0, key: str | None = None) -> bool:
+        """
+        Queue a URL unless it was queued before; False if it was. Entries are
+        deduplicated on `key` (default: the URL itself). FIFO: score is ignored.
+        """
+        if not self.seen.add(key or url):
+            return False
+        self._enqueue(url, depth, score)
+        return True
+
+    def _enqueue(self, url: str, depth: int, score: float):
+        if self.spilled or len(self._mem) >= self.mem_limit:
+            self._out.append((url, depth))   # behind everything already spilled: keeps BFS order
+            if len(self._out) >= _SPILL_BATCH:
+                self._flush()
+        else:
+            self._mem.append((url, depth))
+
+    def snapshot(self):
+        """(url, depth, score) of every queued entry, in pop order; nothing is removed."""
+        yield from ((url, depth, 0.0) for url, depth in self._mem)
+        if self._on_disk:
+            for url, depth in self._conn().execute("SELECT url, depth FROM q ORDER BY id"):
+                yield url, depth, 0.0
+        yield from ((url, depth, 0.0) for url, depth in self._out)
+
+    def restore(self, entries):
+        """Queue snapshot() entries as they are: `seen` is expected to hold them already."""
+        for url, depth, score in entries:
+            self._enqueue(url, depth, score)
+
+    def pop(self):
+        """(url, depth) of the oldest entry, or None."""
+        if not self._mem and self.spilled:
+            self._refill()
+        return self._mem.popleft() if self._mem else None
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self._path)
+            self._db.execute("DROP TABLE IF EXISTS q")
+            self._db.execute("CREATE TABLE q (id INTEGER PRIMARY KEY, url TEXT, depth INTEGER)")
+        return self._db
+
+    def _flush(self):
+        if self._out:
+            with self._conn() as db:
+                db.executemany("INSERT INTO q (url, depth) VALUES (?, ?)", self._out)
+            self._on_disk += len(self._out)
+            self._out = []
+
+    def _refill(self):
+        self._flush()
+        db = self._conn()
+        rows = db.execute("SELECT id, url, depth FROM q ORDER BY id LIMIT ?",
+                          (min(self.mem_limit, self._on_disk),)).fetchall()
+        if rows:
+            with db:
+                db.execute("DELETE FROM q WHERE id <= ?", (rows[-1][0],))
+            self._on_disk -= len(rows)
+            self._mem.extend((url, depth) for _, url, depth in rows)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+
+class PriorityFrontier(Frontier):
+    """
+    Best-first frontier: pop() returns the highest-scored entry (FIFO among
+    equal scores). Past `mem_limit` entries, the lower-scored half goes to
+    disk; it comes back whenever it holds the best entry left.
+    """
+    def __init__(self, name: str, mem_limit: int = FRONTIER_MEM, seen=None):
+        super().__init__(name, mem_limit, seen)
+        self._heap = []                 # (-score, seq, url, depth)
+        self._seq = itertools.count()
+        self._disk_best = None          # (-score, seq) of the best entry on disk, None if empty
+
+    def __len__(self):
+        return len(self._heap) + self._on_disk
+
+    @property
+    def spilled(self) -> int:
+        return self._on_disk
+
+    def _enqueue(self, url: str, depth: int, score: float):
+        heapq.heappush(self._heap, (-score, next(self._seq), url, depth))
+        if len(self._heap) > self.mem_limit:
+            self._spill()
+
+    def snapshot(self):
+        # heap and disk merged best first, so restore() keeps the order among equal scores
+        mem = ((-neg, seq, url, depth) for neg, seq, url, depth in sorted(self._heap))
+        disk = self._conn().execute("SELECT score, seq, url, depth FROM pq ORDER BY score DESC, seq") \
+            if self._on_disk else ()
+        for score, _, url, depth in heapq.merge(mem, disk, key=lambda e: (-e[0], e[1])):
+            yield url, depth, score
+
+    def pop(self):
+        if self._disk_best is not None and (not self._heap or self._heap[0][:2] > self._disk_best):
+            self._refill()
+        if not self._heap:
+            return None
+        _, _, url, depth = heapq.heappop(self._heap)
+        return url, depth
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self._path)
+            self._db.execute("DROP TABLE IF EXISTS pq")
+            self._db.execute("CREATE TABLE pq (seq INTEGER PRIMARY KEY, score REAL, url TEXT, depth INTEGER)")
+            self._db.execute("CREATE INDEX pq_best ON pq (score DESC, seq)")
+        return self._db
+
+    def _spill(self):
+        entries = sorted(self._heap)   # best first
+        half = max(1, self.mem_limit // 2)
+        self._heap, out = entries[:half], entries[half:]   # a sorted list is a valid heap
+        with self._conn() as db:
+            db.executemany("INSERT INTO pq VALUES (?, ?, ?, ?)",
+                           [(seq, -neg, url, depth) for neg, seq, url, depth in out])
+        self._on_disk += len(out)
+        best = out[0][:2]
+        self._disk_best = best if self._disk_best is None else min(self._disk_best, best)
+
+    def _refill(self):
+        db = self._conn()
+        rows = db.execute("SELECT seq, score, url, depth FROM pq ORDER BY score DESC, seq LIMIT ?",
+                          (max(1, self.mem_limit // 2),)).fetchall()
+        with db:
+            db.executemany("DELETE FROM pq WHERE seq = ?", [(r[0],) for r in rows])
+        self._on_disk -= len(rows)
+        for seq, score, url, depth in rows:
+            heapq.heappush(self._heap, (-score, seq, url, depth))
+        row = db.execute("SELECT score, seq FROM pq ORDER BY score DESC, seq LIMIT 1").fetchone()
+        self._disk_best = (-row[0], row[1]) if row else None
@@ -2,9 +2,12 @@ from flask import render_template, request, redirect, url_for, flash, session, j
 from urllib.parse import urlparse
 import os, threading, io, time, math
 from . import bp
-from .tasks import CRAWLS, run_crawl_task
-from app.blueprints.main.fetch_utils import BACKENDS  # for UI select, reuse
+from .tasks import CRAWLS, run_crawl_task, resume_crawl_task
+from .checkpoint import Checkpoint, list_checkpoints
+from app.blueprints.main.fetch_utils import BACKENDS, _env_int  # for UI select, reuse
 from app.blueprints.main.parser_utils import render_results_html  # reuse your exporter HTML
+from app.blueprints.main.query import compile_query, QuerySyntaxError
+from app.blueprints.main.canonical_url import canonical_url
 
 from app.models import Crawl
 import re, html
@@ -16,6 +19,8 @@ import json
 TAG_RE = re.compile(r"<[^>]+>")
 
 APP_TITLE = "Flask Site Crawler"
+# the frontier spills to disk (frontier.py), so this bounds crawl time, not memory
+MAX_PAGES_CAP = _env_int("CRAWL_MAX_PAGES_CAP", 20000)
 
 def _dedupe_by_url(items):
     seen = set()
@@ -23,8 +28,9 @@ def _dedupe_by_url(items):
     for it in items:
         # Reuse your coercer to robustly extract the URL across dict/tuple/str
         _, url = _coerce_item(it)
-        if url and url not in seen:
-            seen.add(url)
+        key = canonical_url(url) or url   # the same page under another spelling is a duplicate
+        if key and key not in seen:
+            seen.add(key)
             out.append(it)
     return out
 
@@ -53,10 +59,41 @@ def _clean(s: str) -> str:
     # collapse whitespace
     return " ".join(s.split())
 
+def _owns_checkpoint(crawl_id, saved) -> bool:
+    # the user who started it, or (signed out) the browser session that did
+    owner = (saved.get("meta") or {}).get("user_id")
+    if owner is not None:
+        return current_user.is_authenticated and owner == current_user.id
+    return crawl_id == session.get("crawl_id")
+
 @bp.get("/")
 def crawler_form():
-    session.pop("crawl_id", None)
-    return render_template("crawler_index.html", title=APP_TITLE, backends=BACKENDS)
+    # crawls cut off by a restart, before the session forgets which one was ours
+    interrupted = [(cid, saved) for cid, saved in list_checkpoints()
+                   if cid not in CRAWLS and _owns_checkpoint(cid, saved)]
+    if session.get("crawl_id") not in {cid for cid, _ in interrupted}:
+        session.pop("crawl_id", None)
+    return render_template("crawler_index.html", title=APP_TITLE, backends=BACKENDS,
+                           interrupted=interrupted)
+
+@bp.post("/resume/<crawl_id>")
+def crawler_resume(crawl_id):
+    """Continue an interrupted crawl from its last checkpoint (checkpoint.py)."""
+    ckpt = Checkpoint(crawl_id)
+    data = CRAWLS.get(crawl_id)
+    if data and data["progress"].get("status") in ("queued", "running"):
+        session["crawl_id"] = crawl_id   # already going in this worker
+        return redirect(url_for("crawler.crawler_results", page=1))
+    try:
+        owned = ckpt.exists() and _owns_checkpoint(crawl_id, ckpt.load())
+    except Exception:
+        owned = False
+    if not owned or not resume_crawl_task(crawl_id):
+        flash("That crawl can't be resumed: it has no checkpoint or is still running elsewhere.", "error")
+        return redirect(url_for("crawler.crawler_form"))
+    session["crawl_id"] = crawl_id
+    session.pop("crawler_saved", None)
+    return redirect(url_for("crawler.crawler_results", page=1))
 
 @bp.post("/")
 def crawler_start():
@@ -69,6 +106,7 @@ def crawler_start():
     match_text = request.form.get("match_text") == "on"
     match_url = request.form.get("match_url") == "on"
     same_domain = request.form.get("same_domain") != "off"  # default True
+    use_sitemaps = request.form.get("use_sitemaps") == "on"
     backend = (request.form.get("backend") or os.environ.get("FETCH_BACKEND","auto")).strip().lower()
     if backend not in BACKENDS:
         backend = "auto"
@@ -77,7 +115,7 @@ def crawler_start():
         max_pages = int(request.form.get("max_pages") or 500)
     except ValueError:
         max_pages = 500
-    max_pages = max(1, min(max_pages, 5000))  # hard safety cap
+    max_pages = max(1, min(max_pages, MAX_PAGES_CAP))  # hard safety cap
 
     try:
         pause_ms = int(request.form.get("pause_ms") or 300)
@@ -85,6 +123,16 @@ def crawler_start():
         pause_ms = 300
     pause_seconds = max(0, pause_ms) / 1000.0
 
+    try:
+        concurrency = int(request.form.get("concurrency") or 4)
+    except ValueError:
+        concurrency = 4
+    concurrency = max(1, min(concurrency, 16))  # requests in flight at once
+
+    strategy = request.form.get("strategy") or "bfs"
+    if strategy not in ("bfs", "best_first"):
+        strategy = "bfs"
+
     parsed = urlparse(url)
     if not parsed.scheme or not parsed.netloc:
         flash("Please provide a full URL including https://", "error")
@@ -92,6 +140,11 @@ def crawler_start():
     if not keyword:
         flash("Keyword cannot be empty.", "error")
         return redirect(url_for("crawler.crawler_form"))
+    try:
+        compile_query(sub_keyword)
+    except QuerySyntaxError as e:
+        flash(f"Invalid refine query: {e}", "error")
+        return redirect(url_for("crawler.crawler_form"))
 
     crawl_id = run_crawl_task(
         start_url=url,
@@ -103,6 +156,10 @@ def crawler_start():
         backend=backend,
         pause_seconds=pause_seconds,
         max_pages=max_pages,
+        concurrency=concurrency,
+        strategy=strategy,
+        use_sitemaps=use_sitemaps,
+        user_id=current_user.id if current_user.is_authenticated else None,
     )
     session["crawl_id"] = crawl_id
     return redirect(url_for("crawler.crawler_results", page=1))
@@ -112,6 +169,9 @@ def crawler_results():
     crawl_id = session.get("crawl_id")
     data = CRAWLS.get(crawl_id) if crawl_id else None
     if not data:
+        if crawl_id and Checkpoint(crawl_id).exists():
+            flash("Your crawl was interrupted by a restart. Resume it below.", "warning")
+            return redirect(url_for("crawler.crawler_form"))
         flash("No crawl in progress. Start a new one.", "error")
         return redirect(url_for("crawler.crawler_form"))
 
@@ -195,6 +255,10 @@ def crawler_results():
 def progress(crawl_id):
     data = CRAWLS.get(crawl_id)
     if not data:
+        if Checkpoint(crawl_id).exists():
+            # the worker running it is gone; the results page offers to resume
+            return jsonify({"status": "interrupted",
+                            "resume_url": url_for("crawler.crawler_resume", crawl_id=crawl_id)})
         return jsonify({"status":"missing"}), 404
     return jsonify(data["progress"])
 
@@ -0,0 +1,68 @@
+# scoring.py
+"""
+Link scores for the best-first crawl order (frontier.PriorityFrontier).
+
+A link is worth fetching early when it names what we look for (query
+terms in its text or URL), when it sits on a page that was dense with
+matches, and when it pages through a listing that is producing matches.
+Every level of depth costs a little, so among equals the crawl stays
+close to the start page, as BFS would.
+"""
+import re
+
+from app.blueprints.main.parser_utils import _NEXT_TEXTS
+from app.blueprints.main.term_matcher import TermMatcher
+
+TEXT_HIT = 3.0       # per query term in the anchor text
+URL_HIT = 2.0        # per query term in the URL
+DENSITY = 3.0        # a parent page whose links all matched (saturates at 25%)
+PAGING = 0.5         # pagination link, plus PAGING_DENSITY * density
+PAGING_DENSITY = 3.0
+DEPTH = 0.25         # per level below the start page
+
+# listing pages after the first: ?page=3, /page/3, page-3, Discuz forum-2-3.html / thread-1-3-1.html
+_PAGE_URL_RE = re.compile(
+    r"[?&](?:page|start|pn)=\d+|/page[-/]?\d+/?$|forum-\d+-(?:[2-9]|\d\d+)\.html|thread-\d+-(?:[2-9]|\d\d+)-\d+\.html",
+    re.I,
+)
+
+
+def looks_like_pagination(anchor) -> bool:
+    """A link to another page of the same listing: numbered/"next" text, rel/class, or URL shape."""
+    text = anchor.text.strip()
+    if text.isdigit() or text in _NEXT_TEXTS:
+        return True
+    attrs = anchor.attrs
+    if "next" in (attrs.get("rel") or "").lower():
+        return True
+    cls = (attrs.get("class") or "").lower()
+    if "nxt" in cls or "next" in cls or "page" in cls:
+        return True
+    return bool(_PAGE_URL_RE.search(anchor.url))
+
+
+class LinkScorer:
+    def __init__(self, matcher: TermMatcher):
+        self.matcher = matcher
+
+    @staticmethod
+    def density(n_matches: int, n_links: int) -> float:
+        """Share of a page's links that matched."""
+        return n_matches / n_links if n_links else 0.0
+
+    def score(self, anchor, depth: int, density: float) -> float:
+        """Higher is fetched sooner. `density` is the parent page's (see density())."""
+        s = DENSITY * min(1.0, 4 * density) - DEPTH * depth
+        if self.matcher:
+            s += TEXT_HIT * len(self.matcher.found(anchor.text.lower()))
+            s += URL_HIT * len(self.matcher.found(anchor.url.lower()))
+        if looks_like_pagination(anchor):
+            s += PAGING + PAGING_DENSITY * density
+        return s
+
+    def score_url(self, url: str, depth: int) -> float:
+        """Score of a URL seen without a link or parent page (a sitemap entry)."""
+        s = -DEPTH * depth
+        if self.matcher:
+            s += URL_HIT * len(self.matcher.found(url.lower()))
+        return s
@@ -1,10 +1,20 @@
-import threading, time, uuid, collections, re
-from urllib.parse import urlparse, urljoin, urldefrag
-from urllib import robotparser
+import threading, time, uuid, re, atexit, asyncio
+from collections import deque
+from urllib.parse import urlparse, urldefrag
 
-from app.blueprints.main.fetch_utils import smart_fetch
-from app.blueprints.main.parser_utils import extract_links
-from app.blueprints.main.parser_utils import subfilter_links  # your improved comma/plus logic
+from app.blueprints.main.async_fetch import AsyncFetchEngine
+from app.blueprints.main.rate_limit import RATE_LIMITER, rate_from_pause
+from app.blueprints.main.retry_policy import CIRCUIT_BREAKER
+from app.blueprints.main.fetch_utils import SkippedResponse, _env_int, record_fetch, timing_summary
+from app.blueprints.main.parser_utils import decode_html
+from app.blueprints.main.parsed_page import ParsedPage
+from app.blueprints.main.query import link_predicate
+from app.blueprints.main.canonical_url import canonical_url
+from app.blueprints.main.term_matcher import compile_terms
+from app.blueprints.main.robots import ROBOTS, RobotsRules, iter_sitemap_urls, origin_of
+from .frontier import Frontier, PriorityFrontier, FingerprintSet, load_set
+from .checkpoint import Checkpoint, CHECKPOINT_SECONDS
+from .scoring import LinkScorer
 
 from app.models import Crawl
 from app.extensions import db
@@ -12,20 +22,55 @@ import json
 import traceback
 
 CRAWLS = {}  # crawl_id -> {"results": [(text,url)...], "progress": {...}, "meta": {...}}
+SITEMAP_SEEDS = _env_int("CRAWL_SITEMAP_SEEDS", 100_000)  # sitemap URLs queued per crawl, at most
+SHUTDOWN_WAIT = _env_int("CRAWL_SHUTDOWN_WAIT", 20)  # seconds an exiting worker gives crawls to checkpoint
 
-def _normalize_url(base, href):
-    if not href:
-        return None
-    # absolute + strip fragment
-    abs_url = urljoin(base, href)
-    abs_url, _frag = urldefrag(abs_url)
-    return abs_url
+_RUNNING = {}                   # crawl_id -> worker thread, in this process
+_SHUTDOWN = threading.Event()   # the process is exiting: crawls stop and checkpoint
+
+def _checkpoint_on_exit():
+    # a deploy stops the web worker (SIGTERM -> clean exit -> atexit): crawl threads are
+    # daemons and would die mid-page; stop them instead, so each writes a final checkpoint
+    _SHUTDOWN.set()
+    deadline = time.monotonic() + SHUTDOWN_WAIT
+    for t in list(_RUNNING.values()):
+        t.join(max(0.0, deadline - time.monotonic()))
+
+atexit.register(_checkpoint_on_exit)
+
+# Links that are obviously not pages: never worth a request
+_BINARY_EXTS = {
+    ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".odt", ".rtf",
+    ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".svg", ".ico", ".tif", ".tiff",
+    ".zip", ".rar", ".7z", ".gz", ".tgz", ".bz2", ".xz", ".tar", ".iso", ".dmg",
+    ".exe", ".msi", ".apk", ".bin", ".torrent",
+    ".mp3", ".wav", ".flac", ".ogg", ".m4a", ".mp4", ".mkv", ".avi", ".mov", ".wmv", ".flv", ".webm",
+    ".css", ".js", ".json", ".woff", ".woff2", ".ttf", ".eot",
+}
+# Forum attachment/download endpoints (Discuz!, phpBB, vBulletin, XenForo)
+_ATTACHMENT_RE = re.compile(
+    r"(mod=attachment|/attachment\.php|/download/file\.php|/attachments/|[?&]aid=|/forum\.php\?mod=image)",
+    re.I,
+)
+
+def _looks_binary(url):
+    path = urlparse(url).path.lower()
+    dot = path.rfind(".")
+    if dot != -1 and path[dot:] in _BINARY_EXTS:
+        return True
+    return bool(_ATTACHMENT_RE.search(url))
 
 def _same_host(u1, u2):
     return urlparse(u1).netloc.lower() == urlparse(u2).netloc.lower()
 
+# _crawl_worker arguments kept in a crawl's meta, so a checkpoint can start it again
+_WORKER_ARGS = ("start_url", "keyword", "sub_keyword", "match_text", "match_url", "same_domain",
+                "backend", "pause_seconds", "max_pages", "max_depth", "concurrency", "strategy",
+                "use_sitemaps")
+
 def run_crawl_task(start_url, keyword, sub_keyword="", match_text=True, match_url=True,
-                   same_domain=True, backend="auto", pause_seconds=0.30, max_pages=500, max_depth=4):
+                   same_domain=True, backend="auto", pause_seconds=0.30, max_pages=500, max_depth=4,
+                   concurrency=4, strategy="bfs", use_sitemaps=False, user_id=None):
     crawl_id = str(uuid.uuid4())
     CRAWLS[crawl_id] = {
         "results": [],
@@ -37,73 +82,256 @@ def run_crawl_task(start_url, keyword, sub_keyword="", match_text=True, match_ur
             "match_text": match_text,
             "match_url": match_url,
             "same_domain": same_domain,
-            "max_pages": max_pages
+            "backend": backend,
+            "pause_seconds": pause_seconds,
+            "max_pages": max_pages,
+            "max_depth": max_depth,
+            "concurrency": concurrency,
+            "strategy": strategy,
+            "use_sitemaps": use_sitemaps,
+            "user_id": user_id,
         }
     }
+    _start_worker(crawl_id)
+    return crawl_id
 
+def resume_crawl_task(crawl_id):
+    """Carry on an interrupted crawl from its last checkpoint; False if there is none to resume."""
+    ckpt = Checkpoint(crawl_id)
+    if not ckpt.exists() or ckpt.running():
+        return False
+    saved = ckpt.load()
+    CRAWLS[crawl_id] = {
+        "results": [tuple(r) for r in saved["results"]],
+        "progress": {**saved["progress"], "status": "queued"},
+        "meta": saved["meta"],
+    }
+    _start_worker(crawl_id, resume=True)
+    return True
+
+def _start_worker(crawl_id, resume=False):
+    meta = CRAWLS[crawl_id]["meta"]
     t = threading.Thread(target=_crawl_worker, kwargs=dict(
-        crawl_id=crawl_id, start_url=start_url, keyword=keyword, sub_keyword=sub_keyword,
-        match_text=match_text, match_url=match_url, same_domain=same_domain,
-        backend=backend, pause_seconds=pause_seconds, max_pages=max_pages, max_depth=max_depth
+        crawl_id=crawl_id, resume=resume, **{k: meta[k] for k in _WORKER_ARGS}
     ), daemon=True)
+    _RUNNING[crawl_id] = t
     t.start()
-    return crawl_id
 
 def _crawl_worker(crawl_id, start_url, keyword, sub_keyword, match_text, match_url,
-                  same_domain, backend, pause_seconds, max_pages, max_depth):
+                  same_domain, backend, pause_seconds, max_pages, max_depth, concurrency=4,
+                  strategy="bfs", use_sitemaps=False, resume=False):
     state = CRAWLS[crawl_id]
     prog = state["progress"]
     results = state["results"]
+    frontier = None
+    started = False    # state complete enough to checkpoint
+    finished = False   # ran to the end: no checkpoint to keep
+    ckpt = Checkpoint(crawl_id)
 
     try:
-        # robots.txt
-        rp = robotparser.RobotFileParser()
-        try:
-            base = f"{urlparse(start_url).scheme}://{urlparse(start_url).netloc}"
-            rp.set_url(urljoin(base, "/robots.txt"))
-            rp.read()
-        except Exception:
-            rp = None  # best-effort only
+        if not ckpt.claim():
+            raise RuntimeError("this crawl is already running in another worker")
 
-        visited = set()
-        q = collections.deque([(start_url, 0)])
-        domain_root = start_url
+        # robots.txt, per host, from the shared cache (robots.py); the first look at a
+        # host also sets its pacing: pause_seconds is the target, Crawl-delay the floor
+        paced = set()
 
+        def pace(url, rules):
+            if rules.origin not in paced:
+                paced.add(rules.origin)
+                RATE_LIMITER.configure(url, target_rate=rate_from_pause(pause_seconds),
+                                       crawl_delay=rules.delay())
+
+        def robots_for(url):
+            # blocking: only before the engine starts
+            rules = ROBOTS.get(url, backend)
+            pace(url, rules)
+            return rules
+
+        # URLs are deduplicated on their canonical form (canonical_url.py): one entry per
+        # page, however many session ids / parameter orders / slashes it turns up with; the
+        # URL fetched is the one found, since the server may not answer to the canonical
+        # spelling (a trailing slash it redirects back to). Same-host checks compare keys
+        # (":443", a trailing-dot host and upper case would match nothing otherwise)
+        start = canonical_url(start_url) or start_url
+        domain_root = start
+        start_rules = robots_for(start)
+        # keyword AND refine query, compiled once (query.py)
+        predicate = link_predicate(keyword or "", sub_keyword or "", match_text, match_url)
+        match = predicate.match
+        if strategy == "best_first":
+            # highest-scored link first (scoring.py): query terms in the link, match-dense parents
+            frontier_cls = PriorityFrontier
+            scorer = LinkScorer(compile_terms(predicate.terms))
+        else:
+            frontier_cls = Frontier   # BFS order
+            scorer = None
+        stats = {"dispatched": 0, "fetched": 0, "errors": 0, "last_error": None}
+        fetch_stats = {}   # bytes, redirects and phase timings (see fetch_utils.record_fetch)
+        in_flight = {}     # url -> depth: handed to the engine, result not back yet
+        requeued = deque() # in flight when the checkpoint we resume from was taken
+        # inside the engine, robots.txt is never downloaded on the event loop: a host whose
+        # rules aren't cached (new, or past their TTL) has them fetched on the loop's thread
+        # pool while its URLs wait in `parked`; they move to `held` when the rules arrive
+        parked = {}        # origin -> [(url, depth), ...]
+        held = deque()     # (url, depth, rules or None): taken off the frontier, not dispatched yet
+
+        last_checkpoint = time.monotonic()
+
+        def save_checkpoint():
+            # between engine callbacks nothing else touches this state; pages in flight
+            # are written down to be fetched again and are not counted as dispatched
+            nonlocal last_checkpoint
+            ckpt.save({"meta": state["meta"], "progress": prog, "results": results,
+                       "stats": {"dispatched": stats["dispatched"] - len(in_flight),
+                                 "fetched": stats["fetched"], "errors": stats["errors"]},
+                       "requeue": [*in_flight.items(), *requeued],
+                       "held": [*((url, depth) for url, depth, _rules in held),
+                                *(item for items in parked.values() for item in items)]},
+                      {"visited": visited, "queued": frontier.seen,
+                       "rewritten": rewritten, "skipped": skipped_urls},
+                      frontier)
+            last_checkpoint = time.monotonic()
+
+        if resume:
+            # everything as it was at the last checkpoint (checkpoint.py)
+            saved = ckpt.load()
+            visited = load_set(ckpt.set_bytes("visited"))
+            rewritten = load_set(ckpt.set_bytes("rewritten"))
+            skipped_urls = load_set(ckpt.set_bytes("skipped"))
+            frontier = frontier_cls(crawl_id, seen=load_set(ckpt.set_bytes("queued")))
+            frontier.restore(ckpt.entries())
+            stats.update(saved["stats"])
+            requeued.extend(tuple(item) for item in saved["requeue"])
+            held.extend((url, depth, None) for url, depth in saved.get("held", ()))
+            prog["resumed"] = prog.get("resumed", 0) + 1
+        else:
+            visited = FingerprintSet()   # fetched, under any name (see frontier.py)
+            rewritten = FingerprintSet()   # raw links seen, as found (for the "collapsed" count)
+            skipped_urls = FingerprintSet()
+            frontier = frontier_cls(crawl_id)
+            frontier.push(urldefrag(start_url.strip())[0] or start, 0, key=start)
+            prog.update(seeded=0, skipped=0, bytes_saved=0, collapsed=0)
+        if use_sitemaps and not resume and start_rules.sitemaps:
+            # pages listed in the site's sitemaps are queued at depth 1, right behind the
+            # start page, instead of waiting to be found through the listing pages
+            prog["message"] = "Reading sitemaps"
+            for loc in iter_sitemap_urls(start_rules.sitemaps, backend, stats=prog):
+                nxt = canonical_url(loc)
+                if not nxt or _looks_binary(nxt) or (same_domain and not _same_host(domain_root, nxt)):
+                    continue
+                if frontier.push(loc, 1, scorer.score_url(nxt, 1) if scorer else 0.0, key=nxt):
+                    prog["seeded"] += 1
+                    prog["queued"] = len(frontier)
+                    if prog["seeded"] >= SITEMAP_SEEDS:
+                        break
+            prog.pop("message", None)
+
+        save_checkpoint()
+        started = True
         prog["status"] = "running"
 
-        while q and len(visited) < max_pages:
-            url, depth = q.popleft()
-            if url in visited:
-                continue
-            if same_domain and not _same_host(domain_root, url):
-                continue
-            if rp and not rp.can_fetch("*", url):
-                continue
+        def dispatch(url, depth):
+            in_flight[url] = depth
+            stats["dispatched"] += 1
+            prog["visited"] = stats["dispatched"]
+            prog["queued"] = len(frontier)
+            return url, depth
 
-            visited.add(url)
-            prog["visited"] = len(visited)
-            prog["queued"] = len(q)
+        def unpark(origin, fut):
+            # on the loop, as the download finishes
+            try:
+                rules = fut.result()
+            except Exception as e:   # unreadable robots.txt: allow everything, as ROBOTS does
+                rules = RobotsRules(origin, status=None, error=str(e))
+            held.extend((url, depth, rules) for url, depth in parked.pop(origin, ()))
 
-            # fetch HTML (smart_fetch already handles headers/timeouts)
-            html = smart_fetch(url, referer=None, cookie_str=None, backend=backend)
-            final_url = url            # we don't get a redirect URL back; use the requested URL
-            content_type = "text/html" # fetch_utils returns text only; treat as HTML
+        def park(url, depth):
+            # the future to wait on when this URL starts its host's robots.txt download
+            origin = origin_of(url)
+            if origin in parked:
+                parked[origin].append((url, depth))
+                return None
+            parked[origin] = [(url, depth)]
+            fut = asyncio.get_running_loop().run_in_executor(None, ROBOTS.get, url, backend)
+            fut.add_done_callback(lambda f: unpark(origin, f))
+            return fut
 
-            if not html:
-                continue
+        def next_item():
+            # the next fetchable URL off the BFS frontier (None = nothing ready), or a
+            # robots.txt download for the engine to wait on
+            if requeued and stats["dispatched"] < max_pages:
+                return dispatch(*requeued.popleft())   # already in visited
+            while stats["dispatched"] < max_pages:
+                if held:
+                    url, depth, rules = held.popleft()
+                else:
+                    item = frontier.pop()
+                    if item is None:
+                        break
+                    url, depth = item
+                    rules = None
+                key = canonical_url(url) or url
+                if key in visited:
+                    continue
+                if same_domain and not _same_host(domain_root, key):
+                    continue
+                rules = rules or ROBOTS.cached(url)
+                if rules is None:
+                    fut = park(url, depth)
+                    if fut is not None:
+                        return fut
+                    continue
+                pace(url, rules)
+                if not rules.can_fetch(url):
+                    continue
+                visited.add(key)
+                return dispatch(url, depth)
+            return None
+
+        def on_result(item, resp, err):
+            url, depth = item
+            if time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+                save_checkpoint()   # before this result is applied: the page is still in flight
+            in_flight.pop(url, None)
+            if isinstance(err, SkippedResponse):
+                # non-HTML or oversized: aborted after the headers, not an error
+                stats["fetched"] += 1
+                prog["skipped"] += 1
+                prog["bytes_saved"] += err.bytes_saved
+            elif err is not None:
+                stats["errors"] += 1
+                stats["last_error"] = err
+                prog["errors"] = stats["errors"]
+            else:
+                stats["fetched"] += 1
+            # everything handed to the engine but not yet reported back
+            prog["in_flight"] = stats["dispatched"] - stats["fetched"] - stats["errors"]
+            if err is not None:
+                return
+            record_fetch(fetch_stats, resp)
+            prog.update(timing_summary(fetch_stats))
+
+            # a redirect target is the same page under another name: mark it (and every hop)
+            # visited, and skip it if it was already fetched or is in flight under that name
+            final_url = resp.url or url
+            own = canonical_url(url) or url
+            for seen in (*resp.redirects, final_url):
+                key = canonical_url(seen) or seen
+                if key != own:
+                    if seen == final_url and key in visited:
+                        return
+                    visited.add(key)
+            content_type = resp.headers.get("Content-Type", "text/html")
+
+            if not resp.content:
+                return
+            page = ParsedPage(decode_html(resp.content, resp.encoding), final_url)
 
             # get links on this page
-            pairs = extract_links(html, base_url=final_url or url)  # -> [(text, href), ...]
-            # keyword filter
-            kw = (keyword or "").strip().lower()
-            if kw:
-                pairs = [(t, u) for (t, u) in pairs if
-                         ((match_text and t and kw in (t or "").lower()) or
-                          (match_url and u and kw in (u or "").lower()))]
-
-            # sub-filter (supports comma=OR, plus=AND as per your function)
-            pairs = subfilter_links(pairs, sub_keyword,
-                                    match_text=match_text, match_url=match_url)
+            pairs = page.links  # -> [(text, href), ...]
+            # keyword + refine query
+            pairs = [(t, u) for (t, u) in pairs if u and match(t, u)]
 
             # add matches
             if pairs:
@@ -112,20 +340,48 @@ def _crawl_worker(crawl_id, start_url, keyword, sub_keyword, match_text, match_u
 
             # enqueue discovered links (BFS)
             if depth < max_depth:
-                for _t, href in extract_links(html, base_url=final_url or url):
-                    nxt = _normalize_url(final_url or url, href)
+                density = scorer.density(len(pairs), len(page.anchors)) if scorer else 0.0
+                for a in page.anchors:
+                    nxt = canonical_url(a.url)
                     if not nxt:
                         continue
                     if same_domain and not _same_host(domain_root, nxt):
                         continue
-                    if nxt not in visited:
-                        q.append((nxt, depth + 1))
+                    if _looks_binary(nxt):
+                        if skipped_urls.add(nxt):
+                            prog["skipped"] += 1
+                        continue
+                    score = scorer.score(a, depth + 1, density) if scorer else 0.0
+                    raw = urldefrag(a.url)[0]
+                    known = nxt in visited or not frontier.push(raw, depth + 1, score, key=nxt)
+                    # a raw link seen for the first time whose page is already known: a
+                    # duplicate only canonicalization caught
+                    if rewritten.add(raw) and known:
+                        prog["collapsed"] += 1
+
+            prog["current"] = stats["dispatched"]
+            prog["queued"] = len(frontier)
+            prog["frontier_on_disk"] = frontier.spilled
 
-            prog["current"] = len(visited)
-            # politeness
-            time.sleep(pause_seconds)
+        # N requests in flight; pacing comes from RATE_LIMITER
+        engine = AsyncFetchEngine(backend=backend, concurrency=concurrency, per_host=concurrency)
+        # a dead start host trips the breaker, and an exiting worker stops every crawl:
+        # stop dispatching, let the requests in flight finish
+        engine.run(next_item, on_result,
+                   should_stop=lambda: CIRCUIT_BREAKER.is_open(domain_root) or _SHUTDOWN.is_set())
 
-        prog["status"] = "done"
+        prog["current"] = stats["dispatched"]
+        prog["in_flight"] = 0
+        if CIRCUIT_BREAKER.is_open(domain_root):
+            prog["message"] = "Stopped early: the site keeps failing"
+        if stats["fetched"] == 0 and stats["last_error"] is not None:
+            raise stats["last_error"]
+        if _SHUTDOWN.is_set():
+            prog["status"] = "interrupted"   # the worker is exiting; resume from the checkpoint
+        else:
+            # a crawl cut short by a failing site keeps its checkpoint, to be resumed later
+            finished = not CIRCUIT_BREAKER.is_open(domain_root)
+            prog["status"] = "done"
 
     except Exception as e:
         import traceback
@@ -135,6 +391,17 @@ def _crawl_worker(crawl_id, start_url, keyword, sub_keyword, match_text, match_u
         traceback.print_exc()
     
     finally:
+        if frontier is not None:
+            try:
+                if finished:
+                    ckpt.delete()
+                elif started:
+                    save_checkpoint()   # resumable from here
+            except Exception:
+                traceback.print_exc()
+            frontier.close()   # drops the spill file
+        ckpt.release()
+        _RUNNING.pop(crawl_id, None)
         # ✅ Update DB record when crawl finishes <- new!!!!!
         try:
             crawl = Crawl.query.get(crawl_id)
@@ -0,0 +1,168 @@
+# anchor_stream.py
+"""
+Event-driven anchor extraction that never builds a DOM.
+
+lxml's HTML parser is driven with a parser "target": instead of building a
+tree it calls start()/end()/data() on us as it reads, and we keep only what
+link scanning needs - each <a href> with its text and attributes, and the
+<title>. Memory grows with the number of anchors, not the size of the page;
+visible text is only collected when asked for, and then each anchor also
+gets its position in that text (Anchor.span), so callers can quote the
+text around a link.
+
+Text rules follow bs4's get_text(strip=True): each text node is stripped and
+the pieces are joined, and strings under script/style/template/rt/rp are
+left out.
+"""
+from collections import deque
+from typing import NamedTuple
+from urllib.parse import urljoin, urlsplit, SplitResult
+
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover - lxml is in requirements.txt
+    etree = None
+
+STREAM_CHUNK = 64 * 1024
+
+# strings bs4's get_text() leaves out of an element's text
+_NON_TEXT = {"script", "style", "template", "rt", "rp"}
+# text under these tags is never rendered
+_INVISIBLE = {"script", "style", "noscript", "template", "head", "title"}
+
+
+class Anchor(NamedTuple):
+    text: str            # anchor text, each string stripped and joined (bs4 get_text(strip=True))
+    href: str            # href as written
+    url: str             # absolute URL (resolved against the page URL)
+    parts: SplitResult   # urlsplit(url), shared between anchors with the same href
+    attrs: dict          # attributes as strings (class="a b" stays one string)
+    span: tuple | None = None   # (start, end) of the anchor in the page's visible text, if collected
+
+
+class AnchorCollector:
+    """lxml parser target; anchors queue up in document order, see finished()."""
+
+    def __init__(self, want_text: bool = False):
+        self.want_text = want_text
+        self.queue = deque()     # [href, attrs, text pieces, closed, start, end] in start-tag order
+        self.title = None
+        self.text_parts = []     # visible text, whitespace-collapsed pieces, only if want_text
+        self.text_len = 0        # len(" ".join(text_parts))
+        self._open = []          # queue entries of the <a> elements still open
+        self._pending = []       # data events of the current text node
+        self._skip = 0           # depth inside _NON_TEXT elements
+        self._hidden = 0         # depth inside _INVISIBLE elements
+        self._title = None       # text pieces while inside the first <title>
+        self._title_seen = False
+        self._title_mixed = False
+
+    def _flush(self):
+        # lxml splits one text node into several data events (entities, chunk
+        # boundaries); strip only once the whole node is in
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending.clear()
+        if self._title is not None:
+            self._title.append(text)
+        if self._open and not self._skip:
+            s = text.strip()
+            if s:
+                for a in self._open:
+                    a[2].append(s)
+        if self.want_text and not self._hidden:
+            piece = " ".join(text.split())
+            if piece:
+                self.text_len += len(piece) + (1 if self.text_parts else 0)
+                self.text_parts.append(piece)
+
+    def start(self, tag, attrib):
+        self._flush()
+        if tag == "a":
+            # where the anchor's text will begin, after the joining space
+            entry = [attrib.get("href"), dict(attrib), [], False,
+                     self.text_len + (1 if self.text_parts else 0), None]
+            self._open.append(entry)
+            if entry[0] is not None:
+                self.queue.append(entry)
+        if tag in _NON_TEXT:
+            self._skip += 1
+        if tag in _INVISIBLE:
+            self._hidden += 1
+        if self._title is not None:
+            self._title_mixed = True   # like bs4's .string: a title with child tags has none
+        elif tag == "title" and not self._title_seen:
+            self._title = []
+
+    def end(self, tag):
+        self._flush()
+        if tag == "a" and self._open:
+            entry = self._open.pop()
+            entry[3] = True
+            entry[5] = max(entry[4], self.text_len)
+        if tag in _NON_TEXT and self._skip:
+            self._skip -= 1
+        if tag in _INVISIBLE and self._hidden:
+            self._hidden -= 1
+        if tag == "title" and self._title is not None:
+            if not self._title_mixed:
+                self.title = "".join(self._title).strip() or None
+            self._title = None
+            self._title_seen = True
+
+    def data(self, text):
+        # most text on a thread page is post bodies nobody asked for: drop it early
+        if self._open or self._title is not None or self.want_text:
+            self._pending.append(text)
+
+    def comment(self, text):
+        self._flush()   # a comment ends the text node before it
+
+    def close(self):
+        self._flush()
+        # unclosed anchors at EOF still count
+        while self._open:
+            self.end("a")
+
+    def finished(self):
+        """Pop (text, href, attrs, span) for every anchor that is closed and not behind an open one."""
+        q = self.queue
+        while q and q[0][3]:
+            href, attrs, pieces, _closed, start, end = q.popleft()
+            yield "".join(pieces), href, attrs, (start, end) if self.want_text else None
+
+
+def iter_anchors(html_text: str, base_url: str, collector: AnchorCollector | None = None,
+                 chunk_size: int = STREAM_CHUNK):
+    """
+    Yield an Anchor for every <a href> as the document is read, in
+    document order. Pass your own collector to get the title (or visible
+    text, with want_text=True) once the generator is exhausted.
+    """
+    c = collector or AnchorCollector()
+    parser = etree.HTMLParser(target=c, encoding="utf-8")
+    resolved = {}   # href -> (url, parts); forum pages repeat the same links a lot
+
+    def drain():
+        for text, href, attrs, span in c.finished():
+            href = href.strip()
+            hit = resolved.get(href)
+            if hit is None:
+                url = urljoin(base_url, href)
+                hit = resolved[href] = (url, urlsplit(url))
+            yield Anchor(text, href, hit[0], hit[1], attrs, span)
+
+    fed = False
+    for i in range(0, len(html_text or ""), chunk_size):
+        chunk = html_text[i:i + chunk_size]
+        if chunk.strip() or fed:
+            parser.feed(chunk.encode("utf-8"))
+            fed = True
+        yield from drain()
+    if fed:
+        try:
+            parser.close()
+        except etree.XMLSyntaxError:
+            c.close()  # truncated page: keep what was read
+    yield from drain()
@@ -0,0 +1,189 @@
+# async_fetch.py
+"""
+Asyncio fetch engine: keeps N requests in flight with global and per-host caps.
+
+Plain HTTP goes through aiohttp; the heavier backends (cloudscraper, selenium)
+are blocking, so they run in the loop's thread pool under the same caps.
+Request pacing comes from the shared per-host RATE_LIMITER.
+"""
+from urllib.parse import urlparse
+import asyncio
+import inspect
+import random
+import time
+
+from .fetch_utils import USER_AGENTS, FETCHERS, HTML_GATE, _CHUNK, _env_int, FetchResult, _declared_encoding, _with_total
+from .backend_stats import BACKEND_TABLE
+from .rate_limit import RATE_LIMITER
+from .retry_policy import (
+    FetchError, BLOCKED, PERMANENT, classify, status_error, run_with_retries_async,
+)
+
+DEFAULT_CONCURRENCY = _env_int("FETCH_CONCURRENCY", 8)
+DEFAULT_PER_HOST = _env_int("FETCH_PER_HOST_CONCURRENCY", 4)
+
+
+def _cookie_dict(cookie_str: str | None) -> dict:
+    out = {}
+    for part in (cookie_str or "").split(";"):
+        part = part.strip()
+        if not part or "=" not in part:
+            continue
+        k, v = part.split("=", 1)
+        out[k.strip()] = v.strip()
+    return out
+
+
+async def fetch_aiohttp(session, url: str, referer: str | None = None, timeout: int = 25) -> FetchResult:
+    """Async counterpart of fetch_requests: UA rotation on 403, backoff on transient errors"""
+    import aiohttp
+
+    first = random.randrange(len(USER_AGENTS))
+    started = time.monotonic()
+
+    async def attempt(i):
+        headers = {"User-Agent": USER_AGENTS[(first + i) % len(USER_AGENTS)]}
+        if referer:
+            headers["Referer"] = referer
+        tw = time.monotonic()
+        await RATE_LIMITER.acquire_async(url)
+        t0 = time.monotonic()
+        async with session.get(url, headers=headers,
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            t1 = time.monotonic()
+            RATE_LIMITER.feedback(url, r.status, t1 - t0, r.headers.get("Retry-After"))
+            if r.status >= 400:
+                raise status_error(r.status, url, "aiohttp")
+            # check type/length before reading, then stream with a size cap
+            HTML_GATE.check_headers(url, r.headers)
+            buf = bytearray()
+            async for chunk in r.content.iter_chunked(_CHUNK):
+                buf += chunk
+                if len(buf) > HTML_GATE.max_bytes:
+                    raise HTML_GATE.overflow(url, r.headers, len(buf))
+            return FetchResult(bytes(buf), r.status, r.headers, "aiohttp", _declared_encoding(r.headers),
+                               url=str(r.url), requested_url=url,
+                               redirects=tuple(str(h.url) for h in r.history),
+                               timings={"wait": t0 - tw, "ttfb": t1 - t0,
+                                        "download": time.monotonic() - t1})
+
+    return _with_total(await run_with_retries_async(url, attempt, retry_blocked=True), started)
+
+
+class AsyncFetchEngine:
+    """
+    Fetch many URLs concurrently.
+
+    `run()` is synchronous from the caller's point of view (it owns its own
+    event loop), so it can be driven from the existing background threads.
+    The caller supplies:
+      next_item()            -> (url, payload) or None when nothing is ready, or an
+                                awaitable: a URL is waiting on it (say, its host's
+                                robots.txt); it is awaited alongside the fetches and
+                                next_item() is asked again once it completes
+      on_result(item, resp, error)  called in completion order with a FetchResult
+                                    (undecoded bytes); may refill the frontier
+      should_stop()          -> True to stop dispatching new work
+    """
+
+    def __init__(self, backend: str = "auto", concurrency: int = DEFAULT_CONCURRENCY,
+                 per_host: int = DEFAULT_PER_HOST, referer: str | None = None,
+                 cookie_str: str | None = None, timeout: int = 25):
+        self.backend = (backend or "auto").lower()
+        self.concurrency = max(1, int(concurrency))
+        self.per_host = max(1, min(int(per_host), self.concurrency))
+        self.referer = referer
+        self.cookie_str = cookie_str
+        self.timeout = timeout
+        self._host_slots = {}
+        self._session = None
+
+    def _slot(self, url: str) -> asyncio.Semaphore:
+        host = (urlparse(url).hostname or "").lower()
+        sem = self._host_slots.get(host)
+        if sem is None:
+            sem = self._host_slots[host] = asyncio.Semaphore(self.per_host)
+        return sem
+
+    async def _fetch_blocking(self, fn, url: str) -> FetchResult:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fn, url, self.referer, self.cookie_str)
+
+    async def fetch(self, url: str) -> FetchResult:
+        b = self.backend
+        if b == "requests":
+            return await fetch_aiohttp(self._session, url, self.referer, timeout=self.timeout)
+        if b in FETCHERS:
+            return await self._fetch_blocking(FETCHERS[b], url)
+
+        # auto: follow the per-host learned chain, like smart_fetch
+        errors = []
+        for name in BACKEND_TABLE.chain(url):
+            t0 = time.monotonic()
+            try:
+                if name == "requests":
+                    resp = await fetch_aiohttp(self._session, url, self.referer, timeout=self.timeout)
+                else:
+                    resp = await self._fetch_blocking(FETCHERS[name], url)
+            except Exception as e:
+                err = classify(e, url)
+                errors.append(f"{name}: {err}")
+                if err.kind == PERMANENT:
+                    raise err
+                BACKEND_TABLE.record_failure(url, name, str(err))
+                continue
+            BACKEND_TABLE.record_success(url, name, time.monotonic() - t0)
+            return resp
+        raise FetchError("auto fetch failed: " + " | ".join(errors), BLOCKED, url=url)
+
+    async def _run_item(self, item):
+        url = item[0]
+        async with self._slot(url):
+            try:
+                resp = await self.fetch(url)
+                err = None
+            except Exception as e:
+                resp, err = None, e
+        return item, resp, err
+
+    async def _drive(self, next_item, on_result, should_stop):
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            cookies=_cookie_dict(self.cookie_str),
+            headers={
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "en-US,en;q=0.9",
+                "Upgrade-Insecure-Requests": "1",
+                "DNT": "1",
+            },
+        ) as session:
+            self._session = session
+            pending = set()
+            waits = set()   # awaitables from next_item(): not fetches, nothing to report
+            try:
+                while True:
+                    while len(pending) < self.concurrency and not should_stop():
+                        item = next_item()
+                        if item is None:
+                            break
+                        if inspect.isawaitable(item):
+                            waits.add(asyncio.ensure_future(item))
+                            continue
+                        pending.add(asyncio.ensure_future(self._run_item(item)))
+                    if not pending and (not waits or should_stop()):
+                        break
+                    done, _ = await asyncio.wait(pending | waits, return_when=asyncio.FIRST_COMPLETED)
+                    waits -= done
+                    for task in done & pending:
+                        pending.discard(task)
+                        on_result(*task.result())
+            finally:
+                for task in pending:
+                    task.cancel()
+                self._session = None
+
+    def run(self, next_item, on_result, should_stop=lambda: False):
+        asyncio.run(self._drive(next_item, on_result, should_stop))
@@ -0,0 +1,151 @@
+# backend_stats.py
+"""
+Per-host memory of which fetch backend works, used by smart_fetch's auto mode.
+
+For every host we keep success/failure counts and a latency average per
+backend, plus the backend that last succeeded. Auto mode starts at the
+cheapest backend that is not known to fail, and a cheaper backend is tried
+again once its last failure is older than a back-off window (which doubles
+with each consecutive failure). The table is saved as JSON under the
+instance directory so it survives restarts.
+"""
+from urllib.parse import urlparse
+import threading
+import atexit
+import json
+import time
+import os
+
+from .storage import instance_path
+
+# Cheapest first; this is the order auto mode escalates in
+AUTO_CHAIN = ["requests", "cloudscraper", "selenium"]
+
+DECAY_SECONDS = float(os.environ.get("BACKEND_DECAY_SECONDS") or 6 * 3600)
+SAVE_INTERVAL = 30.0
+
+
+def _host(url: str) -> str:
+    return (urlparse(url).hostname or "").lower()
+
+
+class BackendTable:
+    def __init__(self, path=None, decay_seconds: float = DECAY_SECONDS):
+        self.path = path
+        self.decay_seconds = decay_seconds
+        self._hosts = {}   # host -> {"preferred": str|None, "backends": {name: {...}}}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self._loaded = False
+
+    # ---- persistence ----
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            if isinstance(data, dict):
+                self._hosts = data
+        except (OSError, ValueError):
+            pass
+
+    def save(self, force: bool = False):
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            now = time.time()
+            if not force and now - self._last_save < SAVE_INTERVAL:
+                return
+            payload = json.dumps(self._hosts, indent=1, sort_keys=True)
+            self._dirty = False
+            self._last_save = now
+        try:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                fh.write(payload)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # learning is an optimisation; never fail a fetch over it
+
+    # ---- learning ----
+
+    def _entry(self, host: str, backend: str) -> dict:
+        h = self._hosts.setdefault(host, {"preferred": None, "backends": {}})
+        return h["backends"].setdefault(backend, {
+            "ok": 0, "fail": 0, "consecutive_fail": 0,
+            "latency_ms": None, "last_ok": None, "last_fail": None,
+        })
+
+    def record_success(self, url: str, backend: str, elapsed: float):
+        host = _host(url)
+        with self._lock:
+            self._ensure_loaded()
+            e = self._entry(host, backend)
+            ms = round(elapsed * 1000, 1)
+            e["latency_ms"] = ms if e["latency_ms"] is None else round(0.7 * e["latency_ms"] + 0.3 * ms, 1)
+            e["ok"] += 1
+            e["consecutive_fail"] = 0
+            e["last_ok"] = time.time()
+            self._hosts[host]["preferred"] = backend
+            self._dirty = True
+        self.save()
+
+    def record_failure(self, url: str, backend: str, error: str = ""):
+        host = _host(url)
+        with self._lock:
+            self._ensure_loaded()
+            e = self._entry(host, backend)
+            e["fail"] += 1
+            e["consecutive_fail"] += 1
+            e["last_fail"] = time.time()
+            e["last_error"] = (error or "")[:200]
+            self._dirty = True
+        self.save()
+
+    def chain(self, url: str) -> list[str]:
+        """Backends to try for this URL, in order."""
+        host = _host(url)
+        now = time.time()
+        with self._lock:
+            self._ensure_loaded()
+            h = self._hosts.get(host)
+            if not h or h.get("preferred") not in AUTO_CHAIN:
+                return list(AUTO_CHAIN)  # nothing known to work yet
+            backends = h.get("backends", {})
+            stop = start = AUTO_CHAIN.index(h["preferred"])
+            # decay: retry a cheaper backend once its failure back-off has expired
+            for i in range(stop):
+                e = backends.get(AUTO_CHAIN[i])
+                if not e or not e.get("last_fail"):
+                    start = i
+                    break
+                window = self.decay_seconds * 2 ** min(max(e["consecutive_fail"] - 1, 0), 5)
+                if now - e["last_fail"] > window:
+                    start = i
+                    break
+        return AUTO_CHAIN[start:]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._ensure_loaded()
+            return json.loads(json.dumps(self._hosts))
+
+    def forget(self, host: str | None = None):
+        with self._lock:
+            self._ensure_loaded()
+            if host:
+                self._hosts.pop(host.lower(), None)
+            else:
+                self._hosts.clear()
+            self._dirty = True
+        self.save(force=True)
+
+
+BACKEND_TABLE = BackendTable(path=instance_path("backend_table.json"))
+atexit.register(BACKEND_TABLE.save, True)
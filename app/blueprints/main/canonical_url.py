@@ -0,0 +1,158 @@
+# canonical_url.py
+"""
+One name per page: URL canonicalization for dedupe.
+
+Forums hand out the same page under many URLs - a session id per guest
+(Discuz sid=, phpBB sid=, vBulletin s=), tracking parameters, query
+parameters in a different order, :80/:443, a trailing slash, an
+"index.php" the server would serve anyway, or "&amp;" left in an href by
+a template that escaped twice. canonical_url() maps all of those to one
+string, so visited sets and result lists count the page once.
+
+Rules are per site: SITE_RULES maps a host (or a parent domain) to a
+SiteRule; any other host gets DEFAULT_RULE. Extra parameter names to drop
+everywhere can be given in CANON_DROP_PARAMS (comma-separated).
+"""
+from functools import lru_cache
+from urllib.parse import urljoin, urlsplit, urlunsplit, unquote_plus
+import os
+import re
+
+# analytics / ad-click parameters: never part of what a page is
+TRACKING_PARAMS = frozenset({
+    "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "utm_id",
+    "gclid", "dclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "_ga", "_gl",
+    "spm", "ref_src",
+})
+# session ids and per-visit state; a name maps to a pattern its value must match (None: any value)
+_HEX32 = re.compile(r"[0-9a-fA-F]{32}")
+SESSION_PARAMS = {
+    "sid": None,            # Discuz (6 chars), phpBB (32 hex)
+    "phpsessid": None,
+    "jsessionid": None,
+    "sessionid": None,
+    "session_id": None,
+    "s": _HEX32,            # vBulletin; elsewhere s= is often a search
+    "formhash": None,       # Discuz per-session form token
+    "extra": re.compile(r"page=\d+.*"),   # Discuz: the forum page a thread was opened from
+}
+_EXTRA = frozenset(p.strip().lower() for p in os.environ.get("CANON_DROP_PARAMS", "").split(",") if p.strip())
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+INDEX_FILES = ("index.php", "index.html", "index.htm", "default.asp", "default.aspx")
+_AMP_RE = re.compile(r"&(?:amp;|#0*38;|#x0*26;)+", re.I)
+_ESCAPE_RE = re.compile(r"%[0-9a-fA-F]{2}")
+_UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+
+class SiteRule:
+    """
+    How one site's URLs are canonicalized.
+      drop           extra parameter names to remove (lower-case)
+      keep           parameter names never removed, even if listed as session/tracking
+      sort_query     order parameters by name (values of a repeated name keep their order)
+      collapse_index drop a trailing index.php & co. when there is no query string
+      index_with_query ... and also when there is one
+      strip_slash    "/forum/" -> "/forum" (never the root path)
+    """
+    def __init__(self, drop=(), keep=(), sort_query: bool = True, collapse_index: bool = True,
+                 index_with_query: bool = False, strip_slash: bool = True):
+        self.drop = frozenset(p.lower() for p in drop) | TRACKING_PARAMS | _EXTRA
+        self.keep = frozenset(p.lower() for p in keep)
+        self.sort_query = sort_query
+        self.collapse_index = collapse_index
+        self.index_with_query = index_with_query
+        self.strip_slash = strip_slash
+
+    def drops(self, name: str, value: str) -> bool:
+        name = name.lower()
+        if name in self.keep:
+            return False
+        if name in self.drop:
+            return True
+        if name in SESSION_PARAMS:
+            pattern = SESSION_PARAMS[name]
+            return pattern is None or bool(pattern.fullmatch(value))
+        return False
+
+
+DEFAULT_RULE = SiteRule()
+# host or parent domain -> SiteRule, e.g. {"bbs.example.com": SiteRule(drop=("extra",), strip_slash=False)}
+SITE_RULES: dict[str, SiteRule] = {}
+
+
+def rule_for(host: str) -> SiteRule:
+    host = host.lower()
+    while host:
+        rule = SITE_RULES.get(host)
+        if rule is not None:
+            return rule
+        host = host.partition(".")[2]
+    return DEFAULT_RULE
+
+
+def _unescape(m) -> str:
+    ch = chr(int(m.group(0)[1:], 16))
+    return ch if ch in _UNRESERVED else m.group(0).upper()
+
+
+def _fix_escapes(s: str) -> str:
+    # one spelling per escape (RFC 3986 6.2.2): %7E -> ~, %2f -> %2F; bytes are never
+    # re-encoded, so pages whose URLs are in GBK/Big5 keep working
+    return _ESCAPE_RE.sub(_unescape, s) if "%" in s else s
+
+
+def _query(query: str, rule: "SiteRule") -> str:
+    # parameters are kept as written (a bare "?/topic/1-x/" stays one piece); only names
+    # and values are decoded, to compare them with the rule and sort by name
+    kept = []
+    for piece in query.split("&"):
+        if not piece:
+            continue
+        name, _, value = piece.partition("=")
+        key = unquote_plus(name)
+        if not rule.drops(key, unquote_plus(value)):
+            kept.append((key, _fix_escapes(piece)))
+    if rule.sort_query:
+        kept.sort(key=lambda kv: kv[0])
+    return "&".join(piece for _, piece in kept)
+
+
+@lru_cache(maxsize=65536)
+def canonical_url(href: str, base: str | None = None) -> str | None:
+    """
+    The canonical form of `href` (resolved against `base` if given), or None
+    for an empty href or one that isn't http(s). Fragments are dropped.
+    """
+    if not href:
+        return None
+    href = _AMP_RE.sub("&", href.strip())
+    url = urljoin(base, href) if base else href
+    s = urlsplit(url)
+    scheme = s.scheme.lower()
+    if scheme not in DEFAULT_PORTS:
+        return None
+    host = (s.hostname or "").rstrip(".")
+    if not host:
+        return None
+    try:
+        port = s.port
+    except ValueError:
+        port = None
+    netloc = f"[{host}]" if ":" in host else host   # IPv6 literals keep their brackets
+    if port not in (None, DEFAULT_PORTS[scheme]):
+        netloc = f"{netloc}:{port}"
+    if s.username:
+        netloc = f"{s.username}{':' + s.password if s.password else ''}@{netloc}"
+
+    rule = rule_for(host)
+    query = _query(s.query, rule) if s.query else ""
+
+    path = _fix_escapes(s.path) or "/"
+    if rule.collapse_index and (not query or rule.index_with_query):
+        head, _, last = path.rpartition("/")
+        if last.lower() in INDEX_FILES:
+            path = head + "/"
+    if rule.strip_slash and len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/") or "/"
+    return urlunsplit((scheme, netloc, path, query, ""))
@@ -0,0 +1,170 @@
+# driver_pool.py
+"""
+Bounded pool of long-lived headless Chrome drivers for fetch_selenium.
+
+Launching Chrome is the slowest thing the scraper does, so drivers are leased
+per fetch and only recycled after SELENIUM_MAX_USES pages, after a crash, or
+when they sit idle. Cookies are remembered at pool level per domain and
+cookie profile (the cookie string a fetch was given), so a fresh driver
+picks up where a recycled one left off and one user's session never
+reaches another's fetch.
+"""
+from contextlib import contextmanager
+import threading
+import atexit
+import random
+import time
+import os
+
+from .fetch_utils import USER_AGENTS, _env_int
+
+POOL_SIZE = _env_int("SELENIUM_POOL_SIZE", 2)              # max live Chrome processes
+MAX_USES = _env_int("SELENIUM_MAX_USES", 50)               # recycle after this many pages
+IDLE_SECONDS = _env_int("SELENIUM_IDLE_SECONDS", 300)      # quit drivers unused this long
+LEASE_TIMEOUT = _env_int("SELENIUM_LEASE_TIMEOUT", 120)    # wait this long for a free driver
+READY_TIMEOUT = float(os.environ.get("SELENIUM_READY_TIMEOUT") or 10)
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.warm_hosts = set()   # hosts this browser has already visited
+        self.profiles = {}        # host -> cookie profile its cookies were last set for
+        self.last_used = time.monotonic()
+
+
+def _new_chrome():
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1280,800")
+    options.add_argument(f"--user-agent={random.choice(USER_AGENTS)}")
+    return webdriver.Chrome(options=options)
+
+
+class DriverPool:
+    def __init__(self, size: int = POOL_SIZE, max_uses: int = MAX_USES,
+                 idle_seconds: int = IDLE_SECONDS, factory=_new_chrome):
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self.idle_seconds = idle_seconds
+        self.factory = factory
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = []           # [PooledDriver, ...] most recently used last
+        self._cookies = {}        # (host, cookie profile) -> [cookie dict, ...]
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.recycled = 0
+
+    # ---- cookies shared across drivers ----
+
+    @staticmethod
+    def _key(host: str, cookie_str: str | None):
+        return ((host or "").lower(), cookie_str or "")
+
+    def remember_cookies(self, host: str, cookies: list[dict], cookie_str: str | None = None):
+        if host and cookies:
+            with self._lock:
+                self._cookies[self._key(host, cookie_str)] = cookies
+
+    def cookies_for(self, host: str, cookie_str: str | None = None) -> list[dict]:
+        with self._lock:
+            return list(self._cookies.get(self._key(host, cookie_str), []))
+
+    # ---- leasing ----
+
+    def _pop_idle(self):
+        """Return a live idle driver (or None) and any that timed out."""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            keep = []
+            for pd in self._idle:
+                (stale if now - pd.last_used > self.idle_seconds else keep).append(pd)
+            self._idle = keep
+            pd = self._idle.pop() if self._idle else None
+        return pd, stale
+
+    @contextmanager
+    def lease(self, timeout: float = LEASE_TIMEOUT):
+        if not self._slots.acquire(timeout=timeout):
+            raise RuntimeError("No Selenium driver available (pool exhausted)")
+        pd = None
+        crashed = False
+        try:
+            pd, stale = self._pop_idle()
+            for old in stale:
+                self._quit(old)
+            if pd is None:
+                pd = PooledDriver(self.factory())
+                with self._lock:
+                    self.launched += 1
+            yield pd
+        except Exception as e:
+            crashed = _is_driver_crash(e)
+            raise
+        finally:
+            try:
+                if pd is not None:
+                    pd.uses += 1
+                    pd.last_used = time.monotonic()
+                    if crashed or pd.uses >= self.max_uses:
+                        self._quit(pd)
+                    else:
+                        with self._lock:
+                            self._idle.append(pd)
+            finally:
+                self._slots.release()
+
+    def _quit(self, pd: PooledDriver):
+        with self._lock:
+            self.recycled += 1
+        try:
+            pd.driver.quit()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pd in idle:
+            self._quit(pd)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "idle": len(self._idle),
+                    "launched": self.launched, "recycled": self.recycled,
+                    "cookie_domains": len(self._cookies)}
+
+
+def _is_driver_crash(e: Exception) -> bool:
+    try:
+        from selenium.common.exceptions import WebDriverException, TimeoutException
+    except ImportError:
+        return True
+    # a slow page is not a dead browser; anything else from WebDriver is
+    return isinstance(e, WebDriverException) and not isinstance(e, TimeoutException)
+
+
+def wait_until_ready(driver, timeout: float = READY_TIMEOUT) -> bool:
+    """Wait for document.readyState == 'complete'; False if it timed out."""
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+        return True
+    except TimeoutException:
+        return False
+
+
+DRIVER_POOL = DriverPool()
+atexit.register(DRIVER_POOL.close_all)
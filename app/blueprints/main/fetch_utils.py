@@ -1,6 +1,17 @@
 from urllib.parse import urlparse
+from contextlib import contextmanager
+from typing import NamedTuple
 import requests
+from requests.adapters import HTTPAdapter
+import threading
 import random
+import time
+import os
+
+from .rate_limit import RATE_LIMITER
+from .retry_policy import (
+    FetchError, BLOCKED, PERMANENT, classify, status_error, run_with_retries,
+)
 
 # Which backends the UI can select
 BACKENDS = ["auto", "requests", "cloudscraper", "selenium"] #, "playwright"]
@@ -16,8 +27,39 @@ USER_AGENTS = [
      "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"),
 ]
 
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name) or default)
+    except ValueError:
+        return default
+
+
+# Connection pool sizing (per session) and session reuse limits
+POOL_CONNECTIONS = _env_int("FETCH_POOL_CONNECTIONS", 10)   # distinct hosts kept per session
+POOL_MAXSIZE = _env_int("FETCH_POOL_MAXSIZE", 10)           # keep-alive sockets per host
+POOL_MAX_IDLE = _env_int("FETCH_POOL_MAX_IDLE", 4)          # idle sessions kept per key
+POOL_IDLE_SECONDS = _env_int("FETCH_POOL_IDLE_SECONDS", 90) # evict sessions unused this long
+
+
+def _mount_pooled_adapters(s: requests.Session) -> None:
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+
+
+def _resize_pools(s: requests.Session) -> None:
+    # keep the adapters a session came with (cloudscraper's CipherSuiteAdapter carries
+    # its TLS setup) and only give their connection pools our sizes
+    for adapter in s.adapters.values():
+        if isinstance(adapter, HTTPAdapter) and (
+                adapter._pool_connections, adapter._pool_maxsize) != (POOL_CONNECTIONS, POOL_MAXSIZE):
+            adapter.init_poolmanager(POOL_CONNECTIONS, POOL_MAXSIZE, block=adapter._pool_block)
+
+
 def make_session(user_agent: str | None = None) -> requests.Session:
     s = requests.Session()
+    _mount_pooled_adapters(s)
     s.headers.update({
         "User-Agent": user_agent or random.choice(USER_AGENTS),
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
@@ -28,60 +70,350 @@ def make_session(user_agent: str | None = None) -> requests.Session:
     })
     return s
 
-def apply_referer_and_cookies(session: requests.Session, url: str, referer: str | None, cookie_str: str | None):
-    if referer:
-        session.headers["Referer"] = referer
-    if cookie_str:
-        for part in (cookie_str or "").split(";"):
-            part = part.strip()
-            if not part or "=" not in part:
-                continue
-            k, v = part.split("=", 1)
-            session.cookies.set(k.strip(), v.strip(), domain=urlparse(url).hostname)
-
-def fetch_requests(url: str, referer: str | None = None, cookie_str: str | None = None, timeout: int = 25) -> str:
-    """Try plain requests with UA rotation"""
-    errors = []
-    for i in range(3):
-        s = make_session()
-        apply_referer_and_cookies(s, url, referer, cookie_str)
-        try:
-            r = s.get(url, timeout=timeout)
-            if r.status_code == 403:
-                errors.append(f"403 on try {i+1}")
-                continue
-            r.raise_for_status()
-            return r.text
-        except Exception as e:
-            errors.append(str(e))
-            continue
-    raise requests.HTTPError("; ".join(errors))
-
-def fetch_cloudscraper(url: str, referer: str | None = None, cookie_str: str | None = None, timeout: int = 30) -> str:
-    """Try with cloudscraper (Cloudflare bypass)"""
+def make_cloudscraper(user_agent: str | None = None):
     import cloudscraper
     scraper = cloudscraper.create_scraper()
+    _resize_pools(scraper)
     scraper.headers.update({
-        "User-Agent": random.choice(USER_AGENTS),
+        "User-Agent": user_agent or random.choice(USER_AGENTS),
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
         "Accept-Language": "en-US,en;q=0.9",
         "Upgrade-Insecure-Requests": "1",
     })
+    return scraper
+
+def apply_referer_and_cookies(session: requests.Session, url: str, referer: str | None, cookie_str: str | None):
     if referer:
-        scraper.headers["Referer"] = referer
+        session.headers["Referer"] = referer
     if cookie_str:
         for part in (cookie_str or "").split(";"):
             part = part.strip()
             if not part or "=" not in part:
                 continue
             k, v = part.split("=", 1)
-            scraper.cookies.set(k.strip(), v.strip(), domain=urlparse(url).hostname)
+            session.cookies.set(k.strip(), v.strip(), domain=urlparse(url).hostname)
+
+
+# failures that can leave a half-read socket behind; an HTTP error status came with a
+# complete response, so the session (keep-alive connections, learned cookies) is kept
+_TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                     GeneratorExit, KeyboardInterrupt)
+
+
+def _is_transport_error(exc: BaseException | None) -> bool:
+    """`exc`, or what it wraps (run_with_retries hands back FetchErrors), is a transport failure."""
+    while exc is not None:
+        if isinstance(exc, _TRANSPORT_ERRORS):
+            return True
+        exc = exc.__cause__
+    return False
+
+
+class SessionPool:
+    """
+    Process-wide pool of keep-alive sessions.
+
+    Sessions are keyed by (host, referer, cookie string) so cookies and headers
+    never leak between profiles, and are leased to one thread at a time.
+    Idle sessions are closed after `idle_seconds`.
+    """
+
+    def __init__(self, factory, max_idle: int = POOL_MAX_IDLE, idle_seconds: int = POOL_IDLE_SECONDS):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.idle_seconds = idle_seconds
+        self._idle = {}  # key -> [(last_used_ts, session), ...]
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(url: str, referer: str | None, cookie_str: str | None):
+        return ((urlparse(url).hostname or "").lower(), referer or "", cookie_str or "")
+
+    def _sweep(self, now: float):
+        """Close sessions idle for too long. Caller holds the lock."""
+        if now - self._last_sweep < min(self.idle_seconds, 10):
+            return []
+        self._last_sweep = now
+        stale = []
+        for key in list(self._idle):
+            keep = []
+            for ts, s in self._idle[key]:
+                (stale if now - ts > self.idle_seconds else keep).append((ts, s))
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return [s for _ts, s in stale]
+
+    @contextmanager
+    def lease(self, url: str, referer: str | None = None, cookie_str: str | None = None):
+        key = self._key(url, referer, cookie_str)
+        now = time.monotonic()
+        session = None
+        with self._lock:
+            stale = self._sweep(now)
+            bucket = self._idle.get(key)
+            if bucket:
+                _ts, session = bucket.pop()
+                self.reused += 1
+        for s in stale:
+            s.close()
+
+        if session is None:
+            session = self.factory()
+            apply_referer_and_cookies(session, url, referer, cookie_str)
+            with self._lock:
+                self.created += 1
+
+        broken = False
+        try:
+            yield session
+        except BaseException as e:
+            broken = _is_transport_error(e)
+            raise
+        finally:
+            self._release(key, session, broken)
+
+    def _release(self, key, session, broken: bool):
+        if broken:
+            # Transport errors may leave half-read sockets behind; start fresh next time
+            session.close()
+            return
+        extra = None
+        with self._lock:
+            bucket = self._idle.setdefault(key, [])
+            bucket.append((time.monotonic(), session))
+            if len(bucket) > self.max_idle:
+                _ts, extra = bucket.pop(0)
+        if extra is not None:
+            extra.close()
+
+    def close_all(self):
+        with self._lock:
+            sessions = [s for bucket in self._idle.values() for _ts, s in bucket]
+            self._idle.clear()
+        for s in sessions:
+            s.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = sum(len(b) for b in self._idle.values())
+            return {"keys": len(self._idle), "idle": idle,
+                    "created": self.created, "reused": self.reused}
+
+
+REQUESTS_POOL = SessionPool(make_session)
+CLOUDSCRAPER_POOL = SessionPool(make_cloudscraper)
+
+
+class FetchResult(NamedTuple):
+    """
+    What every backend hands back: undecoded bytes plus the charset the
+    server declared (None if it didn't), and where/how the page was fetched.
+    Decoding is left to parser_utils.decode_html; the public fetch_*
+    functions return decoded text.
+    """
+    content: bytes
+    status: int
+    headers: dict
+    backend: str
+    encoding: str | None = None
+    url: str = ""                 # final URL, after redirects
+    requested_url: str = ""
+    redirects: tuple = ()         # URLs that answered with a redirect, requested URL first
+    timings: dict | None = None   # seconds per phase: wait (rate limit), ttfb, download, total
+    from_cache: bool = False
+
+    @property
+    def byte_count(self) -> int:
+        return len(self.content)
+
+
+TIMING_PHASES = ("wait", "ttfb", "download", "total")
+
+
+def _with_total(result: FetchResult, started: float) -> FetchResult:
+    """Stamp the overall time (retries and backoff included) onto a result."""
+    timings = dict(result.timings or {})
+    timings["total"] = time.monotonic() - started
+    return result._replace(timings=timings)
+
+
+def record_fetch(stats: dict | None, result: FetchResult):
+    """Accumulate byte/redirect counts and phase timings of one fetch into `stats`."""
+    if stats is None:
+        return
+    stats["fetches"] = stats.get("fetches", 0) + 1
+    stats["bytes_fetched"] = stats.get("bytes_fetched", 0) + result.byte_count
+    if result.redirects:
+        stats["redirects"] = stats.get("redirects", 0) + 1
+    for phase, secs in (result.timings or {}).items():
+        stats[f"{phase}_s"] = stats.get(f"{phase}_s", 0.0) + secs
+
+
+def merge_stats(stats: dict | None, part: dict):
+    """Add the counters of another stats dict (e.g. one fetch thread's) into `stats`."""
+    if stats is None:
+        return
+    for k, v in part.items():
+        stats[k] = stats.get(k, 0) + v
+
+
+def timing_summary(stats: dict) -> dict:
+    """Progress fields from record_fetch() counters: averages in ms."""
+    n = stats.get("fetches", 0)
+    out = {"bytes_fetched": stats.get("bytes_fetched", 0), "redirects": stats.get("redirects", 0)}
+    for phase in TIMING_PHASES:
+        out[f"avg_{phase}_ms"] = round(stats.get(f"{phase}_s", 0.0) * 1000 / n, 1) if n else None
+    return out
+
+
+def _decoded(resp: FetchResult) -> str:
+    from .parser_utils import decode_html
+    return decode_html(resp.content, resp.encoding)
+
+
+def _declared_encoding(headers) -> str | None:
+    from .parser_utils import charset_from_content_type
+    return charset_from_content_type(headers.get("Content-Type"))
+
 
-    r = scraper.get(url, timeout=timeout)
-    if r.status_code == 403:
-        raise requests.HTTPError("403 via cloudscraper")
-    r.raise_for_status()
-    return r.text
+MAX_BODY_BYTES = _env_int("FETCH_MAX_BODY_KB", 5 * 1024) * 1024
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+_CHUNK = 64 * 1024
+
+
+class SkippedResponse(FetchError):
+    """The body was not (fully) downloaded: wrong content type or too large."""
+
+    def __init__(self, reason: str, url: str, bytes_saved: int = 0):
+        super().__init__(f"skipped {url}: {reason}", PERMANENT, url=url)
+        self.reason = reason
+        self.bytes_saved = bytes_saved
+
+
+def _content_length(headers) -> int | None:
+    try:
+        return int(headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BodyGate:
+    """
+    Decides from the response headers whether a body is worth downloading,
+    then reads it in chunks up to max_bytes. A missing Content-Type is let through.
+    """
+
+    def __init__(self, allowed_types=HTML_TYPES, max_bytes: int = MAX_BODY_BYTES):
+        self.allowed_types = tuple(allowed_types) if allowed_types else ()
+        self.max_bytes = max_bytes
+
+    def check_headers(self, url: str, headers):
+        ctype = (headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        length = _content_length(headers)
+        if self.allowed_types and ctype and not ctype.startswith(self.allowed_types):
+            raise SkippedResponse(f"content type {ctype}", url, length or 0)
+        if length is not None and length > self.max_bytes:
+            raise SkippedResponse(f"{length} bytes over the {self.max_bytes} byte cap", url, length)
+
+    def overflow(self, url: str, headers, got: int) -> SkippedResponse:
+        length = _content_length(headers)
+        return SkippedResponse(f"body over the {self.max_bytes} byte cap", url,
+                               max(0, (length or 0) - got))
+
+    def read(self, url: str, headers, chunks) -> bytes:
+        buf = bytearray()
+        for chunk in chunks:
+            buf += chunk
+            if len(buf) > self.max_bytes:
+                raise self.overflow(url, headers, len(buf))
+        return bytes(buf)
+
+
+HTML_GATE = BodyGate()
+
+
+def _read_gated(r: requests.Response, url: str, gate: BodyGate) -> bytes:
+    """Stream a requests response through the gate; always releases the connection."""
+    try:
+        gate.check_headers(url, r.headers)
+        return gate.read(url, r.headers, r.iter_content(_CHUNK))
+    finally:
+        r.close()
+
+
+def _from_requests(r: requests.Response, url: str, body: bytes, backend: str,
+                   timings: dict) -> FetchResult:
+    return FetchResult(body, r.status_code, r.headers, backend, _declared_encoding(r.headers),
+                       url=r.url or url, requested_url=url,
+                       redirects=tuple(h.url for h in r.history), timings=timings)
+
+
+def _raw_requests(url: str, referer: str | None = None, cookie_str: str | None = None,
+                  timeout: int = 25, headers: dict | None = None,
+                  gate: BodyGate | None = None) -> FetchResult:
+    gate = gate or HTML_GATE
+    first = random.randrange(len(USER_AGENTS))
+    started = time.monotonic()
+    with REQUESTS_POOL.lease(url, referer, cookie_str) as s:
+        def attempt(i):
+            # a 403 is retried at once with the next UA; transient errors back off
+            ua = USER_AGENTS[(first + i) % len(USER_AGENTS)]
+            tw = time.monotonic()
+            RATE_LIMITER.acquire(url)
+            t0 = time.monotonic()
+            r = s.get(url, timeout=timeout, stream=True,
+                      headers={"User-Agent": ua, **(headers or {})})
+            t1 = time.monotonic()
+            RATE_LIMITER.feedback(url, r.status_code, t1 - t0, r.headers.get("Retry-After"))
+            if r.status_code == 304 or r.status_code >= 400:
+                r.close()
+                if r.status_code == 304:
+                    return _from_requests(r, url, b"", "requests",
+                                          {"wait": t0 - tw, "ttfb": t1 - t0, "download": 0.0})
+                raise status_error(r.status_code, url, "requests")
+            body = _read_gated(r, url, gate)
+            return _from_requests(r, url, body, "requests",
+                                  {"wait": t0 - tw, "ttfb": t1 - t0, "download": time.monotonic() - t1})
+
+        return _with_total(run_with_retries(url, attempt, retry_blocked=True), started)
+
+def fetch_requests(url: str, referer: str | None = None, cookie_str: str | None = None, timeout: int = 25) -> str:
+    """Try plain requests with UA rotation, reusing a pooled keep-alive session"""
+    return _decoded(_raw_requests(url, referer, cookie_str, timeout))
+
+def _raw_cloudscraper(url: str, referer: str | None = None, cookie_str: str | None = None,
+                      timeout: int = 30, headers: dict | None = None,
+                      gate: BodyGate | None = None) -> FetchResult:
+    gate = gate or HTML_GATE
+    started = time.monotonic()
+    with CLOUDSCRAPER_POOL.lease(url, referer, cookie_str) as scraper:
+        def attempt(i):
+            tw = time.monotonic()
+            RATE_LIMITER.acquire(url)
+            t0 = time.monotonic()
+            r = scraper.get(url, timeout=timeout, headers=headers, stream=True)
+            t1 = time.monotonic()
+            RATE_LIMITER.feedback(url, r.status_code, t1 - t0, r.headers.get("Retry-After"))
+            if r.status_code == 304 or r.status_code >= 400:
+                r.close()
+                if r.status_code == 304:
+                    return _from_requests(r, url, b"", "cloudscraper",
+                                          {"wait": t0 - tw, "ttfb": t1 - t0, "download": 0.0})
+                raise status_error(r.status_code, url, "cloudscraper")
+            body = _read_gated(r, url, gate)
+            return _from_requests(r, url, body, "cloudscraper",
+                                  {"wait": t0 - tw, "ttfb": t1 - t0, "download": time.monotonic() - t1})
+
+        return _with_total(run_with_retries(url, attempt), started)
+
+def fetch_cloudscraper(url: str, referer: str | None = None, cookie_str: str | None = None, timeout: int = 30) -> str:
+    """Try with cloudscraper (Cloudflare bypass); pooled so clearance cookies are reused"""
+    return _decoded(_raw_cloudscraper(url, referer, cookie_str, timeout))
 
 # def fetch_playwright(url: str, referer: str | None = None, cookie_str: str | None = None, timeout_ms: int = 45000) -> str:
 #     """Full JS rendering using Playwright"""
@@ -126,97 +458,187 @@ def fetch_selenium(
 ) -> str:
     """
     Full-page fetch using Selenium + Chrome in headless mode.
+    See _selenium_page for details.
+    """
+    return _selenium_page(url, referer, cookie_str, timeout)[0]
+
+def _selenium_page(
+    url: str,
+    referer: str | None = None,
+    cookie_str: str | None = None,
+    timeout: int = 45,
+) -> tuple[str, str]:
+    """
+    Load `url` in a pooled headless Chrome; returns (page source, final URL).
+
+    Drivers are leased from DRIVER_POOL (see driver_pool.py) instead of being
+    launched per page; cookies are kept per domain and cookie profile across
+    fetches.
 
     Requires:
       pip install selenium
       and a working Chrome/Chromium + chromedriver on PATH.
     """
-    from selenium import webdriver
-    from selenium.webdriver.chrome.options import Options
-    import time
+    from .driver_pool import DRIVER_POOL, wait_until_ready
 
-    options = Options()
-    options.add_argument("--headless=new")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--window-size=1280,800")
-    options.add_argument(f"--user-agent={random.choice(USER_AGENTS)}")
+    parsed = urlparse(url)
+    host = parsed.hostname
+    base = f"{parsed.scheme}://{parsed.hostname}"
 
-    driver = webdriver.Chrome(options=options)
-    driver.set_page_load_timeout(timeout)
+    with DRIVER_POOL.lease() as pd:
+        driver = pd.driver
+        driver.set_page_load_timeout(timeout)
 
-    try:
-        parsed = urlparse(url)
-        base = f"{parsed.scheme}://{parsed.hostname}"
-
-        # 1) Open a "warm up" page so Selenium knows the domain
-        start_url = referer or base
-        driver.get(start_url)
-
-        # 2) Apply cookies, if provided (same format as your existing code)
-        if cookie_str:
-            host = parsed.hostname
-            for part in (cookie_str or "").split(";"):
-                part = part.strip()
-                if not part or "=" not in part:
-                    continue
-                k, v = part.split("=", 1)
-                driver.add_cookie(
-                    {
-                        "name": k.strip(),
-                        "value": v.strip(),
-                        "domain": host,
-                        "path": "/",
-                    }
-                )
+        # 1) Open a "warm up" page once per host so Selenium knows the domain,
+        #    and again whenever the browser sits on another host (cookies can
+        #    only be set for the domain of the current page)
+        if host not in pd.warm_hosts or urlparse(driver.current_url or "").hostname != host:
+            driver.get(referer or base)
+            pd.warm_hosts.add(host)
+
+        # 2) Apply cookies: on a new profile drop what the last one left behind and
+        #    restore what this one had; the provided cookies go in on every lease
+        profile = cookie_str or ""
+        if pd.profiles.get(host) != profile:
+            driver.delete_all_cookies()
+            for c in DRIVER_POOL.cookies_for(host, cookie_str):
+                try:
+                    driver.add_cookie(c)
+                except Exception:
+                    pass  # expired/foreign cookies are not worth failing over
+            pd.profiles[host] = profile
+        for part in profile.split(";"):
+            part = part.strip()
+            if not part or "=" not in part:
+                continue
+            k, v = part.split("=", 1)
+            driver.add_cookie(
+                {
+                    "name": k.strip(),
+                    "value": v.strip(),
+                    "domain": host,
+                    "path": "/",
+                }
+            )
 
         # 3) Now load the actual target URL
         driver.get(url)
 
-        # Small wait so JS can finish
-        time.sleep(2)
+        # Wait until the document reports ready instead of a fixed sleep
+        wait_until_ready(driver)
 
         html_text = driver.page_source
-        if not html_text or "<html" not in html_text.lower():
-            raise RuntimeError("Empty or invalid HTML from Selenium")
+        final_url = driver.current_url or url
+        DRIVER_POOL.remember_cookies(host, driver.get_cookies(), cookie_str)
 
-        return html_text
-    finally:
-        driver.quit()
+    if not html_text or "<html" not in html_text.lower():
+        raise RuntimeError("Empty or invalid HTML from Selenium")
 
-def smart_fetch(
+    return html_text, final_url
+
+def _raw_selenium(url: str, referer: str | None = None, cookie_str: str | None = None,
+                  headers: dict | None = None, gate: BodyGate | None = None) -> FetchResult:
+    # a browser can't send conditional headers or stop a download early;
+    # `headers` and `gate` are accepted and ignored
+    # the browser hides status, headers and time-to-first-byte: the page load counts as download
+    started = time.monotonic()
+
+    def attempt(i):
+        tw = time.monotonic()
+        RATE_LIMITER.acquire(url)
+        t0 = time.monotonic()
+        html_text, final_url = _selenium_page(url, referer, cookie_str)
+        t1 = time.monotonic()
+        RATE_LIMITER.feedback(url, 200, t1 - t0)
+        # the browser already decoded the page; hand it on as UTF-8
+        return FetchResult(html_text.encode("utf-8"), 200, {}, "selenium", "utf-8",
+                           url=final_url, requested_url=url,
+                           redirects=(url,) if final_url != url else (),
+                           timings={"wait": t0 - tw, "download": t1 - t0})
+
+    return _with_total(run_with_retries(url, attempt), started)
+
+FETCHERS = {
+    "requests": _raw_requests,
+    "cloudscraper": _raw_cloudscraper,
+    "selenium": _raw_selenium,
+    # "playwright": fetch_playwright,
+}
+
+def fetch_with_learning(url: str, referer: str | None, cookie_str: str | None,
+                        fetchers=None, headers: dict | None = None,
+                        gate: BodyGate | None = None) -> FetchResult:
+    """
+    Auto mode: walk the per-host learned chain (see backend_stats.py),
+    recording latency on success and failures per backend.
+    """
+    from .backend_stats import BACKEND_TABLE
+
+    fetchers = fetchers or FETCHERS
+    errors = []
+    for name in BACKEND_TABLE.chain(url):
+        t0 = time.monotonic()
+        try:
+            resp = fetchers[name](url, referer, cookie_str, headers=headers, gate=gate)
+        except Exception as e:
+            err = classify(e, url)
+            errors.append(f"{name}: {err}")
+            if err.kind == PERMANENT:
+                # 404s, DNS failures, skipped bodies, open circuits: a heavier backend won't help
+                raise err
+            BACKEND_TABLE.record_failure(url, name, str(err))
+            continue
+        BACKEND_TABLE.record_success(url, name, time.monotonic() - t0)
+        return resp
+    raise FetchError("auto fetch failed: " + " | ".join(errors), BLOCKED, url=url)
+
+def fetch_raw(url: str, referer: str | None, cookie_str: str | None,
+              backend: str = "auto", headers: dict | None = None,
+              gate: BodyGate | None = None) -> FetchResult:
+    b = (backend or "auto").lower()
+    # Explicit backend choice
+    if b in FETCHERS:
+        return FETCHERS[b](url, referer, cookie_str, headers=headers, gate=gate)
+    # auto: requests → cloudscraper → selenium, starting at the cheapest
+    # backend known to work for this host
+    return fetch_with_learning(url, referer, cookie_str, headers=headers, gate=gate)
+
+def smart_fetch_raw(
     url: str,
     referer: str | None,
     cookie_str: str | None,
     backend: str = "auto",
-) -> str:
-    """Flexible fetching with selectable backend."""
+    use_cache: bool = True,
+    stats: dict | None = None,
+    gate: BodyGate | None = None,
+) -> FetchResult:
+    """
+    Flexible fetching with selectable backend, returning a FetchResult
+    (undecoded bytes, final URL, timings). Goes through the on-disk response
+    cache unless use_cache=False; cache and timing counters are added to
+    `stats` when given. `gate` replaces HTML_GATE for non-page fetches
+    (robots.txt, sitemaps).
+    """
+    from .response_cache import RESPONSE_CACHE
+
     b = (backend or "auto").lower()
+    if use_cache and RESPONSE_CACHE.enabled:
+        result = RESPONSE_CACHE.fetch(
+            url, b, lambda headers: fetch_raw(url, referer, cookie_str, b, headers=headers, gate=gate),
+            stats=stats, referer=referer, cookie_str=cookie_str,
+        )
+    else:
+        result = fetch_raw(url, referer, cookie_str, b, gate=gate)
+    record_fetch(stats, result)
+    return result
 
-    # Explicit backend choice
-    if b == "requests":
-        return fetch_requests(url, referer, cookie_str)
-    if b == "cloudscraper":
-        return fetch_cloudscraper(url, referer, cookie_str)
-    if b == "selenium":
-        return fetch_selenium(url, referer, cookie_str)
-    # if b == "playwright":
-    #     return fetch_playwright(url, referer, cookie_str)
-
-    # auto fallback chain: requests → cloudscraper → selenium → playwright
-    try:
-        return fetch_requests(url, referer, cookie_str)
-    except Exception as e1:
-        try:
-            return fetch_cloudscraper(url, referer, cookie_str)
-        except Exception as e2:
-            try:
-                return fetch_selenium(url, referer, cookie_str)
-            except Exception as e3:
-            #     try:
-            #         return fetch_playwright(url, referer, cookie_str)
-            #    except Exception as e4:
-                    raise RuntimeError(
-                        "requests/cloudscraper/selenium failed: "
-                        f"{e1} | {e2} | {e3} "
-                    )
+def smart_fetch(
+    url: str,
+    referer: str | None,
+    cookie_str: str | None,
+    backend: str = "auto",
+    use_cache: bool = True,
+    stats: dict | None = None,
+) -> str:
+    """Flexible fetching with selectable backend; returns decoded HTML."""
+    return _decoded(smart_fetch_raw(url, referer, cookie_str, backend, use_cache, stats))
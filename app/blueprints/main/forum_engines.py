@@ -0,0 +1,265 @@
+# forum_engines.py
+"""
+Forum-engine adapters: plan every page of a paged thread/forum up front.
+
+Following "next" links means page N must be fetched before page N+1 is
+known. Most forum engines, though, put links to the last page (or a
+"Page 1 of 50" label) on the first page they serve, and number their
+pages in a predictable URL shape. An adapter recognises the shape,
+reads the last page number from the first page, and builds the URLs of
+all the pages after it, so the scanner can fetch them concurrently.
+
+Adapters, tried in order (most specific first):
+  discuz     thread-1-2-1.html, forum-3-2.html, forum.php?mod=viewthread&tid=1&page=2
+  phpbb      viewtopic.php?t=1&start=25, viewforum.php?f=2&start=50 (start is an offset)
+  vbulletin  showthread.php?t=1&page=2, forumdisplay.php?f=2&page=2, /threads/1-title/page2
+  xenforo    /threads/title.1/page-2, /forums/name.3/page-2
+  generic    any same-path ?page=N links, stepped with _bump_page_using_pairs
+When none matches, plan_pages() returns None and the caller keeps walking
+"next" links one page at a time.
+"""
+from math import gcd
+from typing import NamedTuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import re
+
+
+class PagePlan(NamedTuple):
+    engine: str
+    current: int    # page number of the page the plan was made from
+    last: int       # last page the engine reports
+    urls: list      # pages current+1 .. min(last, current+max_pages-1), in order
+
+
+class EngineAdapter:
+    """Base adapter; subclasses parse their engine's page numbering."""
+    name = ""
+    last_hint = None   # regex on the raw HTML giving the page count, e.g. "Page 1 of 50"
+
+    def locate(self, parts):
+        """(key, page number) for a URL this engine pages, else None."""
+        raise NotImplementedError
+
+    def same(self, here, there) -> bool:
+        """Do two keys name the same paged resource?"""
+        return here == there
+
+    def page_urls(self, page, cur: int, stop: int) -> list[str]:
+        return [self.page_url(page.url, n) for n in range(cur + 1, stop + 1)]
+
+    def page_url(self, url: str, n: int) -> str:
+        raise NotImplementedError
+
+    def plan(self, page, max_pages: int) -> PagePlan | None:
+        here = self.locate(urlsplit(page.url))
+        if here is None:
+            return None
+        key, cur = here
+        last = None
+        for a in page.anchors:
+            hit = self.locate(a.parts)
+            if hit is not None and self.same(key, hit[0]) and (last is None or hit[1] > last):
+                last = hit[1]
+        if last is None:
+            return None   # no links to other pages of this resource: not paged, or not this engine
+        if self.last_hint is not None:
+            m = self.last_hint.search(page.html_text)
+            if m:
+                last = max(last, int(m.group(1)))
+        stop = min(last, cur + max_pages - 1)
+        if stop <= cur:
+            return None
+        return PagePlan(self.name, cur, last, self.page_urls(page, cur, stop))
+
+
+class _PathAdapter(EngineAdapter):
+    """Page number in the path: `pattern` has head/page/tail groups, `segment` formats the page part."""
+    pattern = None
+    segment = "{}"
+
+    def locate(self, parts):
+        m = self.pattern.search(parts.path)
+        if not m:
+            return None
+        return (parts.netloc, m.group("head")), int(m.group("page") or 1)
+
+    def page_url(self, url: str, n: int) -> str:
+        s = urlsplit(url)
+        m = self.pattern.search(s.path)
+        path = s.path[:m.start()] + m.group("head") + self.segment.format(n) + m.group("tail")
+        return urlunsplit((s.scheme, s.netloc, path, s.query, ""))
+
+
+class _QueryAdapter(EngineAdapter):
+    """
+    Page number in the query string. `scripts` are the path endings this
+    engine serves pages from, `scope` parameters that must be equal (the
+    kind of page), `ids` the parameters naming the resource; links may
+    carry only some of the ids (phpBB pagers drop f=), the ones both carry
+    must agree. With `offset`, the parameter counts posts, not pages
+    (phpBB ?start=).
+    """
+    scripts = ()
+    scope = ()
+    ids = ()
+    param = "page"
+    offset = False
+
+    def _query(self, parts):
+        if not parts.path.endswith(self.scripts):
+            return None
+        q = dict(parse_qsl(parts.query, keep_blank_values=True))
+        ident = tuple((k, q[k]) for k in self.ids if k in q)
+        if not ident:
+            return None
+        return (parts.netloc, parts.path, tuple(q.get(k) for k in self.scope), ident), q
+
+    def same(self, here, there) -> bool:
+        if here[:3] != there[:3]:
+            return False
+        a, b = dict(here[3]), dict(there[3])
+        shared = a.keys() & b.keys()
+        return bool(shared) and all(a[k] == b[k] for k in shared)
+
+    def locate(self, parts):
+        hit = self._query(parts)
+        if hit is None:
+            return None
+        key, q = hit
+        try:
+            n = int(q.get(self.param) or (0 if self.offset else 1))
+        except ValueError:
+            return None
+        return key, n
+
+    def page_url(self, url: str, n: int) -> str:
+        s = urlsplit(url)
+        pairs = [(k, v) for k, v in parse_qsl(s.query, keep_blank_values=True) if k != self.param]
+        pairs.append((self.param, str(n)))
+        return urlunsplit((s.scheme, s.netloc, s.path, urlencode(pairs), ""))
+
+    def plan(self, page, max_pages: int) -> PagePlan | None:
+        if not self.offset:
+            return super().plan(page, max_pages)
+        # offsets: the step is the posts per page, i.e. the gcd of the offsets seen
+        here = self.locate(urlsplit(page.url))
+        if here is None:
+            return None
+        key, start = here
+        offsets = {a_hit[1] for a_hit in (self.locate(a.parts) for a in page.anchors)
+                   if a_hit is not None and self.same(key, a_hit[0])}
+        step = 0
+        for o in offsets | {start}:
+            step = gcd(step, o)
+        if not step or not offsets:
+            return None
+        cur, last = start // step + 1, max(offsets | {start}) // step + 1
+        stop = min(last, cur + max_pages - 1)
+        if stop <= cur:
+            return None
+        urls = [self.page_url(page.url, (n - 1) * step) for n in range(cur + 1, stop + 1)]
+        return PagePlan(self.name, cur, last, urls)
+
+
+class DiscuzThreadRewrite(_PathAdapter):
+    name = "discuz"
+    pattern = re.compile(r"(?P<head>thread-\d+-)(?P<page>\d+)(?P<tail>-\d+\.html)$")
+    last_hint = re.compile(r'title="共 (\d+) 页"')
+
+
+class DiscuzForumRewrite(_PathAdapter):
+    name = "discuz"
+    pattern = re.compile(r"(?P<head>forum-\d+-)(?P<page>\d+)(?P<tail>\.html)$")
+    last_hint = re.compile(r'title="共 (\d+) 页"')
+
+
+class DiscuzQuery(_QueryAdapter):
+    name = "discuz"
+    scripts = ("forum.php", "viewthread.php", "forumdisplay.php")
+    scope = ("mod",)
+    ids = ("tid", "fid")
+    last_hint = re.compile(r'title="共 (\d+) 页"')
+
+
+class PhpBB(_QueryAdapter):
+    name = "phpbb"
+    scripts = ("viewtopic.php", "viewforum.php")
+    ids = ("t", "f")
+    param = "start"
+    offset = True
+
+
+class VBulletinQuery(_QueryAdapter):
+    name = "vbulletin"
+    scripts = ("showthread.php", "forumdisplay.php")
+    ids = ("t", "threadid", "f", "forumid")
+    last_hint = re.compile(r">\s*Page \d+ of (\d+)\s*<")
+
+
+class VBulletinRewrite(_PathAdapter):
+    name = "vbulletin"
+    pattern = re.compile(r"(?P<head>/(?:threads|forums)/\d+[^/]*/)(?:page(?P<page>\d+))?(?P<tail>/?)$")
+    segment = "page{}"
+    last_hint = re.compile(r">\s*Page \d+ of (\d+)\s*<")
+
+
+class XenForo(_PathAdapter):
+    name = "xenforo"
+    pattern = re.compile(r"(?P<head>/(?:threads|forums)/(?:[^/]*\.)?\d+/)(?:page-(?P<page>\d+))?(?P<tail>/?)$")
+    segment = "page-{}"
+
+
+class GenericQueryPage(EngineAdapter):
+    """Same-path links carrying ?page=N; URLs are stepped with the pager's own query shape."""
+    name = "generic"
+    param = "page"
+
+    def locate(self, parts):
+        q = dict(parse_qsl(parts.query, keep_blank_values=True))
+        try:
+            n = int(q.get(self.param) or 1)
+        except ValueError:
+            return None
+        rest = frozenset((k, v) for k, v in q.items() if k != self.param)
+        return (parts.scheme, parts.netloc, parts.path, rest), n
+
+    def same(self, here, there) -> bool:
+        # same path, and the link keeps every other parameter of the current URL
+        # (index.php?topic=1&page=2 is not a page of index.php?topic=2)
+        return here[:3] == there[:3] and here[3] <= there[3]
+
+    def plan(self, page, max_pages: int) -> PagePlan | None:
+        if self.param not in urlsplit(page.url).query and not any(
+                self.param in a.parts.query for a in page.anchors):
+            return None
+        return super().plan(page, max_pages)
+
+    def page_urls(self, page, cur: int, stop: int) -> list[str]:
+        from .parser_utils import PaginationIndex, _bump_page_using_pairs
+
+        template = PaginationIndex(page.anchors, page.url, param=self.param).template
+        urls, url = [], page.url
+        for _ in range(cur + 1, stop + 1):
+            url = _bump_page_using_pairs(url, template, param=self.param)
+            urls.append(url)
+        return urls
+
+
+ADAPTERS = [
+    DiscuzThreadRewrite(), DiscuzForumRewrite(), DiscuzQuery(),
+    PhpBB(),
+    VBulletinQuery(), VBulletinRewrite(),
+    XenForo(),
+    GenericQueryPage(),
+]
+
+
+def plan_pages(page, max_pages: int) -> PagePlan | None:
+    """The first adapter's plan for the pages after `page` (a ParsedPage), or None."""
+    if max_pages < 2:
+        return None
+    for adapter in ADAPTERS:
+        plan = adapter.plan(page, max_pages)
+        if plan is not None:
+            return plan
+    return None
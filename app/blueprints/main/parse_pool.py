@@ -0,0 +1,177 @@
+# parse_pool.py
+"""
+Optional process-pool tier for the CPU-bound part of a scan.
+
+Scans run in threads of the web worker, so parsing and filtering pages
+compete for one GIL with each other and with the request handlers. With
+SCAN_PARSE_PROCESSES > 0, fetching stays in the scan's I/O threads but
+raw page bytes are shipped to worker processes, which decode, parse,
+filter and snippet them and send back a compact PageRecord (title, link
+count, matches) instead of the page. Planned pages travel in chunks of
+SCAN_PARSE_CHUNK to keep the hand-off overhead per page low.
+
+The pool is shared by all scans and started on first use. Workers are
+spawned rather than forked: forking a threaded web worker can copy held
+locks into the child.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+import multiprocessing
+import threading
+import atexit
+import time
+import os
+
+from .fetch_utils import _env_int
+from .parsed_page import ParsedPage
+from .parser_utils import decode_html, filter_links, navigate
+from .query import link_predicate
+from .snippets import SnippetIndex
+from .term_matcher import compile_terms
+
+PARSE_PROCESSES = _env_int("SCAN_PARSE_PROCESSES", 0)   # 0 = parse in the scan's own threads
+PARSE_CHUNK = _env_int("SCAN_PARSE_CHUNK", 4)           # planned pages per hand-off
+PARSE_IN_FLIGHT = _env_int("SCAN_PARSE_IN_FLIGHT", 2)   # chunks per scan queued on the pool
+
+
+class ScanSpec(NamedTuple):
+    """What a page is filtered for (the scan form), shipped to the workers with each job."""
+    keyword: str
+    sub_keyword: str
+    match_text: bool
+    match_url: bool
+    same_domain: bool
+    base_url: str
+
+
+class PageRecord(NamedTuple):
+    url: str
+    title: str | None
+    n_links: int
+    matches: list               # [(text, url, snippet)]
+    plan: object = None         # PagePlan, when the walker asked for navigation
+    next_url: str | None = None
+
+
+def scan_parsed(page: ParsedPage, spec: ScanSpec, walk=None) -> PageRecord:
+    """Filter a parsed page for `spec` and quote each match; walk: see parser_utils.navigate()."""
+    links = page.links
+    matches = filter_links(links, spec.keyword, spec.match_text, spec.match_url, spec.same_domain,
+                           base_url=spec.base_url, sub_keyword=spec.sub_keyword)
+    quoted = []
+    if matches:
+        # one scan of the visible text for all terms; each match then gets
+        # the text around its own link (anchors carry their span in page.text)
+        terms = compile_terms(link_predicate(spec.keyword, spec.sub_keyword,
+                                             spec.match_text, spec.match_url).terms)
+        snippets = SnippetIndex(page.text, terms)
+        anchor_of = {}
+        for a in page.anchors:
+            anchor_of.setdefault((a.text, a.url), a)
+        quoted = [(text, url, snippets.for_anchor(anchor_of.get((text, url)))) for text, url in matches]
+    plan = next_url = None
+    if walk is not None:
+        plan, next_url = navigate(page, *walk)
+    return PageRecord(page.url, page.title, len(links), quoted, plan, next_url)
+
+
+def _scan_chunk(spec: ScanSpec, jobs: list) -> list:
+    """Worker entry point: jobs are (url, content, encoding, walk); None for pages without HTML."""
+    out = []
+    for url, content, encoding, walk in jobs:
+        html_text = decode_html(content, encoding)
+        page = ParsedPage(html_text, url, with_text=True) if html_text else None
+        out.append(scan_parsed(page, spec, walk) if page is not None else None)
+    return out
+
+
+def _worker_init(parent: int):
+    # exit with the web worker even if it dies without running atexit (e.g. SIGKILL)
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(1)
+        os._exit(0)
+    threading.Thread(target=watch, name="parent-watch", daemon=True).start()
+
+
+class ParsePool:
+    def __init__(self, processes: int = PARSE_PROCESSES):
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=max(1, self.processes),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_worker_init, initargs=(os.getpid(),))
+            return self._executor
+
+    def submit(self, spec: ScanSpec, jobs: list):
+        try:
+            return self.executor().submit(_scan_chunk, spec, jobs)
+        except BrokenProcessPool:
+            self.close_all()   # a worker died: the next scan gets a fresh pool
+            raise
+
+    def close_all(self):
+        with self._lock:
+            ex, self._executor = self._executor, None
+        if ex is not None:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+
+PARSE_POOL = ParsePool()
+atexit.register(PARSE_POOL.close_all)
+
+
+class PoolParser:
+    """
+    iterate_forum_pages() parser that yields PageRecords built in PARSE_POOL;
+    the walker's navigation (next link, engine plan) is worked out there too.
+    """
+    def __init__(self, spec: ScanSpec, pool: ParsePool = PARSE_POOL,
+                 chunk: int = PARSE_CHUNK, in_flight: int = PARSE_IN_FLIGHT):
+        self.spec = spec
+        self.pool = pool
+        self.chunk = max(1, chunk)
+        self.in_flight = max(1, in_flight)
+
+    def _result(self, fut) -> list:
+        try:
+            return fut.result()
+        except BrokenProcessPool:
+            self.pool.close_all()
+            raise
+
+    def parse(self, url: str, resp, walk=None) -> PageRecord | None:
+        job = (url, resp.content, resp.encoding, walk)
+        return self._result(self.pool.submit(self.spec, [job]))[0]
+
+    def navigate(self, record: PageRecord, walk):
+        return record.plan, record.next_url
+
+    def parse_planned(self, fetched):
+        """Records for (url, FetchResult) pairs in order; chunks are parsed while later pages download."""
+        pending = deque()
+        chunk = []
+        try:
+            for url, resp in fetched:
+                chunk.append((url, resp.content, resp.encoding, None))
+                if len(chunk) >= self.chunk:
+                    pending.append(self.pool.submit(self.spec, chunk))
+                    chunk = []
+                # hand back what's done; block only when this scan has enough queued
+                while pending and (pending[0].done() or len(pending) > self.in_flight):
+                    yield from filter(None, self._result(pending.popleft()))
+            if chunk:
+                pending.append(self.pool.submit(self.spec, chunk))
+            while pending:
+                yield from filter(None, self._result(pending.popleft()))
+        finally:
+            for fut in pending:
+                fut.cancel()
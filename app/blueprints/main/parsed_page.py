@@ -0,0 +1,172 @@
+# parsed_page.py
+"""
+One parse per page.
+
+The scanner (pagination, matching, snippets) and the crawler (matching,
+link discovery) all want different views of the same HTML. ParsedPage
+parses it once and builds each view lazily, the first time it is asked
+for, so nothing is computed that no consumer uses.
+
+Two parser backends:
+  lxml - anchors and title come from one streaming pass (anchor_stream.py),
+         no tree is built; the default when lxml is installed
+  bs4  - BeautifulSoup with html.parser, the pure-Python fallback
+Set HTML_PARSER=bs4 to force the fallback. Both give the same link text
+and URLs, except on broken markup where html.parser departs from what
+browsers do (nested <a>, duplicate attributes, "&copy=" in a query
+string); there lxml follows the browser. A bs4 tree is still built on
+demand (page.soup, on lxml's tree builder when available) for code that
+wants one.
+"""
+from urllib.parse import urljoin, urlsplit
+import threading
+import os
+
+from bs4 import BeautifulSoup, NavigableString
+
+from .anchor_stream import Anchor, AnchorCollector, iter_anchors, etree, _INVISIBLE
+
+PARSER_BACKENDS = ("lxml", "bs4")
+_wanted = (os.environ.get("HTML_PARSER") or "lxml").strip().lower()
+PARSER_BACKEND = "lxml" if _wanted != "bs4" and etree is not None else "bs4"
+
+
+class ParsedPage:
+    """
+    with_text=True: the caller will want page.text, so the first pass
+    collects it along with the anchors, whichever is asked for first.
+    Views are built under a lock, so threads can share a page (the scan
+    pipeline paginates and parses the same page on different threads).
+    """
+
+    def __init__(self, html_text: str, url: str, parser: str | None = None, with_text: bool = False):
+        self.url = url
+        self.html_text = html_text or ""
+        self.parser = parser if parser in PARSER_BACKENDS else PARSER_BACKEND
+        self.with_text = with_text
+        self._lock = threading.RLock()
+        self._soup = None
+        self._anchors = None
+        self._title = False   # False = not computed yet (None is a valid title)
+        self._text = None
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            with self._lock:
+                if self._soup is None:
+                    builder = "lxml" if self.parser == "lxml" else "html.parser"
+                    self._soup = BeautifulSoup(self.html_text, builder)
+        return self._soup
+
+    def _stream(self, want_text: bool = False):
+        """One streaming pass: fills anchors and title (and visible text if asked)."""
+        c = AnchorCollector(want_text=want_text)
+        anchors = list(iter_anchors(self.html_text, self.url, collector=c))
+        if self._anchors is None or want_text:
+            self._anchors = anchors   # the text pass's anchors also carry their spans
+        self._title = c.title
+        if want_text:
+            self._text = " ".join(c.text_parts)
+
+    def _bs4_anchors(self, spans: dict | None = None) -> list[Anchor]:
+        resolved = {}
+        out = []
+        for a in self.soup.find_all("a", href=True):
+            href = a["href"].strip()
+            hit = resolved.get(href)
+            if hit is None:
+                url = urljoin(self.url, href)
+                hit = resolved[href] = (url, urlsplit(url))
+            attrs = {k: " ".join(v) if isinstance(v, list) else v for k, v in a.attrs.items()}
+            out.append(Anchor((a.get_text(strip=True) or "").strip(), href, hit[0], hit[1], attrs,
+                              spans.get(id(a)) if spans is not None else None))
+        return out
+
+    def _bs4_text(self):
+        """Visible text of the bs4 tree, plus each body anchor's span in it."""
+        body = self.soup.body or self.soup
+        parts, n = [], 0
+        open_anchors = []   # (element, start) of the <a href> we're inside
+        spans = {}
+
+        def close_until(el):
+            # anchors that don't contain `el` have ended
+            while open_anchors and not any(p is open_anchors[-1][0] for p in el.parents):
+                a, start = open_anchors.pop()
+                spans[id(a)] = (start, max(start, n))
+
+        for el in body.descendants:
+            close_until(el)
+            if type(el) is NavigableString:   # exact type check skips comments, doctypes and CDATA
+                if any(p.name in _INVISIBLE for p in el.parents):   # e.g. <noscript><a>..</a></noscript>
+                    continue
+                piece = " ".join(el.split())
+                if piece:
+                    n += len(piece) + (1 if parts else 0)
+                    parts.append(piece)
+            elif el.name == "a" and el.has_attr("href"):
+                open_anchors.append((el, n + (1 if parts else 0)))
+        while open_anchors:
+            a, start = open_anchors.pop()
+            spans[id(a)] = (start, max(start, n))
+        return " ".join(parts), spans
+
+    def parse(self) -> "ParsedPage":
+        """Build the views now instead of on first use (e.g. on a parser thread); returns the page."""
+        if self.with_text:
+            self.text
+        self.anchors
+        self.title
+        return self
+
+    @property
+    def anchors(self) -> list[Anchor]:
+        """Every <a href>, in document order."""
+        if self._anchors is None:
+            with self._lock:
+                if self._anchors is None:
+                    if self.with_text:
+                        self._build_text()
+                    elif self.parser == "lxml":
+                        self._stream()
+                    else:
+                        self._anchors = self._bs4_anchors()
+        return self._anchors
+
+    @property
+    def links(self) -> list[tuple[str, str]]:
+        """(text, absolute url) pairs, as extract_links() returns them."""
+        return [(a.text, a.url) for a in self.anchors]
+
+    @property
+    def title(self) -> str | None:
+        if self._title is False:
+            with self._lock:
+                if self._title is False:
+                    if self.parser == "lxml":
+                        self._stream(want_text=self.with_text and self._text is None)
+                    else:
+                        t = self.soup.title
+                        s = t.string if t is not None else None
+                        self._title = s.strip() if s else None
+        return self._title
+
+    @property
+    def text(self) -> str:
+        """
+        Visible text: no scripts, styles or comments, whitespace collapsed.
+        Once it's built, page.anchors carry their span in it.
+        """
+        if self._text is None:
+            with self._lock:
+                if self._text is None:
+                    self._build_text()
+        return self._text
+
+    def _build_text(self):
+        if self.parser == "lxml":
+            self._stream(want_text=True)
+        else:
+            self._text, spans = self._bs4_text()
+            self._anchors = self._bs4_anchors(spans)
@@ -1,30 +1,101 @@
 # parser_utils.py
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urlparse
 from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor
+import codecs
 import time
 import html
 import re
 
-from .fetch_utils import smart_fetch
+from .fetch_utils import smart_fetch_raw, merge_stats, _env_int
+from .forum_engines import plan_pages
+from .parsed_page import ParsedPage, PARSER_BACKEND
+from .anchor_stream import Anchor, iter_anchors
+from .query import compile_query, link_predicate
+from .canonical_url import canonical_url
+from .rate_limit import RATE_LIMITER, rate_from_pause
+
+
+# ---------- Decoding (bytes from the fetch layer -> str) ----------
+
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]{0,200}?charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.I)
+_XML_ENCODING_RE = re.compile(rb"""^<\?xml[^>]{0,200}?encoding\s*=\s*["']([a-zA-Z0-9_.:-]+)""")
+_BOMS = ((codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16-le"), (codecs.BOM_UTF16_BE, "utf-16-be"))
+# labels browsers treat as supersets (WHATWG encoding spec)
+_ENCODING_ALIASES = {"gb2312": "gb18030", "gbk": "gb18030", "x-gbk": "gb18030",
+                     "iso-8859-1": "cp1252", "latin1": "cp1252", "latin-1": "cp1252",
+                     "us-ascii": "cp1252", "ascii": "cp1252", "big5": "big5hkscs",
+                     "shift_jis": "cp932", "sjis": "cp932", "euc-kr": "cp949"}
+
+
+def charset_from_content_type(content_type: str | None) -> str | None:
+    """The charset parameter of a Content-Type header, if any."""
+    for part in (content_type or "").split(";")[1:]:
+        k, _, v = part.strip().partition("=")
+        if k.lower() == "charset" and v:
+            return v.strip().strip("\"'") or None
+    return None
+
+
+def sniff_charset(head: bytes) -> str | None:
+    """<meta charset> / http-equiv / <?xml encoding?> from the first few KB."""
+    m = _XML_ENCODING_RE.search(head) or _META_CHARSET_RE.search(head)
+    return m.group(1).decode("ascii", "ignore") if m else None
+
+
+def _codec(label: str | None) -> str | None:
+    if not label:
+        return None
+    label = label.strip().lower()
+    label = _ENCODING_ALIASES.get(label, label)
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def decode_html(content: bytes | str, declared: str | None = None) -> str:
+    """
+    Decode a page the way a browser picks its charset:
+    BOM, then the HTTP charset, then a sniffed <meta charset>, then strict
+    UTF-8. Statistical detection only runs for pages that declare nothing
+    and aren't UTF-8; cp1252 (which never fails) is the last resort.
+    """
+    if isinstance(content, str):
+        return content
+    for bom, enc in _BOMS:
+        if content.startswith(bom):
+            return content[len(bom):].decode(enc, errors="replace")
+    enc = _codec(declared) or _codec(sniff_charset(content[:4096]))
+    if enc:
+        return content.decode(enc, errors="replace")
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    from charset_normalizer import from_bytes
+    guess = from_bytes(content[:65536]).best()
+    return content.decode(_codec(guess.encoding if guess else None) or "cp1252", errors="replace")
 
 
 # ---------- Link extraction & filtering ----------
 
 def extract_links(html_text: str, base_url: str):
-    soup = BeautifulSoup(html_text, "html.parser")
-    links = []
-    for a in soup.find_all("a", href=True):
-        text = (a.get_text(strip=True) or "").strip()
-        href = a["href"].strip()
-        abs_url = urljoin(base_url, href)
-        links.append((text, abs_url))
-    return links
+    """(text, absolute url) for every <a href>. Callers holding a ParsedPage should use .links."""
+    if PARSER_BACKEND == "lxml":
+        # streaming: no tree is built for a one-off extraction
+        return [(a.text, a.url) for a in iter_anchors(html_text, base_url)]
+    return ParsedPage(html_text, base_url).links
 
 
 def filter_links(links, keyword: str, match_in_text: bool = True, match_in_url: bool = True,
-                 same_domain_only: bool = False, base_url: str = ""):
-    kw = (keyword or "").lower()
+                 same_domain_only: bool = False, base_url: str = "", sub_keyword: str = ""):
+    """
+    Links matching the keyword and, if given, the refine query (see
+    query.py), deduplicated by canonical URL (canonical_url.py). An empty
+    keyword matches everything.
+    """
+    match = link_predicate(keyword or "", sub_keyword or "", match_in_text, match_in_url).match
     out = []
     seen = set()
     base_host = urlparse(base_url).netloc.lower() if same_domain_only and base_url else None
@@ -32,45 +103,27 @@ def filter_links(links, keyword: str, match_in_text: bool = True, match_in_url:
     for text, url in links:
         if same_domain_only and base_host and urlparse(url).netloc.lower() != base_host:
             continue
-        ok_text = match_in_text and kw in (text or "").lower()
-        ok_url = match_in_url and kw in url.lower()
-        if ok_text or ok_url:
-            if url not in seen:
-                seen.add(url)
+        if match(text, url):
+            key = canonical_url(url) or url
+            if key not in seen:
+                seen.add(key)
                 out.append((text, url))
     return out
 
 
 def subfilter_links(pairs, sub_kw, match_text=True, match_url=True):
     """
-    Refine results using sub-keywords.
-    - Comma (,) separates OR terms: any match passes
-    - Plus (+) separates AND terms: all must match
-      e.g. 'jewish, israel' → OR
-           'jewish + israel' → AND
+    Refine results with a query (query.py): ',' / OR and '+' / AND as
+    before, plus NOT, (grouping), "phrases", url:/text: and re:.
+      e.g. 'jewish, israel'         → either
+           'jewish + israel'        → both
+           'guide, tutorial -video' → guide, or tutorial without video
+    Raises QuerySyntaxError for a malformed query.
     """
     if not sub_kw:
         return pairs
-
-    require_all = "+" in sub_kw and "," not in sub_kw
-    terms = [t.strip().lower() for t in re.split(r"[,+]", sub_kw) if t.strip()]
-    if not terms:
-        return pairs
-
-    def hit(s: str) -> bool:
-        s_l = (s or "").lower()
-        if require_all:
-            return all(term in s_l for term in terms)
-        else:
-            return any(term in s_l for term in terms)
-
-    out = []
-    for text, url in pairs:
-        t_ok = match_text and hit(text)
-        u_ok = match_url and hit(url)
-        if t_ok or u_ok:
-            out.append((text, url))
-    return out
+    match = compile_query(sub_kw, match_text, match_url).match
+    return [(text, url) for text, url in pairs if match(text, url)]
 
 
 # --- in parser_utils.py ---
@@ -99,22 +152,83 @@ def render_results_html(links, source_url: str, keyword: str) -> str:
 
 # ---------- Pagination helpers (robust for query-string + Discuz!) ----------
 
-def find_next_page_url(soup: BeautifulSoup, base_url: str) -> str | None:
-    """Try common 'next page' anchor patterns first (Discuz! etc.)."""
-    a = soup.find("a", rel=lambda v: v and "next" in v.lower())
-    if a and a.get("href"):
-        return urljoin(base_url, a["href"].strip())
+_NEXT_TEXTS = ("Next", "next", "下一页", "›", ">")   # in order of preference
 
-    a = soup.find("a", class_=lambda c: c and "nxt" in c)
-    if a and a.get("href"):
-        return urljoin(base_url, a["href"].strip())
 
-    for txt in ("Next", "next", "下一页", "›", ">"):
-        a = soup.find("a", string=lambda s: s and txt in s)
-        if a and a.get("href"):
-            return urljoin(base_url, a["href"].strip())
+class PaginationIndex:
+    """
+    Pagination candidates of a page, classified in ONE pass over its anchors:
+      rel_next     first <a rel="next">
+      class_nxt    first <a class="...nxt..."> (Discuz!)
+      by_text      first anchor whose text contains each of _NEXT_TEXTS
+      query_next   first same-path anchor whose ?page equals current+1
+      template     query pairs of the first same-path anchor carrying ?page
+    `anchors` is ParsedPage.anchors (or iter_anchors output) for base_url.
+    """
 
-    return None
+    def __init__(self, anchors: list[Anchor], base_url: str, param: str = "page"):
+        self.rel_next = None
+        self.class_nxt = None
+        self.by_text = {}
+        self.query_next = None
+        self.template = None
+
+        b = urlsplit(base_url)
+        base_key = (b.scheme, b.netloc, b.path)
+        target = _current_page_number(base_url, param=param) + 1
+        queries = {}   # query string -> parse_qsl pairs; pagination links repeat
+
+        for a in anchors:
+            if a.href and self.rel_next is None:
+                if "next" in (a.attrs.get("rel") or "").lower():
+                    self.rel_next = a.url   # outranks class and text
+                else:
+                    if self.class_nxt is None and "nxt" in (a.attrs.get("class") or ""):
+                        self.class_nxt = a.url
+                    if len(self.by_text) < len(_NEXT_TEXTS):
+                        for txt in _NEXT_TEXTS:
+                            if txt not in self.by_text and txt in a.text:
+                                self.by_text[txt] = a.url
+
+            if self.query_next is not None and self.template is not None:
+                if self.rel_next is not None:
+                    break   # every question is answered
+                continue
+            s = a.parts
+            if param in s.query and (s.scheme, s.netloc, s.path) == base_key:
+                pairs = queries.get(s.query)
+                if pairs is None:
+                    pairs = queries[s.query] = parse_qsl(s.query, keep_blank_values=True)
+                if self.template is None and any(k == param for k, _ in pairs):
+                    self.template = pairs
+                if self.query_next is None:
+                    try:
+                        if int(dict(pairs).get(param) or "") == target:
+                            self.query_next = urlunsplit(s)
+                    except ValueError:
+                        pass
+
+    @property
+    def link_next(self) -> str | None:
+        """The page's own 'next' link: rel, then class, then link text."""
+        if self.rel_next or self.class_nxt:
+            return self.rel_next or self.class_nxt
+        for txt in _NEXT_TEXTS:
+            if txt in self.by_text:
+                return self.by_text[txt]
+        return None
+
+    @property
+    def next_url(self) -> str | None:
+        return self.link_next or self.query_next
+
+
+def find_next_page_url(anchors: list[Anchor], base_url: str) -> str | None:
+    """
+    Try common 'next page' anchor patterns first (Discuz! etc.).
+    `anchors` is ParsedPage.anchors (or iter_anchors output) for base_url.
+    """
+    return PaginationIndex(anchors, base_url).link_next
 
 
 def _current_page_number(url: str, param: str = "page") -> int:
@@ -126,52 +240,22 @@ def _current_page_number(url: str, param: str = "page") -> int:
         return 1
 
 
-def _same_path(u1: str, u2: str) -> bool:
-    a, b = urlsplit(u1), urlsplit(u2)
-    return (a.scheme == b.scheme) and (a.netloc == b.netloc) and (a.path == b.path)
-
-
-def _find_next_by_query_page(soup, base_url: str, param: str = "page") -> str | None:
+def _find_next_by_query_page(anchors: list[Anchor], base_url: str, param: str = "page") -> str | None:
     """
     Look for an <a> on the SAME PATH whose ?page equals current+1.
     This handles cases where page=1 has no explicit 'next' text but numbered anchors exist.
     """
-    s_base = urlsplit(base_url)
-    cur = _current_page_number(base_url, param=param)
-    target = cur + 1
-
-    for a in soup.find_all("a", href=True):
-        href = a["href"].strip()
-        candidate = urljoin(base_url, href)
-        s = urlsplit(candidate)
-        if not _same_path(base_url, candidate):
-            continue
-        q = dict(parse_qsl(s.query, keep_blank_values=True))
-        try:
-            if int((q.get(param) or "")) == target:
-                return urlunsplit((s.scheme, s.netloc, s.path, s.query, s.fragment))
-        except ValueError:
-            continue
-    return None
+    return PaginationIndex(anchors, base_url, param=param).query_next
 
 
-def _extract_pagination_template_pairs(soup, base_url: str, param: str = "page") -> list[tuple[str, str]] | None:
+def _extract_pagination_template_pairs(anchors: list[Anchor], base_url: str,
+                                       param: str = "page") -> list[tuple[str, str]] | None:
     """
     Find any same-path anchor that contains a ?page=... param and return its
     QUERY PAIRS (ordered, with blank values preserved). We use this as a template
     for building synthetic next-page URLs that match the site's expected shape.
     """
-    s_base = urlsplit(base_url)
-    for a in soup.find_all("a", href=True):
-        href = a["href"].strip()
-        candidate = urljoin(base_url, href)
-        s = urlsplit(candidate)
-        if not _same_path(base_url, candidate):
-            continue
-        pairs = parse_qsl(s.query, keep_blank_values=True)
-        if any(k == param for k, _ in pairs):
-            return pairs
-    return None
+    return PaginationIndex(anchors, base_url, param=param).template
 
 
 def _bump_page_using_pairs(current_url: str, template_pairs: list[tuple[str, str]] | None,
@@ -225,19 +309,108 @@ def _bump_page_using_pairs(current_url: str, template_pairs: list[tuple[str, str
 
 # ---------- Page iterator (uses all of the above) ----------
 
+SCAN_FAN_OUT = _env_int("SCAN_FAN_OUT", 4)   # planned pages fetched at once (pacing still per host)
+
+
+def _fetch_planned(urls: list[str], referer: str | None, cookies_raw: str | None, backend: str,
+                   use_cache: bool, fetch_stats: dict | None):
+    """Fetch the pages of a PagePlan concurrently; yield (url, FetchResult) in plan order."""
+    def fetch(url):
+        part = {}   # this thread's counters; merged below, in the consuming thread
+        resp = smart_fetch_raw(url, referer, cookies_raw, backend=backend,
+                               use_cache=use_cache, stats=part)
+        return resp, part
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(SCAN_FAN_OUT, len(urls))),
+                              thread_name_prefix="scan-fetch")
+    futures = [pool.submit(fetch, u) for u in urls]
+    try:
+        for url, fut in zip(urls, futures):
+            resp, part = fut.result()
+            merge_stats(fetch_stats, part)
+            yield url, resp
+    finally:
+        # consumer stopped early or a fetch failed: drop what hasn't started
+        for fut in futures:
+            fut.cancel()
+        pool.shutdown(wait=False)
+
+
+def navigate(page, pages_left: int, want_plan: bool):
+    """
+    (plan, next_url) for the walker, from a parsed page: an engine adapter's
+    PagePlan if asked for and one matches, else the next page to walk to.
+    """
+    plan = plan_pages(page, pages_left) if want_plan else None
+    if plan is not None:
+        return plan, None
+    # one pass over the anchors answers all of:
+    # 1) common 'next' anchors, 2) a same-path numbered link where page == current+1,
+    # 3) a query template learned from any same-path pagination anchor
+    pagination = PaginationIndex(page.anchors, page.url, param="page")
+    # 4) If still no next, synthesize by bumping page with the learned template
+    next_url = pagination.next_url or _bump_page_using_pairs(page.url, pagination.template, param="page")
+    return None, next_url
+
+
+class LocalParser:
+    """
+    The walker's default parser: pages are parsed in the scan's own
+    threads, and the walker reads their anchors itself. parse_pool.PoolParser
+    has the same methods and parses in worker processes instead.
+    """
+    def __init__(self, with_text: bool = False):
+        self.with_text = with_text
+
+    def parse(self, url: str, resp, walk=None):
+        """A ParsedPage for a fetched page, or None if it has no HTML. walk: see navigate()."""
+        html_text = decode_html(resp.content, resp.encoding)
+        return ParsedPage(html_text, url, with_text=self.with_text) if html_text else None
+
+    def navigate(self, page, walk):
+        """walk = (pages_left, want_plan), as given to parse()."""
+        return navigate(page, *walk)
+
+    def parse_planned(self, fetched):
+        """Pages for (url, FetchResult) pairs, in order, skipping those without HTML."""
+        for url, resp in fetched:
+            page = self.parse(url, resp)
+            if page is not None:
+                yield page
+
+
 def iterate_forum_pages(start_url: str, max_pages: int, referer: str | None,
                         cookies_raw: str | None, backend: str = "auto",
-                        pause_seconds: float = 0.5):
+                        pause_seconds: float = 0.5, use_cache: bool = True,
+                        fetch_stats: dict | None = None, with_text: bool = False,
+                        parser=None):
     """
-    Yield (page_url, html_text, soup) following next/numbered links.
+    Yield a ParsedPage per page, following next/numbered links.
+    page.url is where the page ended up after redirects; the page is parsed
+    once here and its anchors/title/text are reused by the caller.
     Robust to 'page' query-style pagination and preserves query shape (incl. blank values).
+
+    If a forum-engine adapter (forum_engines.py) recognises the first page
+    and reads its page count, the remaining pages are fetched concurrently
+    (SCAN_FAN_OUT at a time, within the host's rate limit) and yielded in
+    page order; otherwise "next" links are followed one page at a time.
+
+    Response-cache counters and fetch timings are accumulated into `fetch_stats`
+    if given, along with "engine" and "pages_planned" when an adapter matched.
+    with_text: the caller wants page.text; parse it in the same pass as the anchors.
+    parser: how fetched pages become what is yielded (LocalParser by default;
+    parse_pool.PoolParser yields PageRecords parsed in worker processes).
     """
+    parser = parser or LocalParser(with_text=with_text)
     visited = set()
     current_url = start_url
     empty_streak = 0
+    planned = False
+    # pacing is per host and shared with other scans; pause_seconds sets the target rate
+    RATE_LIMITER.configure(start_url, target_rate=rate_from_pause(pause_seconds))
     MAX_EMPTY = 2  # don't spin forever if blocked/thin HTML
 
-    for _ in range(max_pages):
+    for attempt in range(max_pages):
         if current_url in visited:
             break
         visited.add(current_url)
@@ -245,26 +418,40 @@ def iterate_forum_pages(start_url: str, max_pages: int, referer: str | None,
         # Polite first-hop referer: use the origin of start_url if none provided
         effective_referer = referer or (start_url.rsplit("/", 1)[0] + "/")
 
-        html_text = smart_fetch(current_url, effective_referer, cookies_raw, backend=backend)
+        resp = smart_fetch_raw(current_url, effective_referer, cookies_raw, backend=backend,
+                               use_cache=use_cache, stats=fetch_stats)
+        if resp.url and resp.url != current_url:
+            # redirected (e.g. page past the end -> last page): continue from where we landed
+            if resp.url in visited:
+                break
+            current_url = resp.url
+            visited.add(current_url)
 
-        if html_text:
+        # the first page tells an adapter how many there are; it only plans once
+        walk = (max_pages - attempt, not planned)
+        page = parser.parse(current_url, resp, walk)
+        if page is not None:
             empty_streak = 0
-            soup = BeautifulSoup(html_text, "html.parser")
-            yield current_url, html_text, soup
-
-            # 1) Common 'next' anchors
-            next_url = find_next_page_url(soup, current_url)
-
-            # 2) Same-path numbered link where page == current+1
-            if not next_url:
-                next_url = _find_next_by_query_page(soup, current_url, param="page")
-
-            # 3) Learn a query template from any same-path pagination anchor
-            template_pairs = _extract_pagination_template_pairs(soup, current_url, param="page")
-
-            # 4) If still no next, synthesize by bumping page with the learned template
-            if not next_url:
-                next_url = _bump_page_using_pairs(current_url, template_pairs, param="page")
+            yield page
+
+            plan, next_url = parser.navigate(page, walk)
+            planned = True
+            if plan is not None:
+                if fetch_stats is not None:
+                    fetch_stats["engine"] = plan.engine
+                    fetch_stats["pages_planned"] = len(plan.urls) + 1
+
+                def fresh():
+                    for url, resp in _fetch_planned(plan.urls, effective_referer, cookies_raw,
+                                                    backend, use_cache, fetch_stats):
+                        final_url = resp.url or url
+                        if url in visited or final_url in visited:
+                            continue   # e.g. a page past the end redirected back to one we have
+                        visited.update((url, final_url))
+                        yield final_url, resp
+
+                yield from parser.parse_planned(fresh())
+                return
         else:
             # No HTML — try a limited number of synthetic bumps, then stop
             empty_streak += 1
@@ -276,5 +463,3 @@ def iterate_forum_pages(start_url: str, max_pages: int, referer: str | None,
             break
 
         current_url = next_url
-        if pause_seconds > 0:
-            time.sleep(pause_seconds)
@@ -0,0 +1,104 @@
+# pipeline.py
+"""
+A bounded producer/consumer pipeline on threads.
+
+The source iterable runs in its own thread and every stage in another,
+handing items on through bounded queues. A slow stage fills its input
+queue and the stages before it block (backpressure) instead of piling
+work up in memory. With one thread per stage, items come out in the
+order the source produced them.
+
+An exception in the source or a stage travels down the pipe and is
+raised in the consumer; a consumer that stops early stops the threads.
+"""
+import threading
+import queue
+
+_DONE = object()
+_POLL = 0.1   # seconds; how often a blocked thread checks for a stop
+
+
+class _Failed:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+class Pipeline:
+    def __init__(self, source, stages, maxsize: int = 4, name: str = "pipeline"):
+        """source: any iterable; stages: [(name, fn)] applied in order, fn(item) -> item."""
+        self.source = source
+        self.stages = list(stages)
+        self.name = name
+        # queues[i] feeds stage i; the last one feeds the consumer
+        self.queues = [queue.Queue(max(1, maxsize)) for _ in range(len(self.stages) + 1)]
+        self._stop = threading.Event()
+
+    def depths(self) -> dict:
+        """Items waiting in front of each stage (and of the consumer, as "results")."""
+        names = [n for n, _ in self.stages] + ["results"]
+        return {n: q.qsize() for n, q in zip(names, self.queues)}
+
+    def _put(self, q, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _produce(self):
+        out = self.queues[0]
+        it = iter(self.source)
+        try:
+            for item in it:
+                if not self._put(out, item):
+                    return
+        except BaseException as e:
+            self._put(out, _Failed(e))
+            return
+        finally:
+            close = getattr(it, "close", None)
+            if close:
+                close()   # a generator source gets to clean up (e.g. cancel its fetches)
+        self._put(out, _DONE)
+
+    def _work(self, i: int, fn):
+        inq, out = self.queues[i], self.queues[i + 1]
+        while True:
+            item = self._get(inq)
+            if item is _DONE or isinstance(item, _Failed):
+                self._put(out, item)
+                return
+            try:
+                result = fn(item)
+            except BaseException as e:
+                self._put(out, _Failed(e))
+                return
+            if not self._put(out, result):
+                return
+
+    def __iter__(self):
+        threads = [threading.Thread(target=self._produce, name=f"{self.name}-source", daemon=True)]
+        threads += [threading.Thread(target=self._work, args=(i, fn), name=f"{self.name}-{n}", daemon=True)
+                    for i, (n, fn) in enumerate(self.stages)]
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                item = self._get(self.queues[-1])
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failed):
+                    raise item.exc
+                yield item
+        finally:
+            self._stop.set()
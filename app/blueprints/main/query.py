@@ -0,0 +1,398 @@
+# query.py
+"""
+Link filter queries.
+
+The refine box takes a small boolean language, parsed once into a
+predicate tree and compiled to closures:
+
+  a, b   a OR b    either term             (',' and '|' also mean OR)
+  a + b  a AND b   both terms              ('&' also means AND)
+  NOT a  -a        term absent
+  ( ... )          grouping; NOT binds tightest, then AND, then OR
+  "a, b"           quoted phrase, taken literally (operators included)
+  url:a  text:a    look in that field only
+  re:pat           regular expression (url:re:pat, re:"a(b|c)" ...)
+
+Anything else is a literal, case-insensitive substring. Adjacent bare
+words form one phrase, as in the old comma/plus syntax ("new york, boston"
+is two terms); other adjacent atoms are ANDed. Only the upper-case
+AND/OR/NOT are operators, and only url:, text: and re: are prefixes, so
+"author:jack" is just text.
+
+Unscoped terms look in the fields the scan matches on (match_text /
+match_url). Children of AND/OR are evaluated cheapest first (literals
+before regexes) and short-circuit; literals ORed together on the same
+fields are folded into one TermMatcher pass.
+"""
+from functools import lru_cache
+import re
+
+from .term_matcher import compile_terms
+
+TEXT, URL = 0, 1
+_FIELDS = {"text": TEXT, "url": URL}
+_OPERATORS = {"AND": "and", "&": "and", "+": "and", "OR": "or", "|": "or", ",": "or", "NOT": "not"}
+_PUNCT = "()+,|&\""
+
+# rough per-field costs; only the order matters
+_LITERAL_COST = 1.0
+_MATCHER_COST = 1.5
+_REGEX_COST = 8.0
+
+
+class QuerySyntaxError(ValueError):
+    """The query can't be parsed; the message says where."""
+
+
+class _Node:
+    cost = 0.0
+    fields = frozenset()   # fields the node reads
+
+    def compile(self):
+        raise NotImplementedError
+
+    def literals(self):
+        """Literal terms that count towards a match (not under NOT), in query order."""
+        return []
+
+
+class _Never(_Node):
+    def compile(self):
+        return lambda t, u: False
+
+
+class _Literal(_Node):
+    def __init__(self, term: str, fields):
+        self.term = term.lower()
+        self.fields = frozenset(fields)
+        self.cost = _LITERAL_COST * len(self.fields)
+
+    def compile(self):
+        s = self.term
+        if self.fields == {TEXT}:
+            return lambda t, u: s in t
+        if self.fields == {URL}:
+            return lambda t, u: s in u
+        return lambda t, u: s in t or s in u
+
+    def literals(self):
+        return [self.term]
+
+
+class _AnyOf(_Node):
+    """Several literals on the same fields, ORed: one matcher pass per field."""
+
+    def __init__(self, terms, fields):
+        self.terms = terms
+        self.fields = frozenset(fields)
+        self.cost = _MATCHER_COST * len(self.fields)
+
+    def compile(self):
+        hit = compile_terms(tuple(self.terms)).any_in
+        if self.fields == {TEXT}:
+            return lambda t, u: hit(t)
+        if self.fields == {URL}:
+            return lambda t, u: hit(u)
+        return lambda t, u: hit(t) or hit(u)
+
+    def literals(self):
+        return list(self.terms)
+
+
+class _Regex(_Node):
+    def __init__(self, pattern: str, fields):
+        try:
+            self.search = re.compile(pattern, re.IGNORECASE).search
+        except re.error as e:
+            raise QuerySyntaxError(f"bad regular expression {pattern!r}: {e}") from None
+        self.fields = frozenset(fields)
+        self.cost = _REGEX_COST * len(self.fields)
+
+    def compile(self):
+        search = self.search
+        if self.fields == {TEXT}:
+            return lambda t, u: search(t) is not None
+        if self.fields == {URL}:
+            return lambda t, u: search(u) is not None
+        return lambda t, u: search(t) is not None or search(u) is not None
+
+
+class _Not(_Node):
+    def __init__(self, child: _Node):
+        self.child = child
+        self.fields = child.fields
+        self.cost = child.cost
+
+    def compile(self):
+        f = self.child.compile()
+        return lambda t, u: not f(t, u)
+
+
+class _And(_Node):
+    def __init__(self, children):
+        self.given = list(children)
+        self.children = sorted(children, key=lambda c: c.cost)   # stable: ties keep query order
+        self.fields = frozenset().union(*(c.fields for c in children))
+        self.cost = sum(c.cost for c in children)
+
+    def compile(self):
+        fs = [c.compile() for c in self.children]
+        if len(fs) == 2:
+            a, b = fs
+            return lambda t, u: a(t, u) and b(t, u)
+        return lambda t, u: all(f(t, u) for f in fs)
+
+    def literals(self):
+        return [t for c in self.given for t in c.literals()]
+
+
+class _Or(_Node):
+    def __init__(self, children):
+        self.given = list(children)
+        # fold plain literals that look at the same fields into one matcher
+        groups, rest = {}, []
+        for c in children:
+            if type(c) is _Literal:
+                groups.setdefault(c.fields, []).append(c.term)
+            else:
+                rest.append(c)
+        for fields, terms in groups.items():
+            rest.append(_Literal(terms[0], fields) if len(terms) == 1 else _AnyOf(terms, fields))
+        self.children = sorted(rest, key=lambda c: c.cost)
+        self.fields = frozenset().union(*(c.fields for c in self.children))
+        self.cost = sum(c.cost for c in self.children)
+
+    def compile(self):
+        fs = [c.compile() for c in self.children]
+        if len(fs) == 1:
+            return fs[0]
+        if len(fs) == 2:
+            a, b = fs
+            return lambda t, u: a(t, u) or b(t, u)
+        return lambda t, u: any(f(t, u) for f in fs)
+
+    def literals(self):
+        return [t for c in self.given for t in c.literals()]
+
+
+def _tokens(query: str):
+    """
+    Yield (kind, value, scope, pos). kind is "(", ")", "and", "or", "not",
+    "word", "phrase" or "regex"; scope is the url:/text: field or None.
+    """
+    i, n = 0, len(query)
+    while i < n:
+        ch = query[i]
+        if ch.isspace():
+            i += 1
+            continue
+        pos = i
+        if ch in "()":
+            yield ch, ch, None, pos
+            i += 1
+            continue
+        if ch in "+,|&":
+            yield _OPERATORS[ch], ch, None, pos
+            i += 1
+            continue
+        if ch == "-" and i + 1 < n and not query[i + 1].isspace() and query[i + 1] not in "+,|&)":
+            yield "not", ch, None, pos
+            i += 1
+            continue
+
+        # url:, text:, re: prefixes
+        scope, is_re = None, False
+        m = re.match(r"(url|text):", query[i:], re.IGNORECASE)
+        if m:
+            scope = _FIELDS[m.group(1).lower()]
+            i += m.end()
+        if query[i:i + 3].lower() == "re:":
+            is_re = True
+            i += 3
+
+        if i < n and query[i] == '"':
+            end = query.find('"', i + 1)
+            if end == -1:
+                raise QuerySyntaxError(f"unclosed quote at position {i + 1}")
+            value, quoted = query[i + 1:end], True
+            i = end + 1
+        else:
+            start = i
+            while i < n and not query[i].isspace() and query[i] not in _PUNCT:
+                i += 1
+            value, quoted = query[start:i], False
+            if not value:
+                raise QuerySyntaxError(f"missing term after prefix at position {pos + 1}")
+            if not is_re and scope is None and value in _OPERATORS:
+                yield _OPERATORS[value], value, None, pos
+                continue
+        kind = "regex" if is_re else ("phrase" if quoted or scope is not None else "word")
+        yield kind, value, scope, pos
+
+
+def _drop_stray_operators(toks):
+    """
+    Drop AND/OR with nothing on one side ("a,", "a,,b", "(+a)"); the old
+    comma/plus syntax ignored empty terms, so these stay valid.
+    """
+    out = []
+    for j, tok in enumerate(toks):
+        if tok[0] in ("and", "or"):
+            nxt = toks[j + 1] if j + 1 < len(toks) else None
+            if not out or out[-1][0] in ("(", "not", "and", "or") or not nxt or nxt[0] in (")", "and", "or"):
+                continue
+        out.append(tok)
+    return out
+
+
+class _Parser:
+    def __init__(self, query: str, default_fields):
+        self.toks = _drop_stray_operators(list(_tokens(query)))
+        self.i = 0
+        self.default = frozenset(default_fields)
+
+    def peek(self):
+        return self.toks[self.i] if self.i < len(self.toks) else None
+
+    def take(self):
+        tok = self.toks[self.i]
+        self.i += 1
+        return tok
+
+    def parse(self) -> _Node:
+        node = self.or_expr()
+        tok = self.peek()
+        if tok is not None:
+            raise QuerySyntaxError(f"unexpected {tok[1]!r} at position {tok[3] + 1}")
+        return node
+
+    def or_expr(self):
+        children = [self.and_expr()]
+        while self.peek() and self.peek()[0] == "or":
+            self.take()
+            children.append(self.and_expr())
+        return children[0] if len(children) == 1 else _Or(children)
+
+    def and_expr(self):
+        children = [self.not_expr()]
+        while True:
+            tok = self.peek()
+            if tok and tok[0] == "and":
+                self.take()
+            elif not tok or tok[0] in ("or", ")"):
+                break
+            # anything else right after an atom: implicit AND
+            children.append(self.not_expr())
+        return children[0] if len(children) == 1 else _And(children)
+
+    def not_expr(self):
+        tok = self.peek()
+        if tok and tok[0] == "not":
+            self.take()
+            return _Not(self.not_expr())
+        return self.atom()
+
+    def atom(self):
+        tok = self.peek()
+        if tok is None:
+            raise QuerySyntaxError("query ends where a term was expected")
+        kind, value, scope, pos = self.take()
+        if kind == "(":
+            node = self.or_expr()
+            close = self.peek()
+            if not close or close[0] != ")":
+                raise QuerySyntaxError(f"unclosed '(' at position {pos + 1}")
+            self.take()
+            return node
+        if kind not in ("word", "phrase", "regex"):
+            raise QuerySyntaxError(f"unexpected {value!r} at position {pos + 1}")
+
+        fields = {scope} if scope is not None else self.default
+        if not fields:
+            return _Never()
+        if kind == "regex":
+            return _Regex(value, fields)
+        if kind == "word":
+            # bare words run together into one phrase, like the old syntax
+            words = [value]
+            while self.peek() and self.peek()[0] == "word":
+                words.append(self.take()[1])
+            value = " ".join(words)
+        if not value.strip():
+            raise QuerySyntaxError(f"empty phrase at position {pos + 1}")
+        return _Literal(value, fields)
+
+
+class LinkQuery:
+    """Compiled query; call it with (text, url)."""
+
+    def __init__(self, node: _Node | None, source: str = ""):
+        self.source = source
+        self.node = node
+        self.match = _bind(node)
+
+    def __bool__(self):
+        return self.node is not None
+
+    def __call__(self, text: str | None, url: str | None) -> bool:
+        return self.match(text, url)
+
+    @property
+    def terms(self) -> tuple:
+        """Positive literal terms, in query order (for snippets/highlighting)."""
+        if not self.node:
+            return ()
+        return tuple(dict.fromkeys(self.node.literals()))
+
+
+def _bind(node: _Node | None):
+    """match(text, url) for a node: lower-cases only the fields the query reads."""
+    if node is None:
+        return lambda text, url: True   # empty query keeps everything
+    if type(node) is _Literal and len(node.fields) == 2:
+        # the common plain-keyword case, inlined; the url is only lowered if the text misses
+        s = node.term
+        return lambda text, url: s in (text or "").lower() or s in (url or "").lower()
+    f = node.compile()
+    if node.fields == {TEXT}:
+        return lambda text, url: f((text or "").lower(), "")
+    if node.fields == {URL}:
+        return lambda text, url: f("", (url or "").lower())
+    return lambda text, url: f((text or "").lower(), (url or "").lower())
+
+
+def _default_fields(match_text: bool, match_url: bool):
+    return [f for f, on in ((TEXT, match_text), (URL, match_url)) if on]
+
+
+def _parse(query: str, match_text: bool, match_url: bool) -> _Node | None:
+    if not (query or "").strip():
+        return None
+    return _Parser(query, _default_fields(match_text, match_url)).parse()
+
+
+@lru_cache(maxsize=64)
+def compile_query(query: str, match_text: bool = True, match_url: bool = True) -> LinkQuery:
+    """Parse and compile a refine query; raises QuerySyntaxError. Cached per query string."""
+    return LinkQuery(_parse(query, match_text, match_url), query)
+
+
+@lru_cache(maxsize=64)
+def link_predicate(keyword: str, sub_keyword: str = "", match_text: bool = True,
+                   match_url: bool = True) -> LinkQuery:
+    """
+    The whole link filter of a scan or crawl: the keyword as a plain
+    substring, AND the refine query. An empty keyword matches everything.
+    """
+    fields = _default_fields(match_text, match_url)
+    kw = (keyword or "").strip()
+    parts = []
+    if kw:
+        parts.append(_Literal(kw, fields) if fields else _Never())
+    sub = _parse(sub_keyword, match_text, match_url)
+    if sub is not None:
+        parts.append(sub)
+    if not parts:
+        return LinkQuery(None)
+    return LinkQuery(parts[0] if len(parts) == 1 else _And(parts),
+                     " + ".join(p for p in (kw, sub_keyword) if p))
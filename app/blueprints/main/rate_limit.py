@@ -0,0 +1,144 @@
+# rate_limit.py
+"""
+Process-wide, per-host request pacing shared by every scan and crawl.
+
+Each host gets a token bucket (kept as a "theoretical arrival time", so
+waiting threads are served in order) with:
+  - a target rate, set from the scan's pause setting (the ceiling; a
+    pause of 0 means as fast as RATE_LIMIT_MAX_RPS allows),
+  - robots.txt Crawl-delay as a hard minimum spacing,
+  - multiplicative back-off on 429/503 and a pause for Retry-After,
+  - additive speed-up back to the target while latency stays healthy.
+Because the bucket lives here and not in the scan, two scans of the same
+forum share one budget.
+"""
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import threading
+import asyncio
+import time
+import os
+
+DEFAULT_RPS = float(os.environ.get("RATE_LIMIT_DEFAULT_RPS") or 4.0)  # when no pause is given
+MAX_RPS = float(os.environ.get("RATE_LIMIT_MAX_RPS") or 100.0)       # pause 0: no pacing beyond this
+MIN_RPS = float(os.environ.get("RATE_LIMIT_MIN_RPS") or 0.05)
+BURST = int(os.environ.get("RATE_LIMIT_BURST") or 2)
+MAX_RETRY_AFTER = 300.0
+SLOW_FACTOR = 3.0   # latency this many times the host's best is "unhealthy"
+
+
+def _host(url: str) -> str:
+    return (urlparse(url).hostname or "").lower()
+
+
+def rate_from_pause(pause_seconds: float | None) -> float:
+    """Translate the UI's 'delay between pages' into a target rate (0 = no pause)."""
+    if pause_seconds is None:
+        return DEFAULT_RPS
+    if pause_seconds > 0:
+        return min(MAX_RPS, 1.0 / pause_seconds)
+    return MAX_RPS
+
+
+def parse_retry_after(value) -> float | None:
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        secs = float(value)
+    except ValueError:
+        try:
+            secs = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return max(0.0, min(secs, MAX_RETRY_AFTER))
+
+
+class HostBucket:
+    def __init__(self, target: float):
+        self.target = target          # ceiling (requests/second)
+        self.rate = target            # current rate
+        self.crawl_delay = 0.0        # robots.txt minimum spacing
+        self.tat = 0.0                # theoretical arrival time of the next request
+        self.blocked_until = 0.0
+        self.latency = None           # EWMA seconds
+        self.best_latency = None
+
+    def interval(self) -> float:
+        return max(1.0 / max(self.rate, MIN_RPS), self.crawl_delay)
+
+
+class RateLimiter:
+    def __init__(self, default_rps: float = DEFAULT_RPS, burst: int = BURST):
+        self.default_rps = default_rps
+        self.burst = max(1, burst)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str) -> HostBucket:
+        b = self._buckets.get(host)
+        if b is None:
+            b = self._buckets[host] = HostBucket(self.default_rps)
+        return b
+
+    def configure(self, url: str, target_rate: float | None = None, crawl_delay: float | None = None):
+        with self._lock:
+            b = self._bucket(_host(url))
+            if target_rate:
+                backed_off = b.rate < b.target   # slowed down by 429s or latency: stay slow
+                b.target = max(MIN_RPS, float(target_rate))
+                b.rate = min(b.rate, b.target) if backed_off else b.target
+            if crawl_delay is not None:
+                b.crawl_delay = max(0.0, float(crawl_delay))
+
+    def reserve(self, url: str) -> float:
+        """Claim the next slot for this host; returns seconds to wait before sending."""
+        with self._lock:
+            b = self._bucket(_host(url))
+            now = time.monotonic()
+            interval = b.interval()
+            burst = 1 if b.crawl_delay else self.burst
+            tat = max(b.tat, now)
+            grant = max(now, tat - (burst - 1) * interval, b.blocked_until)
+            b.tat = max(tat, grant) + interval
+            return grant - now
+
+    def acquire(self, url: str):
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, url: str):
+        wait = self.reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def feedback(self, url: str, status: int | None = None, latency: float | None = None,
+                 retry_after=None):
+        """Adapt the host's rate to how the server is coping."""
+        with self._lock:
+            b = self._bucket(_host(url))
+            now = time.monotonic()
+            if status in (429, 503):
+                b.rate = max(MIN_RPS, b.rate * 0.5)
+                pause = parse_retry_after(retry_after)
+                b.blocked_until = max(b.blocked_until, now + (pause if pause is not None else b.interval()))
+                return
+            if latency is None or (status is not None and status >= 400):
+                return
+            b.latency = latency if b.latency is None else 0.7 * b.latency + 0.3 * latency
+            b.best_latency = latency if b.best_latency is None else min(b.best_latency, latency)
+            if b.latency > max(1.0, SLOW_FACTOR * b.best_latency):
+                b.rate = max(MIN_RPS, b.rate * 0.8)         # server is slowing down
+            elif b.rate < b.target:
+                b.rate = min(b.target, b.rate + max(0.05, 0.1 * b.target))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {h: {"rate": round(b.rate, 3), "target": round(b.target, 3),
+                        "crawl_delay": b.crawl_delay,
+                        "latency_ms": round(b.latency * 1000, 1) if b.latency is not None else None}
+                    for h, b in self._buckets.items()}
+
+
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,308 @@
+# response_cache.py
+"""
+On-disk HTTP response cache used by smart_fetch.
+
+Entries are keyed by (normalized URL, backend, referer and cookies) in a
+small SQLite index, so a page fetched with one user's cookies is never
+served to another scan; page bodies are stored as the raw bytes off the
+wire (with the declared charset kept in the index), once per content hash,
+zlib-compressed, under instance/http_cache/bodies/. A fresh entry (younger
+than HTTP_CACHE_TTL) is served without touching the network; a stale one,
+or one sent with Cache-Control: no-cache, is revalidated with
+If-None-Match / If-Modified-Since, so an unchanged page costs a 304.
+Responses marked no-store or private are not kept.
+The cache is trimmed least-recently-used first once it exceeds
+HTTP_CACHE_MAX_MB (a running total kept in the index), and entries older
+than HTTP_CACHE_MAX_AGE are dropped.
+"""
+from urllib.parse import urlsplit, urlunsplit
+import threading
+import hashlib
+import shutil
+import sqlite3
+import time
+import zlib
+import os
+
+from .fetch_utils import FetchResult, _env_int
+from .storage import instance_path
+
+CACHE_ENABLED = (os.environ.get("HTTP_CACHE_ENABLED") or "1") not in ("0", "false", "no")
+CACHE_TTL = _env_int("HTTP_CACHE_TTL", 600)                  # seconds served without revalidation
+CACHE_MAX_AGE = _env_int("HTTP_CACHE_MAX_AGE", 7 * 24 * 3600)  # seconds before an entry is dropped
+CACHE_MAX_MB = _env_int("HTTP_CACHE_MAX_MB", 256)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_COLUMNS = ("key TEXT PRIMARY KEY, url TEXT, backend TEXT, body_hash TEXT, "
+            "size INTEGER, etag TEXT, last_modified TEXT, source_backend TEXT, "
+            "stored_at REAL, accessed_at REAL, encoding TEXT, final_url TEXT, revalidate INTEGER")
+
+
+def normalize_cache_url(url: str) -> str:
+    """Lower-case scheme/host, drop default port and fragment."""
+    s = urlsplit(url.strip())
+    scheme = s.scheme.lower()
+    host = (s.hostname or "").lower()
+    netloc = host
+    if s.port and s.port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{s.port}"
+    if s.username:
+        netloc = f"{s.username}@{netloc}"
+    return urlunsplit((scheme, netloc, s.path or "/", s.query, ""))
+
+
+def cache_control(headers) -> set:
+    """Directive names of a response's Cache-Control header, lower-cased."""
+    value = headers.get("Cache-Control") if headers else None
+    return {d.split("=", 1)[0].strip().lower() for d in (value or "").split(",")} - {""}
+
+
+def _bump(stats: dict | None, name: str):
+    if stats is not None:
+        stats[name] = stats.get(name, 0) + 1
+
+
+class ResponseCache:
+    def __init__(self, root, ttl: int = CACHE_TTL, max_age: int = CACHE_MAX_AGE,
+                 max_bytes: int = CACHE_MAX_MB * 1024 * 1024, enabled: bool = CACHE_ENABLED):
+        self.root = str(root)
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = None
+
+    # ---- storage plumbing ----
+
+    def _db(self) -> sqlite3.Connection:
+        """The index connection, opened once; callers hold self._lock."""
+        if self._conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), timeout=10,
+                                   check_same_thread=False)
+            cols = [r[1] for r in conn.execute("PRAGMA table_info(entries)")]
+            if cols and cols != [c.split()[0] for c in _COLUMNS.split(", ")]:
+                # cache written by an older layout: start over
+                conn.execute("DROP TABLE entries")
+                conn.execute("DROP TABLE IF EXISTS bodies")
+                conn.execute("DROP TABLE IF EXISTS usage")
+                shutil.rmtree(os.path.join(self.root, "bodies"), ignore_errors=True)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS entries ({_COLUMNS})")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_stored ON entries(stored_at)")
+            # one row per stored body with the entries using it; usage holds their total size
+            conn.execute("CREATE TABLE IF NOT EXISTS bodies (body_hash TEXT PRIMARY KEY, size INTEGER, refs INTEGER)")
+            conn.execute("CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO usage VALUES (0, 0)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _body_path(self, body_hash: str) -> str:
+        return os.path.join(self.root, "bodies", body_hash[:2], body_hash + ".z")
+
+    def _read_body(self, body_hash: str) -> bytes | None:
+        try:
+            with open(self._body_path(body_hash), "rb") as fh:
+                return zlib.decompress(fh.read())
+        except (OSError, zlib.error):
+            return None
+
+    def _write_tmp(self, raw: bytes, path: str) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(zlib.compress(raw, 6))
+        return tmp
+
+    def _prepare_body(self, raw: bytes) -> tuple[str, str | None]:
+        """(hash, temp file with the compressed body); compressed outside the lock, None if already stored."""
+        body_hash = hashlib.sha256(raw).hexdigest()
+        path = self._body_path(body_hash)
+        return body_hash, None if os.path.exists(path) else self._write_tmp(raw, path)
+
+    def _place_body(self, raw: bytes, body_hash: str, tmp: str | None) -> int:
+        """Move the body in under its hash; caller holds self._lock, so eviction can't interleave."""
+        path = self._body_path(body_hash)
+        if tmp is None and not os.path.exists(path):
+            tmp = self._write_tmp(raw, path)   # dropped since _prepare_body looked
+        if tmp is not None:
+            os.replace(tmp, path)
+        return os.path.getsize(path)
+
+    def _ref_body(self, conn, body_hash: str, size: int):
+        if conn.execute("UPDATE bodies SET refs = refs + 1 WHERE body_hash=?", (body_hash,)).rowcount:
+            return
+        conn.execute("INSERT INTO bodies VALUES (?, ?, 1)", (body_hash, size))
+        conn.execute("UPDATE usage SET bytes = bytes + ? WHERE id = 0", (size,))
+
+    def _drop_bodies(self, conn, hashes) -> int:
+        """Release one reference per hash; remove bodies no entry uses. Returns bytes freed."""
+        freed = 0
+        for h in hashes:
+            conn.execute("UPDATE bodies SET refs = refs - 1 WHERE body_hash=?", (h,))
+            row = conn.execute("SELECT size FROM bodies WHERE body_hash=? AND refs <= 0", (h,)).fetchone()
+            if not row:
+                continue  # still referenced by another URL
+            conn.execute("DELETE FROM bodies WHERE body_hash=?", (h,))
+            conn.execute("UPDATE usage SET bytes = bytes - ? WHERE id = 0", (row[0],))
+            freed += row[0]
+            try:
+                os.remove(self._body_path(h))
+            except OSError:
+                pass
+        return freed
+
+    @staticmethod
+    def _key(url: str, backend: str, referer: str | None = None, cookie_str: str | None = None) -> str:
+        # referer and cookies are part of the key, as in SessionPool._key: a logged-in
+        # page must not be served to a scan with other cookies (or none)
+        return hashlib.sha256(
+            f"{backend}|{normalize_cache_url(url)}|{referer or ''}|{cookie_str or ''}".encode("utf-8")
+        ).hexdigest()
+
+    # ---- public API ----
+
+    def get(self, url: str, backend: str, referer: str | None = None, cookie_str: str | None = None):
+        """Return (entry dict, body) or (None, None)."""
+        key = self._key(url, backend, referer, cookie_str)
+        with self._lock:
+            row = self._db().execute(
+                "SELECT body_hash, etag, last_modified, source_backend, stored_at, encoding, final_url, "
+                "revalidate FROM entries WHERE key=?", (key,)).fetchone()
+        if not row:
+            return None, None
+        body = self._read_body(row[0])
+        if body is None:
+            return None, None
+        entry = {"key": key, "body_hash": row[0], "etag": row[1], "last_modified": row[2],
+                 "source_backend": row[3], "stored_at": row[4], "encoding": row[5],
+                 "final_url": row[6], "revalidate": bool(row[7])}
+        return entry, body
+
+    def put(self, url: str, backend: str, resp: FetchResult,
+            referer: str | None = None, cookie_str: str | None = None):
+        key = self._key(url, backend, referer, cookie_str)
+        cc = cache_control(resp.headers)
+        if cc & {"no-store", "private"} or not resp.content:
+            self.delete(key)   # whatever was kept for this page before is no longer wanted
+            return
+        body_hash, tmp = self._prepare_body(resp.content)
+        now = time.time()
+        with self._lock:
+            size = self._place_body(resp.content, body_hash, tmp)
+            conn = self._db()
+            with conn:
+                old = conn.execute("SELECT body_hash FROM entries WHERE key=?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                    (key, normalize_cache_url(url), backend, body_hash, size,
+                     resp.headers.get("ETag") if resp.headers else None,
+                     resp.headers.get("Last-Modified") if resp.headers else None,
+                     resp.backend, now, now, resp.encoding, resp.url or url, int("no-cache" in cc)))
+                self._ref_body(conn, body_hash, size)
+                if old:
+                    self._drop_bodies(conn, [old[0]])
+                self._evict(conn, now)
+
+    def touch(self, key: str, revalidated: bool = False):
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            with conn:
+                if revalidated:
+                    conn.execute("UPDATE entries SET stored_at=?, accessed_at=? WHERE key=?", (now, now, key))
+                else:
+                    conn.execute("UPDATE entries SET accessed_at=? WHERE key=?", (now, key))
+
+    def delete(self, key: str):
+        with self._lock:
+            conn = self._db()
+            with conn:
+                row = conn.execute("SELECT body_hash FROM entries WHERE key=?", (key,)).fetchone()
+                if row:
+                    conn.execute("DELETE FROM entries WHERE key=?", (key,))
+                    self._drop_bodies(conn, [row[0]])
+
+    def total_bytes(self) -> int:
+        """Compressed size of all stored bodies."""
+        with self._lock:
+            return self._db().execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+
+    def _evict(self, conn, now: float):
+        """Drop expired entries, then least-recently-used until under max_bytes."""
+        expired = conn.execute("SELECT key, body_hash FROM entries WHERE stored_at < ?",
+                               (now - self.max_age,)).fetchall()
+        if expired:
+            conn.executemany("DELETE FROM entries WHERE key=?", [(k,) for k, _h in expired])
+            self._drop_bodies(conn, [h for _k, h in expired])
+
+        total = conn.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, body_hash in conn.execute(
+                "SELECT key, body_hash FROM entries ORDER BY accessed_at").fetchall():
+            conn.execute("DELETE FROM entries WHERE key=?", (key,))
+            total -= self._drop_bodies(conn, [body_hash])
+            if total <= self.max_bytes:
+                break
+
+    def fetch(self, url: str, backend: str, fetch_fn, stats: dict | None = None,
+              referer: str | None = None, cookie_str: str | None = None) -> FetchResult:
+        """
+        Serve `url` from cache when fresh, revalidate when stale, otherwise
+        call fetch_fn(conditional_headers) and store the result. `referer`
+        and `cookie_str` are those the fetch is made with; entries are kept
+        apart per pair.
+        Counts cache_hits / cache_revalidated / cache_misses into `stats`.
+        """
+        t0 = time.monotonic()
+        entry, body = self.get(url, backend, referer, cookie_str)
+        if entry and not entry["revalidate"] and time.time() - entry["stored_at"] < self.ttl:
+            self.touch(entry["key"])
+            _bump(stats, "cache_hits")
+            return FetchResult(body, 200, {}, entry["source_backend"], entry["encoding"],
+                               url=entry["final_url"] or url, requested_url=url,
+                               timings={"total": time.monotonic() - t0}, from_cache=True)
+
+        cond = {}
+        if entry:
+            if entry["etag"]:
+                cond["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                cond["If-Modified-Since"] = entry["last_modified"]
+
+        resp = fetch_fn(cond or None)
+        if resp.status == 304:
+            if entry:
+                self.touch(entry["key"], revalidated=True)
+                _bump(stats, "cache_revalidated")
+                return resp._replace(content=body, status=200, encoding=entry["encoding"],
+                                     url=entry["final_url"] or resp.url, from_cache=True)
+            resp = fetch_fn(None)  # 304 without a cached copy: ask again unconditionally
+
+        _bump(stats, "cache_misses")
+        if resp.status == 200:
+            try:
+                self.put(url, backend, resp, referer, cookie_str)
+            except (OSError, sqlite3.Error):
+                pass  # a full disk shouldn't fail the scan
+        return resp
+
+    def clear(self):
+        with self._lock:
+            conn = self._db()
+            with conn:
+                hashes = [h for (h,) in conn.execute("SELECT body_hash FROM bodies")]
+                conn.execute("DELETE FROM entries")
+                conn.execute("DELETE FROM bodies")
+                conn.execute("UPDATE usage SET bytes = 0 WHERE id = 0")
+            for h in hashes:
+                try:
+                    os.remove(self._body_path(h))
+                except OSError:
+                    pass
+
+
+RESPONSE_CACHE = ResponseCache(instance_path("http_cache", "index.sqlite3").parent)
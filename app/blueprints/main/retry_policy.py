@@ -0,0 +1,229 @@
+# retry_policy.py
+"""
+Error classification, retries with jittered exponential backoff, and a
+per-host circuit breaker for the fetch backends.
+
+Every failure is classified as:
+  transient - timeouts, resets, 5xx, 429: worth retrying after a backoff
+  blocked   - 401/403 and friends: another UA or a heavier backend may help
+  permanent - 404/410, bad URLs, DNS/TLS failures: retrying or escalating can't help
+Failures that say something about the host itself (network errors, 5xx)
+feed the circuit breaker; after CIRCUIT_FAILURES of them in a row the host
+is cut off for a cooldown, so a dead forum fails in seconds.
+"""
+from urllib.parse import urlparse
+import threading
+import asyncio
+import random
+import time
+import os
+
+TRANSIENT = "transient"
+BLOCKED = "blocked"
+PERMANENT = "permanent"
+
+CIRCUIT_FAILURES = int(os.environ.get("CIRCUIT_FAILURES") or 5)
+CIRCUIT_COOLDOWN = float(os.environ.get("CIRCUIT_COOLDOWN") or 30)
+CIRCUIT_MAX_COOLDOWN = 600.0
+
+_BLOCKED_STATUSES = {401, 403, 407, 451}
+_TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+_DNS_MARKERS = ("nameresolutionerror", "name or service not known", "nodename nor servname",
+                "getaddrinfo failed", "no address associated", "temporary failure in name resolution",
+                "clientconnectordnserror")
+_PERMANENT_MARKERS = ("invalidurl", "missingschema", "invalidschema", "sslerror",
+                      "certificate verify failed", "toomanyredirects")
+
+
+def _host(url: str) -> str:
+    return (urlparse(url).hostname or "").lower()
+
+
+class FetchError(RuntimeError):
+    """A classified fetch failure."""
+
+    def __init__(self, message: str, kind: str, status: int | None = None,
+                 url: str | None = None, host_level: bool = False):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.url = url
+        self.host_level = host_level   # counts against the host's circuit breaker
+
+
+class CircuitOpenError(FetchError):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"circuit open for {host} (retry in {retry_in:.0f}s)", PERMANENT,
+                         host_level=False)
+        self.host = host
+
+
+def status_error(status: int, url: str, backend: str = "") -> FetchError:
+    label = f"{status} via {backend}" if backend else f"HTTP {status}"
+    if status in _BLOCKED_STATUSES:
+        return FetchError(label, BLOCKED, status, url)
+    if status in _TRANSIENT_STATUSES or status >= 500:
+        return FetchError(label, TRANSIENT, status, url, host_level=status != 429)
+    return FetchError(label, PERMANENT, status, url)
+
+
+def classify(exc: BaseException, url: str | None = None) -> FetchError:
+    """Wrap any exception from a backend into a FetchError (the original is its __cause__)."""
+    if isinstance(exc, FetchError):
+        return exc
+    err = _classify(exc, url)
+    err.__cause__ = exc
+    return err
+
+
+def _classify(exc: BaseException, url: str | None) -> FetchError:
+    status = getattr(getattr(exc, "response", None), "status_code", None) or getattr(exc, "status", None)
+    if isinstance(status, int) and status >= 400:
+        err = status_error(status, url or "")
+        err.args = (str(exc) or err.args[0],)
+        return err
+
+    text = f"{type(exc).__name__} {exc}".lower()
+    if any(m in text for m in _DNS_MARKERS):
+        return FetchError(f"DNS lookup failed: {exc}", PERMANENT, url=url, host_level=True)
+    if any(m in text for m in _PERMANENT_MARKERS) or isinstance(exc, ValueError):
+        return FetchError(str(exc) or type(exc).__name__, PERMANENT, url=url, host_level=True)
+    # timeouts, resets, refused connections, server disconnects, half-read bodies
+    return FetchError(str(exc) or type(exc).__name__, TRANSIENT, url=url, host_level=True)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (0-based) attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def next_step(self, err: FetchError, attempt: int, retry_blocked: bool) -> float | None:
+        """Seconds to wait before the next attempt, or None to give up."""
+        if attempt >= self.max_attempts - 1 or err.kind == PERMANENT:
+            return None
+        if err.kind == BLOCKED:
+            return 0.0 if retry_blocked else None
+        return self.delay(attempt)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = CIRCUIT_FAILURES, cooldown: float = CIRCUIT_COOLDOWN):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self._hosts = {}   # host -> {"failures", "opened_at", "cooldown", "probing"}
+        self._lock = threading.Lock()
+
+    def check(self, url: str):
+        """Raise CircuitOpenError if the host is cut off; lets one probe through after cooldown."""
+        host = _host(url)
+        with self._lock:
+            h = self._hosts.get(host)
+            if not h or h["opened_at"] is None:
+                return
+            wait = h["opened_at"] + h["cooldown"] - time.monotonic()
+            if wait > 0 or h["probing"]:
+                raise CircuitOpenError(host, max(wait, 0))
+            h["probing"] = True   # half-open: this caller is the probe
+
+    def is_open(self, url: str) -> bool:
+        with self._lock:
+            h = self._hosts.get(_host(url))
+            return bool(h and h["opened_at"] is not None)
+
+    def record_success(self, url: str):
+        with self._lock:
+            self._hosts.pop(_host(url), None)
+
+    def record_failure(self, url: str, err: FetchError):
+        host = _host(url)
+        if not err.host_level:
+            # the host answered (404, 403, ...): it's alive, whatever the page's problem
+            with self._lock:
+                self._hosts.pop(host, None)
+            return
+        with self._lock:
+            h = self._hosts.setdefault(host, {"failures": 0, "opened_at": None,
+                                              "cooldown": self.cooldown, "probing": False})
+            h["failures"] += 1
+            if h["probing"]:
+                # failed probe: stay open, back off further
+                h["cooldown"] = min(CIRCUIT_MAX_COOLDOWN, h["cooldown"] * 2)
+                h["opened_at"] = time.monotonic()
+                h["probing"] = False
+            elif h["failures"] >= self.threshold:
+                h["opened_at"] = time.monotonic()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {host: {"failures": h["failures"],
+                           "open": h["opened_at"] is not None,
+                           "retry_in": round(max(0.0, h["opened_at"] + h["cooldown"] - now), 1)
+                           if h["opened_at"] is not None else 0.0}
+                    for host, h in self._hosts.items()}
+
+
+RETRY_POLICY = RetryPolicy(
+    max_attempts=int(os.environ.get("FETCH_MAX_ATTEMPTS") or 3),
+    base_delay=float(os.environ.get("FETCH_BACKOFF_BASE") or 0.5),
+)
+CIRCUIT_BREAKER = CircuitBreaker()
+
+
+def run_with_retries(url: str, attempt, retry_blocked: bool = False,
+                     policy: RetryPolicy = RETRY_POLICY, breaker: CircuitBreaker = CIRCUIT_BREAKER):
+    """
+    Call attempt(i) until it returns, backing off between transient failures.
+    Raises a FetchError carrying the kind of the last failure.
+    """
+    errors = []
+    for i in range(policy.max_attempts):
+        breaker.check(url)
+        try:
+            result = attempt(i)
+        except Exception as e:
+            err = classify(e, url)
+            breaker.record_failure(url, err)
+            errors.append(str(err))
+            if err.kind == PERMANENT:
+                raise err
+            wait = policy.next_step(err, i, retry_blocked)
+            if wait is None:
+                break
+            if wait > 0:
+                time.sleep(wait)
+            continue
+        breaker.record_success(url)
+        return result
+    raise FetchError("; ".join(errors), err.kind, err.status, url, err.host_level) from err
+
+
+async def run_with_retries_async(url: str, attempt, retry_blocked: bool = False,
+                                 policy: RetryPolicy = RETRY_POLICY,
+                                 breaker: CircuitBreaker = CIRCUIT_BREAKER):
+    """Async twin of run_with_retries; attempt(i) returns an awaitable."""
+    errors = []
+    for i in range(policy.max_attempts):
+        breaker.check(url)
+        try:
+            result = await attempt(i)
+        except Exception as e:
+            err = classify(e, url)
+            breaker.record_failure(url, err)
+            errors.append(str(err))
+            if err.kind == PERMANENT:
+                raise err
+            wait = policy.next_step(err, i, retry_blocked)
+            if wait is None:
+                break
+            if wait > 0:
+                await asyncio.sleep(wait)
+            continue
+        breaker.record_success(url)
+        return result
+    raise FetchError("; ".join(errors), err.kind, err.status, url, err.host_level) from err
@@ -0,0 +1,359 @@
+# robots.py
+"""
+robots.txt and sitemaps, read through the normal fetch layer.
+
+ROBOTS caches one parsed robots.txt per host (scheme://host:port) for
+ROBOTS_TTL seconds, shared by every crawl in the process. It is fetched
+with the crawl's backend and cookies, so a site that only answers a
+browser or a logged-in session gets the same treatment for robots.txt as
+for its pages. Like a crawler that can't see the file, an unreadable
+robots.txt allows everything: a 4xx is cached for the full TTL, a 5xx or
+network failure for ROBOTS_ERROR_TTL so it is retried soon.
+
+iter_sitemap_urls() walks the `Sitemap:` entries of a robots.txt,
+following sitemap indexes, and yields page URLs as the file downloads:
+chunks go from the connection to the parser through a short queue, so a
+sitemap is never held whole - not as bytes, a tree or a list - and
+gzipped ones are inflated chunk by chunk.
+"""
+from collections import deque
+from queue import Full, Queue
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+from xml.etree import ElementTree
+import html
+import itertools
+import os
+import re
+import threading
+import time
+import zlib
+
+from .fetch_utils import BodyGate, SkippedResponse, _env_int, smart_fetch_raw
+from .retry_policy import classify
+
+ROBOTS_TTL = _env_int("ROBOTS_TTL", 3600)                  # seconds a robots.txt is trusted
+ROBOTS_ERROR_TTL = _env_int("ROBOTS_ERROR_TTL", 300)       # ... when it couldn't be fetched
+ROBOTS_AGENT = os.environ.get("ROBOTS_USER_AGENT") or "*"  # the group of rules we follow
+ROBOTS_MAX_HOSTS = _env_int("ROBOTS_MAX_HOSTS", 4096)      # cached hosts before expired ones are dropped
+SITEMAP_MAX_FILES = _env_int("SITEMAP_MAX_FILES", 50)      # sitemaps (and indexes) read per walk
+SITEMAP_MAX_BYTES = _env_int("SITEMAP_MAX_MB", 50) * 1024 * 1024   # the sitemaps.org limit, uncompressed
+
+# any content type: robots.txt is text/plain, sitemaps are XML, gzip or plain text
+ROBOTS_GATE = BodyGate(allowed_types=(), max_bytes=512 * 1024)
+_CHUNK = 64 * 1024
+_QUEUED_CHUNKS = 16   # downloaded sitemap chunks waiting for the parser, at most
+_SITEMAP_NS_RE = re.compile(r"/sitemap/[\d.]+/?$")   # sitemaps.org 0.9, Google's older 0.84
+_PRE_RE = re.compile(r"<pre[^>]*>(.*?)</pre>", re.I | re.S)
+_EOL_RE = re.compile(rb"\r\n?|\n")
+
+
+def origin_of(url: str) -> str:
+    s = urlsplit(url)
+    return f"{s.scheme.lower()}://{s.netloc.lower()}"
+
+
+def _crawl_delays(lines) -> dict:
+    """user-agent -> Crawl-delay seconds; urllib's parser drops anything but whole numbers ("0.5", "1.0")."""
+    delays, agents, in_rules = {}, [], False
+    for line in lines:
+        key, _, value = line.split("#", 1)[0].partition(":")
+        key, value = key.strip().lower(), value.strip()
+        if key == "user-agent":
+            if in_rules:   # a user-agent line after rules starts a new group
+                agents, in_rules = [], False
+            agents.append(value.lower())
+        elif key in ("allow", "disallow", "crawl-delay", "request-rate"):
+            in_rules = True
+            if key == "crawl-delay":
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                for agent in agents:
+                    delays.setdefault(agent, delay)
+    return delays
+
+
+def _robots_text(content: bytes) -> str:
+    text = content.decode("utf-8-sig", errors="replace")
+    if text.lstrip()[:1] == "<":
+        # a browser backend hands back the file wrapped in a page
+        m = _PRE_RE.search(text)
+        text = html.unescape(m.group(1)) if m else ""
+    return text
+
+
+class RobotsRules:
+    """One host's robots.txt. An empty or missing file allows everything."""
+
+    def __init__(self, origin: str, text: str = "", status: int | None = 200, error: str | None = None):
+        self.origin = origin
+        self.status = status       # HTTP status; None when the fetch failed
+        self.error = error
+        self.fetched_at = time.monotonic()
+        lines = text.splitlines()
+        self._rp = RobotFileParser(origin + "/robots.txt")
+        self._rp.parse(lines)
+        self._delays = _crawl_delays(lines)
+
+    @property
+    def ttl(self) -> int:
+        return ROBOTS_ERROR_TTL if self.status is None or self.status >= 500 else ROBOTS_TTL
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.fetched_at > self.ttl
+
+    def can_fetch(self, url: str, agent: str = ROBOTS_AGENT) -> bool:
+        return self._rp.can_fetch(agent, url)
+
+    def delay(self, agent: str = ROBOTS_AGENT) -> float | None:
+        """Seconds between requests asked for by Crawl-delay or Request-rate (the larger), or None."""
+        delays = []
+        name = agent.split("/")[0].lower()   # matched the way urllib matches groups
+        crawl_delay = next((d for a, d in self._delays.items() if a != "*" and a in name),
+                           self._delays.get("*"))
+        if crawl_delay:
+            delays.append(crawl_delay)
+        rate = self._rp.request_rate(agent)
+        if rate and rate.requests:
+            delays.append(rate.seconds / rate.requests)
+        return max(delays) if delays else None
+
+    @property
+    def sitemaps(self) -> list:
+        return list(self._rp.site_maps() or ())
+
+
+class RobotsCache:
+    def __init__(self, max_hosts: int = ROBOTS_MAX_HOSTS):
+        self.max_hosts = max_hosts
+        self._entries = {}   # origin -> RobotsRules
+        self._fetching = {}  # origin -> Lock held while its robots.txt downloads
+        self._lock = threading.Lock()
+
+    def get(self, url: str, backend: str = "auto", cookie_str: str | None = None,
+            stats: dict | None = None) -> RobotsRules:
+        """Rules for the host of `url`, fetched once per TTL however many crawls ask."""
+        origin = origin_of(url)
+        with self._lock:
+            rules = self._entries.get(origin)
+            if rules is not None and not rules.expired():
+                return rules
+            lock = self._fetching.setdefault(origin, threading.Lock())
+        with lock:
+            with self._lock:
+                rules = self._entries.get(origin)
+            if rules is None or rules.expired():   # not refreshed while we waited
+                rules = self._fetch(origin, backend, cookie_str, stats)
+                with self._lock:
+                    if len(self._entries) >= self.max_hosts:
+                        self._evict()
+                    self._entries[origin] = rules
+        return rules
+
+    def cached(self, url: str) -> RobotsRules | None:
+        """Fresh rules for the host of `url` if they are cached; never fetches."""
+        with self._lock:
+            rules = self._entries.get(origin_of(url))
+        return rules if rules is not None and not rules.expired() else None
+
+    def _fetch(self, origin, backend, cookie_str, stats) -> RobotsRules:
+        try:
+            resp = smart_fetch_raw(origin + "/robots.txt", None, cookie_str, backend,
+                                   use_cache=False, stats=stats, gate=ROBOTS_GATE)
+        except Exception as e:
+            err = classify(e, origin)
+            status = err.status if err.status and 400 <= err.status < 500 else None
+            return RobotsRules(origin, status=status, error=str(err))
+        return RobotsRules(origin, _robots_text(resp.content or b""), resp.status)
+
+    def _evict(self):
+        for origin in [o for o, r in self._entries.items() if r.expired()]:
+            del self._entries[origin]
+            self._fetching.pop(origin, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._fetching.clear()
+
+
+ROBOTS = RobotsCache()
+
+
+class _SitemapStream(BodyGate):
+    """
+    A gate for one sitemap download that keeps nothing: read() passes each
+    chunk to `chunks` for the parsing side, and waits while that is full.
+    Only one body is streamed - a retry after chunks went out would feed the
+    parser the start of the file again - and a reader that stops early
+    (close()) aborts the download.
+    """
+
+    def __init__(self):
+        super().__init__(allowed_types=(), max_bytes=SITEMAP_MAX_BYTES)
+        self.chunks = Queue(maxsize=_QUEUED_CHUNKS)
+        self.started = False
+        self._closed = threading.Event()
+
+    def put(self, item) -> bool:
+        """Queue a chunk (None: the end); False once the reader has gone."""
+        while not self._closed.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def close(self):
+        self._closed.set()
+
+    def read(self, url: str, headers, chunks) -> bytes:
+        if self.started:
+            raise SkippedResponse("sitemap download interrupted", url)
+        self.started = True
+        got = 0
+        for chunk in chunks:
+            got += len(chunk)
+            if got > self.max_bytes:
+                raise self.overflow(url, headers, got)
+            if chunk and not self.put(chunk):
+                raise SkippedResponse("sitemap reader stopped", url)
+        return b""
+
+
+def _download(url: str, backend: str, cookie_str: str | None):
+    """Chunks of one sitemap as they arrive; the fetch runs on a helper thread. Raises its error."""
+    gate = _SitemapStream()
+    outcome = {}
+
+    def fetch():
+        try:
+            outcome["resp"] = smart_fetch_raw(url, None, cookie_str, backend, use_cache=False, gate=gate)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            gate.put(None)
+
+    t = threading.Thread(target=fetch, name="sitemap-fetch", daemon=True)
+    t.start()
+    try:
+        while (chunk := gate.chunks.get()) is not None:
+            yield chunk
+    finally:
+        gate.close()   # a reader that stopped early: the download gives up at its next chunk
+    if "error" in outcome:
+        raise outcome["error"]
+    if not gate.started:
+        # a backend that can't stream (a browser) hands the whole body back
+        content = outcome["resp"].content or b""
+        yield from (content[i:i + _CHUNK] for i in range(0, len(content), _CHUNK))
+
+
+def _inflate(chunks):
+    # gzip, at most _CHUNK bytes out per step and SITEMAP_MAX_BYTES in all
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    total = 0
+    for data in chunks:
+        while data:
+            out = d.decompress(data, _CHUNK)
+            data = d.unconsumed_tail
+            total += len(out)
+            if total > SITEMAP_MAX_BYTES:
+                return
+            if out:
+                yield out
+
+
+def _chunks(source):
+    # the file's bytes, or its chunks as they arrive; gzip is inflated on the way
+    if isinstance(source, (bytes, bytearray)):
+        data = source
+        source = (data[i:i + _CHUNK] for i in range(0, len(data), _CHUNK))
+    source = iter(source)
+    first = next(source, b"")
+    chunks = itertools.chain((first,), source)
+    return _inflate(chunks) if first[:2] == b"\x1f\x8b" else chunks
+
+
+def _lines(chunks):
+    # complete lines as the chunks come in; the last one may lack its newline
+    tail = b""
+    for chunk in chunks:
+        *lines, tail = _EOL_RE.split(tail + chunk)
+        yield from lines
+    yield tail
+
+
+def _is_loc(tag: str) -> bool:
+    # <loc> of the sitemap namespace; image:loc / video:loc live in others
+    ns, _, name = tag[1:].rpartition("}") if tag[:1] == "{" else ("", "", tag)
+    return name == "loc" and (not ns or bool(_SITEMAP_NS_RE.search(ns)))
+
+
+def sitemap_entries(content):
+    """
+    ("url" | "sitemap", loc) for each entry of a sitemap or sitemap index, as
+    it is parsed. `content` is the file's bytes or an iterable of its chunks.
+    """
+    chunks = _chunks(content)
+    first = next(chunks, b"")
+    if first.lstrip(b" \t\r\n\xef\xbb\xbf")[:1] != b"<":
+        # plain-text sitemap: one URL per line
+        for raw in _lines(itertools.chain((first,), chunks)):
+            line = raw.decode("utf-8-sig", errors="replace").strip()
+            if line.startswith(("http://", "https://")):
+                yield "url", line
+        return
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root = loc = None
+    try:
+        for chunk in itertools.chain((first,), chunks):
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if event == "start":
+                    if root is None:
+                        root = elem
+                    continue
+                name = elem.tag.rpartition("}")[2]
+                if _is_loc(elem.tag):
+                    loc = (elem.text or "").strip()
+                elif name in ("url", "sitemap"):
+                    if loc:
+                        yield name, loc
+                    loc = None
+                    root.clear()   # finished entries go: memory stays flat however long the file
+        parser.close()
+    except ElementTree.ParseError:
+        return   # malformed: keep what was read before the error
+
+
+def iter_sitemap_urls(sitemaps, backend: str = "auto", cookie_str: str | None = None,
+                      stats: dict | None = None, max_files: int = SITEMAP_MAX_FILES):
+    """
+    Page URLs listed in `sitemaps`, following sitemap indexes breadth-first
+    up to `max_files` files. Files that fail to download are skipped;
+    stats gets "sitemaps" (read) and "sitemap_errors" counts.
+    """
+    queue = deque(sitemaps)
+    seen = set(queue)
+    read = 0
+    while queue and read < max_files:
+        url = queue.popleft()
+        read += 1
+        try:
+            for kind, loc in sitemap_entries(_download(url, backend, cookie_str)):
+                if kind == "url":
+                    yield loc
+                elif loc not in seen:
+                    seen.add(loc)
+                    queue.append(loc)
+        except Exception:
+            # the URLs read before the failure have been yielded already
+            if stats is not None:
+                stats["sitemap_errors"] = stats.get("sitemap_errors", 0) + 1
+            continue
+        if stats is not None:
+            stats["sitemaps"] = stats.get("sitemaps", 0) + 1
@@ -8,6 +8,11 @@ from flask_login import login_required, current_user
 from .tasks import run_scan_task, RUNS
 from .parser_utils import render_results_html
 from .fetch_utils import BACKENDS
+from .backend_stats import BACKEND_TABLE
+from .rate_limit import RATE_LIMITER
+from .retry_policy import CIRCUIT_BREAKER
+from .query import compile_query, QuerySyntaxError
+from .canonical_url import canonical_url
 from . import bp
 
 from app.extensions import db
@@ -45,6 +50,7 @@ def scraper():
     match_text = request.form.get("match_text") == "on"
     match_url = request.form.get("match_url") == "on"
     same_domain = request.form.get("same_domain") == "on"
+    use_cache = request.form.get("bypass_cache") != "on"
     referer = (request.form.get("referer") or "").strip() or None
     cookies_raw = (request.form.get("cookies") or "").strip() or None
     backend = (request.form.get("backend") or os.environ.get("FETCH_BACKEND","auto")).strip().lower()
@@ -70,6 +76,11 @@ def scraper():
     if not keyword:
         flash("Keyword cannot be empty.", "error")
         return redirect(url_for("main.scraper"))
+    try:
+        compile_query(sub_keyword)
+    except QuerySyntaxError as e:
+        flash(f"Invalid refine query: {e}", "error")
+        return redirect(url_for("main.scraper"))
 
     run_id = str(uuid.uuid4())
     RUNS[run_id] = {
@@ -83,6 +94,9 @@ def scraper():
             "links_seen": 0,
             "matches": 0,
             "eta_seconds": None,
+            "cache_hits": 0,
+            "cache_revalidated": 0,
+            "cache_misses": 0,
             "message": "Queued",
         },
     }
@@ -92,7 +106,7 @@ def scraper():
         run_id=run_id, url=url, keyword=keyword, sub_keyword=sub_keyword,
         match_text=match_text, match_url=match_url, same_domain=same_domain,
         referer=referer, cookies_raw=cookies_raw, backend=backend,
-        pause_seconds=pause_seconds, max_pages=max_pages
+        pause_seconds=pause_seconds, max_pages=max_pages, use_cache=use_cache
     ), daemon=True)
     t.start()
 
@@ -378,14 +392,34 @@ def progress(run_id):
     prog = data.get("progress", {"current": 0, "total": 0, "status": "idle"})
     return jsonify(prog)
 
+@bp.get("/fetch/backends")
+@login_required
+def backend_table():
+    """Inspect what auto mode has learned per host."""
+    return jsonify(BACKEND_TABLE.snapshot())
+
+@bp.get("/fetch/rate-limits")
+@login_required
+def rate_limits():
+    """Current per-host request rates and circuit breakers (shared by all scans and crawls)."""
+    return jsonify({"rates": RATE_LIMITER.snapshot(), "circuits": CIRCUIT_BREAKER.snapshot()})
+
+@bp.post("/fetch/backends/forget")
+@login_required
+def backend_table_forget():
+    host = (request.form.get("host") or request.args.get("host") or "").strip() or None
+    BACKEND_TABLE.forget(host)
+    return jsonify({"status": "ok", "forgot": host or "all"})
+
 def _dedupe_by_url(items):
     seen = set()
     out = []
     for it in items:
         # Reuse your coercer to robustly extract the URL across dict/tuple/str
         _, url = _coerce_item(it)
-        if url and url not in seen:
-            seen.add(url)
+        key = canonical_url(url) or url   # the same page under another spelling is a duplicate
+        if key and key not in seen:
+            seen.add(key)
             out.append(it)
     return out
 
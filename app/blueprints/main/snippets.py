@@ -0,0 +1,94 @@
+# snippets.py
+"""
+Result snippets from a page's visible text.
+
+SnippetIndex scans the text once for all the query's terms and keeps
+where each occurs; every match on the page then gets its snippet by
+lookup instead of re-searching the page. A match whose anchor has a span
+in the text (ParsedPage.text fills Anchor.span) is quoted in place - the
+text around the link, stretched to take in a term if one is close by.
+Matches without a span get the page-level snippet, around the first
+occurrence of the highest-priority term.
+
+Terms are matched in the lower-cased text, which is not always the same
+length as the original ("İ".lower() is two code points), so offsets are
+mapped back before slicing.
+"""
+from bisect import bisect_left
+
+from .term_matcher import TermMatcher
+
+SNIPPET_SPAN = 60   # characters of context on each side
+
+
+def _origin(text: str) -> list:
+    """For each code point of text.lower(), the index in `text` it came from."""
+    pos = []
+    for i, ch in enumerate(text):
+        pos.extend([i] * len(ch.lower()))
+    return pos
+
+
+class SnippetIndex:
+    def __init__(self, text: str | None, matcher: TermMatcher, span: int = SNIPPET_SPAN):
+        self.text = text or ""
+        self.span = span
+        self.terms = matcher.terms
+        if self.text and matcher:
+            lower = self.text.lower()
+            occ = matcher.offsets(lower)
+            pos = _origin(self.text) if len(lower) != len(self.text) else None
+        else:
+            occ, pos = {}, None
+
+        def span(i, t):
+            return (i, i + len(t)) if pos is None else (pos[i], pos[i + len(t) - 1] + 1)
+
+        # (offset, end) in self.text of each term's first occurrence
+        self.first = {t: span(offs[0], t) for t, offs in occ.items()}
+        # every (offset, end) of every term, in text order
+        self.hits = sorted(span(i, t) for t, offs in occ.items() for i in offs)
+        self._starts = [i for i, _ in self.hits]
+        self._page = False
+
+    def _window(self, lo: int, hi: int) -> str | None:
+        t = self.text
+        lo, hi = max(0, lo), min(len(t), hi)
+        # don't start or end mid-word when a space is near
+        if lo > 0 and not t[lo - 1].isspace():
+            sp = t.find(" ", lo, lo + 15)
+            if sp != -1:
+                lo = sp + 1
+        if hi < len(t) and not t[hi].isspace():
+            sp = t.rfind(" ", hi - 15, hi)
+            if sp > lo:
+                hi = sp
+        return t[lo:hi].strip() or None
+
+    def page_snippet(self) -> str | None:
+        """Text around the first occurrence of the highest-priority term (matcher.terms order)."""
+        if self._page is False:
+            self._page = None
+            for term in self.terms:
+                hit = self.first.get(term)
+                if hit is not None:
+                    self._page = self._window(hit[0] - self.span, hit[1] + self.span)
+                    break
+        return self._page
+
+    def for_anchor(self, anchor) -> str | None:
+        """Snippet for one matched link: its surroundings if known, else the page snippet."""
+        span = getattr(anchor, "span", None)
+        if not span or not self.text:
+            return self.page_snippet()
+        a, b = span
+        lo, hi = a - self.span, b + self.span
+        # the nearest term occurrence on either side, if it's within reach
+        k = bisect_left(self._starts, a)
+        near = [self.hits[j] for j in (k - 1, k) if 0 <= j < len(self.hits)]
+        reach = 2 * self.span
+        near = [(s, e) for s, e in near if s < b + reach and e > a - reach]
+        if near:
+            s, e = min(near, key=lambda h: abs(h[0] - a))
+            lo, hi = min(lo, s - 10), max(hi, e + 10)
+        return self._window(lo, hi)
@@ -0,0 +1,15 @@
+# storage.py
+from pathlib import Path
+import os
+
+
+def instance_path(*parts: str) -> Path:
+    """
+    Path under the app's instance directory (mounted as a volume in Docker).
+    Override with SCRAPER_DATA_DIR. Parent directories are created.
+    """
+    base = os.environ.get("SCRAPER_DATA_DIR")
+    root = Path(base) if base else Path(__file__).resolve().parents[3] / "instance"
+    p = root.joinpath(*parts)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    return p
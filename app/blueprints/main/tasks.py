@@ -1,35 +1,14 @@
 import time
 
-from .parser_utils import (
-    extract_links, filter_links, subfilter_links, iterate_forum_pages
-)
+from .parser_utils import iterate_forum_pages
+from .fetch_utils import timing_summary, _env_int
+from .parsed_page import ParsedPage
+from .parse_pool import PARSE_PROCESSES, PoolParser, ScanSpec, scan_parsed
+from .pipeline import Pipeline
 
-def _page_title_from_soup(soup):
-    try:
-        if soup and getattr(soup, "title", None) and soup.title.string:
-            return soup.title.string.strip()
-    except Exception:
-        pass
-    return None
-
-def _make_snippet(text: str | None, terms: list[str], span: int = 60) -> str | None:
-    if not text:
-        return None
-    t = text.replace("\n", " ")
-    tl = t.lower()
-    for term in terms:
-        if not term:
-            continue
-        i = tl.find(term.lower())
-        if i != -1:
-            start = max(0, i - span)
-            end = min(len(t), i + len(term) + span)
-            return t[start:end].strip()
-    return None
-
-def _to_result_obj(item, page_title: str | None, page_text: str | None, terms: list[str]):
+def _to_result_obj(item, page_title: str | None, snippet: str | None):
     """
-    Normalise whatever filter_links/subfilter_links returned into:
+    Normalise whatever filter_links returned into:
       {"url": ..., "title": ..., "snippet": ...}
     Supports dicts, 2-tuples/lists like [matched_text, url], or raw url strings.
     """
@@ -55,15 +34,17 @@ def _to_result_obj(item, page_title: str | None, page_text: str | None, terms: l
     if not title:
         title = page_title  # fall back to page <title> if we have no anchor/match text
 
-    snippet = _make_snippet(page_text, terms)
     return {"url": url, "title": title, "snippet": snippet}
 
+# pages allowed to wait between two scan stages before the earlier one blocks
+PIPELINE_DEPTH = _env_int("SCAN_PIPELINE_DEPTH", 4)
+
 # In-memory run registry for progress + results
 RUNS = {}  # { run_id: { "results": [...], "meta": {...}, "progress": {...} } }
 
 def run_scan_task(run_id, *, url, keyword, sub_keyword, match_text, match_url,
                   same_domain, referer, cookies_raw, backend, pause_seconds,
-                  max_pages):
+                  max_pages, use_cache=True):
     try:
         start_ts = time.time()
         # initialise progress info with richer fields
@@ -75,57 +56,64 @@ def run_scan_task(run_id, *, url, keyword, sub_keyword, match_text, match_url,
             "links_seen": 0,
             "matches": 0,
             "eta_seconds": None,
+            "cache_hits": 0,
+            "cache_revalidated": 0,
+            "cache_misses": 0,
         })
 
         matches_accum = []
         links_seen = 0
-
-        for i, (page_url, html_text, soup) in enumerate(
-            iterate_forum_pages(
-                start_url=url,
-                max_pages=max_pages,
-                referer=referer,
-                cookies_raw=cookies_raw,
-                backend=backend,
-                pause_seconds=pause_seconds,
-            ),
-            start=1
-        ):
-            # collect links from this page
-            page_links = extract_links(html_text, page_url)
-            links_seen += len(page_links)
-
-            # filter immediately so progress can show live matches
-            page_matches = filter_links(
-                page_links, keyword, match_text, match_url, same_domain, base_url=url
-            )
-            if sub_keyword:
-                page_matches = subfilter_links(
-                    page_matches, sub_keyword, match_text=match_text, match_url=match_url
-                )
-
-            if page_matches:
-                terms = [t for t in [keyword, sub_keyword] if t]
-                page_title = _page_title_from_soup(soup)
-                result_objs = [
-                    _to_result_obj(m, page_title=page_title, page_text=html_text, terms=terms)
-                    for m in page_matches
-                ]
-                matches_accum.extend(result_objs)
-
-            # progress & ETA
+        fetch_stats = {}
+        spec = ScanSpec(keyword, sub_keyword, match_text, match_url, same_domain, url)
+
+        if PARSE_PROCESSES > 0:
+            # parse + filter in worker processes; records come back ready
+            parser, stages = PoolParser(spec), []
+        else:
+            # fetch -> parse -> filter on their own threads, so the next page is being
+            # fetched while this one is parsed and filtered; results stay in page order
+            parser = None
+            stages = [("parse", ParsedPage.parse), ("filter", lambda page: scan_parsed(page, spec))]
+        pages = iterate_forum_pages(
+            start_url=url,
+            max_pages=max_pages,
+            referer=referer,
+            cookies_raw=cookies_raw,
+            backend=backend,
+            pause_seconds=pause_seconds,
+            use_cache=use_cache,
+            fetch_stats=fetch_stats,
+            with_text=True,   # one pass gives anchors, their spans and the text
+            parser=parser,
+        )
+        pipe = Pipeline(pages, stages, maxsize=PIPELINE_DEPTH, name=f"scan-{run_id[:8]}")
+
+        for i, record in enumerate(pipe, start=1):
+            links_seen += record.n_links
+            matches_accum.extend(_to_result_obj((text, link), page_title=record.title, snippet=snippet)
+                                 for text, link, snippet in record.matches)
+
+            # progress & ETA; an engine adapter may know the real page count
+            total = fetch_stats.get("pages_planned") or max_pages
             elapsed = max(0.001, time.time() - start_ts)
             rate = i / elapsed  # pages per second
-            remaining = max(0, max_pages - i)
+            remaining = max(0, total - i)
             eta_seconds = int(remaining / rate) if rate > 0 else None
 
             RUNS[run_id]["progress"].update({
                 "current": i,
+                "total": total,
+                "engine": fetch_stats.get("engine"),
                 "pages_scanned": i,
                 "links_seen": links_seen,
                 "matches": len(matches_accum),
                 "eta_seconds": eta_seconds,
-                "message": f"Scanned {i}/{max_pages} pages",
+                "queues": pipe.depths(),   # pages waiting in front of each stage
+                "cache_hits": fetch_stats.get("cache_hits", 0),
+                "cache_revalidated": fetch_stats.get("cache_revalidated", 0),
+                "cache_misses": fetch_stats.get("cache_misses", 0),
+                **timing_summary(fetch_stats),
+                "message": f"Scanned {i}/{total} pages",
             })
 
         # finalise
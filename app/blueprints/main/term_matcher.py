@@ -0,0 +1,82 @@
+# term_matcher.py
+"""
+Multi-term matching in one pass.
+
+The terms are folded into a trie and the trie is written out as a regular
+expression (shared prefixes factored, e.g. "app(?:le|ly)?"), so the regex
+engine walks every term at once in C - an Aho-Corasick-style automaton
+without a Python-level loop over characters. Cost stays flat as OR-lists
+grow to dozens of terms, where one `in` scan per term grows linearly.
+
+Matching is case-insensitive: terms are lower-cased when compiled, and
+callers pass strings through .lower() once.
+"""
+from functools import lru_cache
+import re
+
+
+def _trie_pattern(terms) -> str:
+    trie = {}
+    for t in terms:
+        node = trie
+        for ch in t:
+            node = node.setdefault(ch, {})
+        node[""] = True   # a term ends here
+
+    def emit(node) -> str:
+        alts = [re.escape(ch) + emit(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        # greedy: the longest term starting at a position wins
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+class TermMatcher:
+    def __init__(self, terms):
+        self.terms = tuple(dict.fromkeys(t.lower() for t in terms if t))
+        pattern = _trie_pattern(self.terms) if self.terms else None
+        self._search = re.compile(pattern).search if pattern else None
+        # zero-width lookahead so overlapping terms at every position are seen
+        self._scan = re.compile(f"(?=({pattern}))").finditer if pattern else None
+        # a match of "apple" also means "app" is there, if both are terms
+        self._implied = {t: [u for u in self.terms if t.startswith(u)] for t in self.terms}
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def any_in(self, s_lower: str) -> bool:
+        return bool(self._search and self._search(s_lower))
+
+    def found(self, s_lower: str) -> set:
+        """Every term that occurs in the string."""
+        hits = set()
+        if self._scan:
+            n = len(self.terms)
+            for m in self._scan(s_lower):
+                hits.update(self._implied[m.group(1)])
+                if len(hits) == n:
+                    break
+        return hits
+
+    def all_in(self, s_lower: str) -> bool:
+        return bool(self.terms) and len(self.found(s_lower)) == len(self.terms)
+
+    def offsets(self, s_lower: str) -> dict:
+        """term -> ascending indexes of all its occurrences, for the terms that occur."""
+        occ = {}
+        if self._scan:
+            for m in self._scan(s_lower):
+                i = m.start()
+                for t in self._implied[m.group(1)]:
+                    occ.setdefault(t, []).append(i)
+        return occ
+
+
+@lru_cache(maxsize=64)
+def compile_terms(terms: tuple) -> TermMatcher:
+    """Compiled matcher for a tuple of terms; cached, so a scan compiles its terms once."""
+    return TermMatcher(terms)
+
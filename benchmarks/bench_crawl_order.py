@@ -0,0 +1,125 @@
+"""
+Breadth-first against best-first crawl order on a synthetic forum served
+locally: 12 boards of 15 listing pages of 20 threads. Threads about
+"apple" sit mostly in two boards, and more of them the deeper into a
+listing; every page also links to member and tag pages, a large web with
+no matches in it. For each page budget, prints the distinct matching
+threads each strategy found.
+
+    python benchmarks/bench_crawl_order.py [budget ...]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("SCRAPER_DATA_DIR", tempfile.mkdtemp(prefix="bench-crawl-"))
+
+BOARDS, PAGES, PER = 12, 15, 20
+HOT_BOARDS = (3, 8)
+KEYWORD = "apple"
+
+
+def make_site(seed: int = 7) -> dict:
+    """thread id -> whether it is about the keyword."""
+    rnd = random.Random(seed)
+    topics = {}
+    for b in range(BOARDS):
+        for p in range(1, PAGES + 1):
+            for k in range(PER):
+                chance = 0.05 + 0.03 * p if b in HOT_BOARDS else 0.01
+                topics[(b * PAGES + p) * PER + k] = rnd.random() < chance
+    return topics
+
+
+TOPICS = make_site()
+THREADS = sorted(TOPICS)
+
+
+def thread_link(tid: int) -> str:
+    return f"<a href='/thread-{tid}-1-1.html'>{KEYWORD + ' ' if TOPICS[tid] else ''}thread {tid}</a> "
+
+
+def noise(rnd: random.Random) -> str:
+    return "".join(f"<a href='/member/{rnd.randint(1, 5000)}'>member</a> <a href='/tag/{rnd.randint(1, 800)}'>tag</a> "
+                   for _ in range(15))
+
+
+def render(path: str) -> str | None:
+    rnd = random.Random(path)
+    if path == "/":
+        return "".join(f"<a href='/forum-{b}-1.html'>board {b}</a> " for b in range(BOARDS)) + noise(rnd)
+    if m := re.fullmatch(r"/forum-(\d+)-(\d+)\.html", path):
+        b, p = int(m[1]), int(m[2])
+        items = "".join(thread_link((b * PAGES + p) * PER + k) for k in range(PER))
+        pager = "".join(f"<a href='/forum-{b}-{q}.html'>{q}</a> "
+                        for q in range(max(1, p - 2), min(PAGES, p + 2) + 1) if q != p)
+        if p < PAGES:
+            pager += f"<a class='nxt' href='/forum-{b}-{p + 1}.html'>next</a>"
+        return items + pager + noise(rnd)
+    if m := re.fullmatch(r"/thread-(\d+)-1-1\.html", path):
+        tid = int(m[1])
+        related = rnd.sample(THREADS, 6)
+        if TOPICS.get(tid):
+            related += [t for t in rnd.sample(THREADS, 200) if TOPICS[t]][:3]
+        return "".join(thread_link(t) for t in related) + noise(rnd)
+    if re.fullmatch(r"/(member|tag)/\d+", path):
+        return noise(rnd) + "".join(thread_link(t) for t in rnd.sample(THREADS, 2))
+    return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = render(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = f"<html><head><title>{self.path}</title></head><body>{body}</body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def crawl(base: str, strategy: str, budget: int) -> tuple[int, float]:
+    from app.blueprints.crawler.tasks import CRAWLS, run_crawl_task
+    from app.blueprints.main.canonical_url import canonical_url
+
+    t0 = time.monotonic()
+    crawl_id = run_crawl_task(base + "/", KEYWORD, backend="requests", pause_seconds=0.0005,
+                              max_pages=budget, max_depth=10, concurrency=4, strategy=strategy)
+    while CRAWLS[crawl_id]["progress"]["status"] in ("queued", "running"):
+        time.sleep(0.05)
+    found = {canonical_url(url) for _text, url in CRAWLS[crawl_id]["results"]}
+    return len(found), time.monotonic() - t0
+
+
+def main(budgets=(50, 100, 200, 400)):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    lines = [f"site: {sum(TOPICS.values())} {KEYWORD} threads of {len(TOPICS)}"]
+    for budget in budgets:
+        row = []
+        for strategy in ("bfs", "best_first"):
+            found, took = crawl(base, strategy, budget)
+            row.append(f"{strategy:10s} {found:4d} matches {found / budget:5.2f}/page {took:5.1f}s")
+        lines.append(f"budget {budget:4d}:  " + "  |  ".join(row))
+    server.shutdown()
+    print("\n".join(lines))   # after the crawls: their worker threads print to stdout too
+
+
+if __name__ == "__main__":
+    main(tuple(int(a) for a in sys.argv[1:]) or (50, 100, 200, 400))
@@ -0,0 +1,56 @@
+"""
+Decode and decode+parse time for the saved legacy-charset pages in
+tests/fixtures/pages: the fetch layer's old path (requests' Response.text,
+which runs charset detection when no charset header is sent) against
+decode_html (BOM, header, <meta>, strict UTF-8, detection last).
+
+    python benchmarks/bench_decode.py [repeat]
+"""
+from pathlib import Path
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import requests  # noqa: E402
+
+from app.blueprints.main.parsed_page import ParsedPage  # noqa: E402
+from app.blueprints.main.parser_utils import decode_html  # noqa: E402
+
+PAGES = ROOT / "tests" / "fixtures" / "pages"
+URL = "http://forum.example.com/forum/list?page=1"
+
+
+def requests_text(body: bytes) -> str:
+    r = requests.models.Response()
+    r._content = body
+    r.headers["Content-Type"] = "text/html"   # no charset, as most forums send it
+    r.encoding = None
+    return r.text
+
+
+def best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main(repeat: int = 5):
+    print(f"{'page':30s} {'KB':>5s} | {'decode: old':>11s} {'new':>7s} | {'+parse: old':>11s} {'new':>7s}")
+    for path in sorted(PAGES.glob("*.html")):
+        body = path.read_bytes()
+        old = best_ms(lambda: requests_text(body), repeat)
+        new = best_ms(lambda: decode_html(body), repeat)
+        old_p = best_ms(lambda: ParsedPage(requests_text(body), URL).links, repeat)
+        new_p = best_ms(lambda: ParsedPage(decode_html(body), URL).links, repeat)
+        same = "" if requests_text(body) == decode_html(body) else "  (old decode differs)"
+        print(f"{path.name:30s} {len(body) // 1024:5d} | {old:9.1f}ms {new:5.1f}ms | "
+              f"{old_p:9.1f}ms {new_p:5.1f}ms{same}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,51 @@
+"""
+lxml fast path against the bs4 fallback on the saved pages in
+tests/fixtures/pages: link extraction alone, and everything a scan asks
+of a page (links, next-page link, visible text).
+
+    python benchmarks/bench_parsers.py [repeat]
+"""
+from pathlib import Path
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.blueprints.main.parsed_page import ParsedPage  # noqa: E402
+from app.blueprints.main.parser_utils import decode_html, find_next_page_url  # noqa: E402
+
+PAGES = ROOT / "tests" / "fixtures" / "pages"
+URL = "http://forum.example.com/forum/list?page=1"
+BACKENDS = ("bs4", "lxml")
+
+
+def best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def scan(html_text: str, parser: str):
+    page = ParsedPage(html_text, URL, parser=parser, with_text=True)
+    find_next_page_url(page.anchors, URL)
+    return page.text
+
+
+def main(repeat: int = 5):
+    print(f"{'page':30s} {'KB':>4s} {'links':>6s} | {'links: bs4':>10s} {'lxml':>7s} | {'scan: bs4':>9s} {'lxml':>7s}")
+    for path in sorted(PAGES.glob("*.html")):
+        html_text = decode_html(path.read_bytes())
+        links = {p: best_ms(lambda: ParsedPage(html_text, URL, parser=p).links, repeat) for p in BACKENDS}
+        scans = {p: best_ms(lambda: scan(html_text, p), repeat) for p in BACKENDS}
+        n = len(ParsedPage(html_text, URL).links)
+        print(f"{path.name:30s} {len(html_text.encode()) // 1024:4d} {n:6d} | "
+              f"{links['bs4']:8.1f}ms {links['lxml']:5.1f}ms | {scans['bs4']:7.1f}ms {scans['lxml']:5.1f}ms "
+              f"({scans['bs4'] / scans['lxml']:.0f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
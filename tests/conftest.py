@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+# caches, checkpoints and the database go to a scratch directory, not instance/
+os.environ.setdefault("SCRAPER_DATA_DIR", tempfile.mkdtemp(prefix="scraper-tests-"))
+
+PAGES = Path(__file__).parent / "fixtures" / "pages"
+
+
+@pytest.fixture
+def page_bytes():
+    """Raw bytes of a saved page under tests/fixtures/pages/."""
+    return lambda name: (PAGES / name).read_bytes()
@@ -0,0 +1,129 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+
+from app.blueprints.main import canonical_url as canon
+from app.blueprints.main.canonical_url import SiteRule, canonical_url
+
+
+@pytest.mark.parametrize("href, expected", [
+    # tracking and session parameters go, the rest are sorted by name
+    ("http://f.example.com/t?utm_source=x&b=2&fbclid=y&a=1", "http://f.example.com/t?a=1&b=2"),
+    ("http://f.example.com/viewtopic.php?t=5&sid=0123456789abcdef0123456789abcdef",
+     "http://f.example.com/viewtopic.php?t=5"),
+    ("http://f.example.com/forum.php?mod=viewthread&tid=1&extra=page%3D2",
+     "http://f.example.com/forum.php?mod=viewthread&tid=1"),
+    # vBulletin s= is a session only when it looks like one
+    ("http://f.example.com/showthread.php?t=1&s=0123456789abcdef0123456789abcdef",
+     "http://f.example.com/showthread.php?t=1"),
+    ("http://f.example.com/search.php?s=apple", "http://f.example.com/search.php?s=apple"),
+    ("http://f.example.com/a?x=1&amp;amp;y=2", "http://f.example.com/a?x=1&y=2"),
+    # default ports, case, trailing-dot hosts, fragments
+    ("HTTP://F.Example.COM:80/a#top", "http://f.example.com/a"),
+    ("https://f.example.com:443/a", "https://f.example.com/a"),
+    ("https://f.example.com:80/a", "https://f.example.com:80/a"),
+    ("http://f.example.com./a", "http://f.example.com/a"),
+    # escapes: one spelling each
+    ("http://f.example.com/%7euser/%2f", "http://f.example.com/~user/%2F"),
+    # index files and trailing slashes
+    ("http://f.example.com/forum/index.php", "http://f.example.com/forum"),
+    ("http://f.example.com/forum/index.php?f=1", "http://f.example.com/forum/index.php?f=1"),
+    ("http://f.example.com/threads/t.0/", "http://f.example.com/threads/t.0"),
+    ("http://f.example.com/", "http://f.example.com/"),
+    ("http://f.example.com", "http://f.example.com/"),
+    # IPv6 literals keep their brackets, with or without a port
+    ("http://[::1]/a", "http://[::1]/a"),
+    ("http://[2001:DB8::1]:8080/a/", "http://[2001:db8::1]:8080/a"),
+    ("https://[::1]:443/", "https://[::1]/"),
+])
+def test_canonical_forms(href, expected):
+    assert canonical_url(href) == expected
+
+
+@pytest.mark.parametrize("href", ["", "mailto:x@example.com", "javascript:void(0)", "ftp://f.example.com/a",
+                                  "http:///nohost"])
+def test_not_a_page(href):
+    assert canonical_url(href) is None
+
+
+def test_relative_href_resolves_against_base():
+    assert canonical_url("../t/1/?sid=abc", "http://f.example.com/forum/list/") == "http://f.example.com/forum/t/1"
+
+
+@pytest.fixture
+def site_rule(monkeypatch):
+    def install(host, rule):
+        monkeypatch.setitem(canon.SITE_RULES, host, rule)
+        canonical_url.cache_clear()
+    yield install
+    canonical_url.cache_clear()
+
+
+def test_site_rules_apply_to_host_and_subdomains(site_rule):
+    site_rule("example.org", SiteRule(drop=("from",), keep=("sid",), sort_query=False, strip_slash=False))
+    assert canonical_url("http://bbs.example.org/t/?sid=abc&b=2&from=home&a=1") == \
+        "http://bbs.example.org/t/?sid=abc&b=2&a=1"
+    assert canonical_url("http://example.org/t/") == "http://example.org/t/"
+    # other hosts keep the default rule
+    assert canonical_url("http://example.com/t/?sid=abc&b=2&a=1") == "http://example.com/t?a=1&b=2"
+
+
+def test_index_rules(site_rule):
+    site_rule("f.example.com", SiteRule(index_with_query=True))
+    assert canonical_url("http://f.example.com/index.php?f=1") == "http://f.example.com/?f=1"
+    site_rule("f.example.com", SiteRule(collapse_index=False))
+    assert canonical_url("http://f.example.com/forum/index.php") == "http://f.example.com/forum/index.php"
+
+
+class _Thread(BaseHTTPRequestHandler):
+    """A XenForo-style site: threads live at /threads/x/, the slash-less spelling redirects there."""
+    hits = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if self.path == "/threads/t.0":
+            self.send_response(301)
+            self.send_header("Location", "/threads/t.0/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/robots.txt":
+            self.send_error(404)
+            return
+        links = "".join(f"<a href='{h}'>apple</a>" for h in (
+            "/threads/t.0/", "/threads/t.0/", "/threads/t.0/?utm_source=feed", "/threads/t.0"))
+        data = f"<html><body>{links}</body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def test_crawl_fetches_links_as_found():
+    from app.blueprints.crawler.tasks import CRAWLS, run_crawl_task
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Thread)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    _Thread.hits.clear()
+    try:
+        crawl_id = run_crawl_task(f"{base}/", "apple", pause_seconds=0, max_pages=10, max_depth=2,
+                                  concurrency=2)
+        deadline = time.monotonic() + 30
+        while CRAWLS[crawl_id]["progress"]["status"] in ("queued", "running"):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        prog = CRAWLS[crawl_id]["progress"]
+        assert prog["status"] == "done"
+        # one request for the thread, under the name the site uses
+        assert [p for p in _Thread.hits if p != "/robots.txt"] == ["/", "/threads/t.0/"]
+        # the repeated href is not a collapse; the two other spellings are
+        assert prog["collapsed"] == 2
+    finally:
+        server.shutdown()
@@ -0,0 +1,187 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import random
+import threading
+import time
+import uuid
+
+import pytest
+
+from app.blueprints.crawler.checkpoint import Checkpoint, fcntl, list_checkpoints
+from app.blueprints.crawler.frontier import (
+    BloomFilter, FingerprintSet, Frontier, PriorityFrontier, load_set,
+)
+
+
+@pytest.fixture
+def ckpt():
+    c = Checkpoint(str(uuid.uuid4()))
+    yield c
+    c.release()
+    c.delete()
+
+
+def drain(frontier):
+    out = []
+    while (item := frontier.pop()) is not None:
+        out.append(item)
+    return out
+
+
+def crawl_state(frontier_cls, mem_limit=16):
+    """A frontier part-way through a crawl (spilled to disk) and the pages visited so far."""
+    rnd = random.Random(25)
+    frontier = frontier_cls(str(uuid.uuid4()), mem_limit=mem_limit)
+    for i in range(300):
+        frontier.push(f"http://forum.example.com/t/{i}", i % 6, float(rnd.randint(0, 5)))
+    visited = FingerprintSet()
+    for _ in range(40):
+        url, _depth = frontier.pop()
+        visited.add(url)
+    return frontier, visited
+
+
+@pytest.mark.parametrize("frontier_cls", [Frontier, PriorityFrontier])
+def test_round_trip_keeps_pop_order_and_visited(ckpt, frontier_cls):
+    frontier, visited = crawl_state(frontier_cls)
+    assert frontier.spilled
+    state = {"meta": {"start_url": "http://forum.example.com/"},
+             "requeue": [("http://forum.example.com/t/0", 0)]}
+    ckpt.save(state, {"visited": visited, "queued": frontier.seen}, frontier)
+
+    saved = ckpt.load()
+    assert saved["meta"] == state["meta"]
+    assert [tuple(item) for item in saved["requeue"]] == state["requeue"]
+    assert saved["saved_at"] <= time.time()
+
+    loaded = load_set(ckpt.set_bytes("visited"))
+    assert len(loaded) == len(visited) == 40
+    assert all((f"http://forum.example.com/t/{i}" in loaded) == (f"http://forum.example.com/t/{i}" in visited)
+               for i in range(300))
+
+    restored = frontier_cls(str(uuid.uuid4()), mem_limit=16, seen=load_set(ckpt.set_bytes("queued")))
+    restored.restore(ckpt.entries())
+    try:
+        assert len(restored) == len(frontier) == 260
+        assert not restored.push("http://forum.example.com/t/299", 0, 9.0)   # still known as queued
+        assert drain(restored) == drain(frontier)
+    finally:
+        frontier.close()
+        restored.close()
+
+
+def test_bloom_filter_round_trip():
+    bloom = BloomFilter(capacity=1000)
+    urls = [f"http://forum.example.com/t/{i}" for i in range(500)]
+    for url in urls[::2]:
+        bloom.add(url)
+    again = load_set(bloom.to_bytes())
+    assert isinstance(again, BloomFilter) and len(again) == len(bloom)
+    assert all((url in again) == (url in bloom) for url in urls)
+
+
+def test_failed_save_leaves_previous_checkpoint(ckpt):
+    frontier, visited = crawl_state(Frontier)
+
+    class Broken:
+        def snapshot(self):
+            yield "http://forum.example.com/a", 1, 0.0
+            raise OSError("disk full")
+
+    try:
+        ckpt.save({"progress": {"visited": 1}}, {"visited": visited}, frontier)
+        with pytest.raises(OSError):
+            ckpt.save({"progress": {"visited": 2}}, {"visited": FingerprintSet()}, Broken())
+        assert ckpt.load()["progress"] == {"visited": 1}
+        assert len(load_set(ckpt.set_bytes("visited"))) == 40
+        assert len(list(ckpt.entries())) == len(frontier)
+
+        ckpt.save({"progress": {"visited": 3}}, {"visited": visited}, frontier)   # over the leftover
+        assert ckpt.load()["progress"] == {"visited": 3}
+        assert not ckpt.path.with_name(ckpt.path.name + ".tmp").exists()
+    finally:
+        frontier.close()
+
+
+@pytest.mark.skipif(fcntl is None, reason="no flock on this platform")
+def test_claim_is_exclusive(ckpt):
+    ckpt.save({"progress": {}}, {}, Frontier(str(uuid.uuid4())))
+    other = Checkpoint(ckpt.crawl_id)   # another worker process opens its own lock file
+    assert ckpt.claim()
+    assert not other.claim()
+    assert other.running()
+    assert ckpt.crawl_id not in dict(list_checkpoints())   # running: not offered for resume
+
+    ckpt.release()
+    assert not other.running()
+    assert ckpt.crawl_id in dict(list_checkpoints())
+    assert other.claim()
+    assert not ckpt.claim()
+    other.release()
+
+
+class _Forum(BaseHTTPRequestHandler):
+    hits = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.hits.append(self.path)
+        if self.path == "/robots.txt":
+            self.send_response(404)
+            self.end_headers()
+            return
+        n = int(self.path.rsplit("/", 1)[-1] or 0)
+        data = f"<html><body><a href='/t/{n + 10}'>apple {n + 10}</a></body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def test_resume_fetches_pages_in_flight_again(ckpt):
+    from app.blueprints.crawler.tasks import CRAWLS, resume_crawl_task
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Forum)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    _Forum.hits.clear()
+    try:
+        # the crawl of base/ was cut short with /t/1 in flight and /t/2 off the frontier
+        # (waiting for its robots.txt); /t/3 was still queued
+        visited, queued = FingerprintSet(), FingerprintSet()
+        for url in (f"{base}/", f"{base}/t/1"):
+            visited.add(url)
+        frontier = Frontier(str(uuid.uuid4()))
+        for url in (f"{base}/", f"{base}/t/1", f"{base}/t/2"):
+            frontier.seen.add(url)
+        frontier.push(f"{base}/t/3", 1)
+        meta = {"start_url": f"{base}/", "keyword": "apple", "sub_keyword": "", "match_text": True,
+                "match_url": True, "same_domain": True, "backend": "requests", "pause_seconds": 0.01,
+                "max_pages": 5, "max_depth": 1, "concurrency": 2, "strategy": "bfs",
+                "use_sitemaps": False, "user_id": None}
+        progress = {"status": "running", "visited": 2, "queued": 1, "matches": 0,
+                    "skipped": 0, "bytes_saved": 0, "collapsed": 0}
+        ckpt.save({"meta": meta, "progress": progress, "results": [],
+                   "stats": {"dispatched": 1, "fetched": 1, "errors": 0},
+                   "requeue": [(f"{base}/t/1", 1)], "held": [(f"{base}/t/2", 1)]},
+                  {"visited": visited, "queued": frontier.seen,
+                   "rewritten": FingerprintSet(), "skipped": FingerprintSet()},
+                  frontier)
+        frontier.close()
+
+        assert resume_crawl_task(ckpt.crawl_id)
+        deadline = time.monotonic() + 30
+        while CRAWLS[ckpt.crawl_id]["progress"]["status"] in ("queued", "running"):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+        assert CRAWLS[ckpt.crawl_id]["progress"]["status"] == "done"
+        pages = [p for p in _Forum.hits if p != "/robots.txt"]
+        assert sorted(pages) == ["/t/1", "/t/2", "/t/3"]   # the start page is not fetched again
+        assert {url for _text, url in CRAWLS[ckpt.crawl_id]["results"]} == {
+            f"{base}/t/11", f"{base}/t/12", f"{base}/t/13"}
+        assert not ckpt.exists()   # finished: the checkpoint goes
+    finally:
+        server.shutdown()
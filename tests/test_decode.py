@@ -0,0 +1,35 @@
+import pytest
+
+from app.blueprints.main.parser_utils import decode_html
+
+# saved pages in the charsets forums still serve, with the <title> they must decode to
+LEGACY_PAGES = {
+    "discuz_gbk.html": "苹果讨论区 -  Discuz! Board",
+    "discuz_gbk_undeclared.html": "苹果讨论区 -  Discuz! Board",   # no charset anywhere
+    "board_shift_jis.html": "りんご総合スレッド Part12",
+    "phpbb_windows1251.html": "Сад и огород - Форум садоводов",
+    "vbulletin_big5.html": "蘋果討論區 - 香港論壇",
+}
+
+
+@pytest.mark.parametrize("name", sorted(LEGACY_PAGES))
+def test_legacy_charset_pages(page_bytes, name):
+    text = decode_html(page_bytes(name))
+    assert f"<title>{LEGACY_PAGES[name]}</title>" in text
+    assert "�" not in text
+
+
+def test_http_charset_wins_over_meta():
+    body = "<meta charset='windows-1251'><title>Форум садоводов</title>".encode("koi8-r")
+    assert "Форум садоводов" in decode_html(body, "koi8-r")
+    assert "Форум садоводов" not in decode_html(body)
+
+
+def test_bom_wins_over_everything():
+    body = "﻿<meta charset='gbk'><title>café</title>".encode("utf-8")
+    assert decode_html(body, "iso-8859-1") == "<meta charset='gbk'><title>café</title>"
+
+
+def test_undeclared_utf8_and_str_passthrough():
+    assert decode_html("<p>é</p>".encode("utf-8")) == "<p>é</p>"
+    assert decode_html("<p>é</p>") == "<p>é</p>"
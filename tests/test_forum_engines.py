@@ -0,0 +1,81 @@
+import pytest
+
+from app.blueprints.main.forum_engines import plan_pages
+from app.blueprints.main.parsed_page import ParsedPage
+from app.blueprints.main.parser_utils import decode_html
+
+
+def plan(page_bytes, name, url, max_pages=50):
+    return plan_pages(ParsedPage(decode_html(page_bytes(name)), url), max_pages)
+
+
+def test_discuz_thread_rewrite_reads_page_count_label(page_bytes):
+    # the pager links stop at 4 and "... 12"; 共 12 页 confirms the count
+    p = plan(page_bytes, "discuz_thread.html", "http://bbs.example.cn/thread-1000-1-1.html")
+    assert (p.engine, p.current, p.last) == ("discuz", 1, 12)
+    assert p.urls == [f"http://bbs.example.cn/thread-1000-{n}-1.html" for n in range(2, 13)]
+
+
+def test_discuz_forum_listing(page_bytes):
+    p = plan(page_bytes, "discuz_gbk.html", "http://bbs.example.cn/forum.php?mod=forumdisplay&fid=2")
+    assert (p.engine, p.current, p.last) == ("discuz", 1, 3)
+    assert p.urls == [f"http://bbs.example.cn/forum.php?mod=forumdisplay&fid=2&page={n}" for n in (2, 3)]
+
+
+def test_phpbb_steps_by_posts_per_page(page_bytes):
+    p = plan(page_bytes, "phpbb_topic.html", "http://forum.example.com/viewtopic.php?f=4&t=500")
+    assert (p.engine, p.current, p.last) == ("phpbb", 1, 10)
+    assert p.urls == [f"http://forum.example.com/viewtopic.php?f=4&t=500&start={15 * n}"
+                      for n in range(1, 10)]
+
+
+def test_phpbb_forum_listing(page_bytes):
+    p = plan(page_bytes, "phpbb_windows1251.html", "http://forum.example.ru/viewforum.php?f=4&sid=0123abcd")
+    assert (p.engine, p.last) == ("phpbb", 2)
+    assert p.urls == ["http://forum.example.ru/viewforum.php?f=4&sid=0123abcd&start=25"]
+
+
+def test_vbulletin_rewrite_reads_page_of_label(page_bytes):
+    p = plan(page_bytes, "vbulletin_rewrite.html", "http://forum.example.com/threads/7000-apple-pie-recipes/")
+    assert (p.engine, p.current, p.last) == ("vbulletin", 1, 9)
+    assert p.urls == [f"http://forum.example.com/threads/7000-apple-pie-recipes/page{n}" for n in range(2, 10)]
+
+
+def test_vbulletin_query(page_bytes):
+    p = plan(page_bytes, "vbulletin_big5.html", "http://forum.example.tw/forumdisplay.php?f=8")
+    assert (p.engine, p.last) == ("vbulletin", 2)
+    assert p.urls == ["http://forum.example.tw/forumdisplay.php?f=8&page=2"]
+
+
+def test_xenforo_from_a_middle_page(page_bytes):
+    p = plan(page_bytes, "xenforo_thread.html", "http://forum.example.com/threads/apple-pie-recipes.9000/page-3")
+    assert (p.engine, p.current, p.last) == ("xenforo", 3, 7)
+    assert p.urls == [f"http://forum.example.com/threads/apple-pie-recipes.9000/page-{n}" for n in range(4, 8)]
+
+
+def test_xenforo_forum_listing(page_bytes):
+    p = plan(page_bytes, "xenforo_utf8.html", "http://forum.example.com/forums/baking.3/")
+    assert (p.engine, p.urls) == ("xenforo", ["http://forum.example.com/forums/baking.3/page-2"])
+
+
+def test_generic_fallback_keeps_the_pager_query(page_bytes):
+    # topic=6&page=40 is another topic, not page 40 of this one
+    p = plan(page_bytes, "generic_pager.html", "http://board.example.com/index.php?topic=5&sort=old&page=2")
+    assert (p.engine, p.current, p.last) == ("generic", 2, 6)
+    assert p.urls == [f"http://board.example.com/index.php?topic=5&sort=old&page={n}" for n in range(3, 7)]
+
+
+def test_plan_is_capped_by_max_pages(page_bytes):
+    p = plan(page_bytes, "discuz_thread.html", "http://bbs.example.cn/thread-1000-1-1.html", max_pages=4)
+    assert p.last == 12 and len(p.urls) == 3
+    assert plan(page_bytes, "discuz_thread.html", "http://bbs.example.cn/thread-1000-1-1.html", max_pages=1) is None
+
+
+@pytest.mark.parametrize("name, url", [
+    ("quirks.html", "http://forum.example.com/x"),
+    ("board_shift_jis.html", "http://example.2ch.net/news/"),
+    # the last page: nothing after it to plan
+    ("xenforo_thread.html", "http://forum.example.com/threads/apple-pie-recipes.9000/page-7"),
+])
+def test_no_plan(page_bytes, name, url):
+    assert plan(page_bytes, name, url) is None
@@ -0,0 +1,95 @@
+import heapq
+import itertools
+import random
+
+import pytest
+
+from app.blueprints.crawler.frontier import PriorityFrontier
+
+
+@pytest.fixture
+def make_frontier():
+    names = (f"test-{n}" for n in itertools.count())
+    made = []
+
+    def make(cls=PriorityFrontier, mem_limit=8):
+        frontier = cls(next(names), mem_limit=mem_limit)
+        made.append(frontier)
+        return frontier
+    yield make
+    for frontier in made:
+        frontier.close()
+
+
+def drain(frontier):
+    out = []
+    while (item := frontier.pop()) is not None:
+        out.append(item)
+    return out
+
+
+class Reference:
+    """Highest score first, first pushed first among equal scores."""
+
+    def __init__(self):
+        self._heap, self._seq = [], itertools.count()
+
+    def push(self, url, depth, score):
+        heapq.heappush(self._heap, (-score, next(self._seq), url, depth))
+
+    def pop(self):
+        return heapq.heappop(self._heap)[2:] if self._heap else None
+
+
+def test_ties_pop_in_push_order(make_frontier):
+    pf = make_frontier(mem_limit=100)
+    for i, score in enumerate([1, 3, 3, 1, 2, 3, 1]):
+        pf.push(f"/p{i}", 0, score)
+    assert [url for url, _ in drain(pf)] == ["/p1", "/p2", "/p5", "/p4", "/p0", "/p3", "/p6"]
+
+
+def test_push_is_deduplicated(make_frontier):
+    pf = make_frontier()
+    assert pf.push("/a", 0, 1.0)
+    assert not pf.push("/a", 1, 9.0)
+    assert drain(pf) == [("/a", 0)]
+
+
+@pytest.mark.parametrize("mem_limit", [1, 2, 7, 64])
+def test_spill_and_refill_keep_best_first_order(make_frontier, mem_limit):
+    rnd = random.Random(mem_limit)
+    pf, ref = make_frontier(mem_limit=mem_limit), Reference()
+    popped, expected = [], []
+    for i in range(600):
+        url, depth, score = f"/t{i}", i % 5, float(rnd.randint(0, 9))   # plenty of ties
+        pf.push(url, depth, score)
+        ref.push(url, depth, score)
+        if rnd.random() < 0.3:   # pops interleaved with pushes, across spills
+            popped.append(pf.pop())
+            expected.append(ref.pop())
+    assert pf.spilled or mem_limit == 64
+    assert len(pf) == 600 - len(popped)
+    popped += drain(pf)
+    while (item := ref.pop()) is not None:
+        expected.append(item)
+    assert popped == expected
+    assert len(pf) == 0 and pf.spilled == 0
+
+
+def test_snapshot_is_pop_order_and_restore_keeps_it(make_frontier):
+    rnd = random.Random(3)
+    pf = make_frontier(mem_limit=10)
+    for i in range(200):
+        pf.push(f"/s{i}", i % 4, float(rnd.randint(0, 4)))
+    for _ in range(30):
+        pf.pop()
+    assert pf.spilled
+    snap = list(pf.snapshot())
+    assert len(snap) == len(pf) == 170
+
+    again = make_frontier(mem_limit=10)
+    for url, _depth, _score in snap:
+        again.seen.add(url)
+    again.restore(snap)
+    assert list(again.snapshot()) == snap
+    assert drain(pf) == drain(again) == [(url, depth) for url, depth, _score in snap]
@@ -0,0 +1,52 @@
+"""The lxml fast path and the bs4 fallback must read pages the same way."""
+from pathlib import Path
+
+import pytest
+
+from app.blueprints.main.parsed_page import ParsedPage
+from app.blueprints.main.parser_utils import decode_html
+
+pytest.importorskip("lxml")
+
+PAGES = sorted(p.name for p in (Path(__file__).parent / "fixtures" / "pages").glob("*.html"))
+URL = "http://forum.example.com/forum/list?page=1"
+
+
+def both(html_text: str, **kw):
+    return (ParsedPage(html_text, URL, parser="lxml", **kw),
+            ParsedPage(html_text, URL, parser="bs4", **kw))
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_links_title_and_text_match(page_bytes, name):
+    fast, slow = both(decode_html(page_bytes(name)))
+    assert fast.links == slow.links
+    assert fast.title == slow.title
+    assert fast.text == slow.text
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_text_first_gives_same_anchor_spans(page_bytes, name):
+    fast, slow = both(decode_html(page_bytes(name)), with_text=True)
+    assert [a.span for a in fast.anchors] == [a.span for a in slow.anchors]
+    assert fast.links == ParsedPage(fast.html_text, URL, parser="lxml").links
+
+
+@pytest.mark.parametrize("html_text, expected", [
+    # nested <a>: the first one ends where the second starts
+    ('<a href="/u1">one<a href="/u2">two</a>', [("one", "http://forum.example.com/u1"),
+                                                ("two", "http://forum.example.com/u2")]),
+    # duplicate attribute: the first one counts
+    ('<a href="/dup" href="/dup2">dup</a>', [("dup", "http://forum.example.com/dup")]),
+    # "&copy" without a semicolon inside an attribute is not an entity
+    ('<a href="/e?a=1&copy=3">e</a>', [("e", "http://forum.example.com/e?a=1&copy=3")]),
+])
+def test_lxml_follows_browsers_on_broken_markup(html_text, expected):
+    assert ParsedPage(html_text, URL, parser="lxml").links == expected
+
+
+def test_empty_pages():
+    for html_text in ("", "   \n "):
+        fast, slow = both(html_text)
+        assert fast.links == slow.links == []
+        assert fast.text == slow.text == ""
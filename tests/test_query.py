@@ -0,0 +1,120 @@
+import pytest
+
+from app.blueprints.main.query import QuerySyntaxError, compile_query, link_predicate
+
+
+def matches(query, text, url="", **fields):
+    return compile_query(query, **fields)(text, url)
+
+
+@pytest.mark.parametrize("query, text, expected", [
+    # AND binds tighter than OR
+    ("a OR b AND c", "a", True),
+    ("a OR b AND c", "b", False),
+    ("a OR b AND c", "b c", True),
+    ("(a OR b) AND c", "a", False),
+    ("(a OR b) AND c", "a c", True),
+    # NOT binds tighter than AND
+    ("NOT a AND b", "b", True),
+    ("NOT a AND b", "a b", False),
+    ("NOT (a AND b)", "a", True),
+    ("-spam | ham", "spam ham", True),
+    ("-spam | ham", "spam", False),
+    # other adjacent atoms are ANDed
+    ('"x" "y"', "x", False),
+    ('"x" "y"', "y x", True),
+])
+def test_precedence(query, text, expected):
+    assert matches(query, text) is expected
+
+
+def test_quoted_phrase_is_literal():
+    assert matches('"new, york"', "I love New, York")
+    assert not matches('"new, york"', "new york")
+    assert matches('"a AND b"', "a and b")        # operators inside quotes are text
+    assert matches('"NOT"', "not sure")
+    assert compile_query('"Rock & Roll" + live').terms == ("rock & roll", "live")
+
+
+def test_field_prefixes():
+    q = compile_query("url:thread text:apple")
+    assert q("Apple pie", "http://f.example/THREAD/1")
+    assert not q("apple pie", "http://f.example/post/1")
+    assert not q("pear", "http://f.example/thread/apple")
+    assert compile_query('url:"t=1"')("", "http://f/?t=1")
+    assert matches("author:jack", "by author:jack")   # not a prefix: plain text
+
+
+def test_unscoped_terms_follow_match_fields():
+    assert matches("apple", "", "http://f/apple")
+    assert not matches("apple", "", "http://f/apple", match_url=False)
+    assert not matches("apple", "apple", "", match_text=False)
+    assert not matches("apple", "apple", "", match_text=False, match_url=False)
+    assert matches("url:apple", "", "http://f/apple", match_url=False)   # explicit scope still applies
+
+
+def test_regex():
+    assert matches("re:^page-\\d$", "Page-1")
+    assert matches('re:"^page-\\d+$"', "Page-12")   # operator characters need quotes
+    assert matches('re:"a(b|c)d"', "xacd")
+    assert matches('url:re:"/t/\\d+$"', "", "http://f/t/42")
+    assert not matches('url:re:"/t/\\d+$"', "/t/42", "http://f/")
+
+
+@pytest.mark.parametrize("query", [
+    're:"(unclosed"',
+    're:"[a-"',
+    "url:re:*",
+])
+def test_bad_regex_is_a_syntax_error(query):
+    with pytest.raises(QuerySyntaxError, match="regular expression"):
+        compile_query(query)
+
+
+@pytest.mark.parametrize("query, message", [
+    ("(a OR b", "unclosed '\\('"),
+    ("((a)", "unclosed '\\('"),
+    ("a OR b)", "unexpected '\\)'"),
+    ("()", "unexpected '\\)'"),
+    ('"open', "unclosed quote"),
+    ("NOT", "query ends"),
+    ("url:", "missing term"),
+])
+def test_malformed_queries(query, message):
+    with pytest.raises(QuerySyntaxError, match=message):
+        compile_query(query)
+    assert issubclass(QuerySyntaxError, ValueError)
+
+
+@pytest.mark.parametrize("query, text, expected", [
+    # the old syntax: ',' is OR, '+' is AND, bare words run together into a phrase
+    ("new york, boston", "going to boston", True),
+    ("new york, boston", "new york city", True),
+    ("new york, boston", "york new", False),
+    ("apple + pie", "pie made of apple", True),
+    ("apple + pie", "apple tart", False),
+    ("apple + pie, cake", "cake", True),
+    ("apple + pie, cake", "apple", False),
+    # empty terms were ignored
+    ("apple,", "apple", True),
+    ("apple,,pie", "pie", True),
+    ("+apple", "apple", True),
+    (", apple +", "apple", True),
+])
+def test_legacy_syntax(query, text, expected):
+    assert matches(query, text) is expected
+
+
+def test_terms_skip_negated_literals():
+    assert compile_query("apple, pear -worm (plum OR re:x+)").terms == ("apple", "pear", "plum")
+
+
+def test_link_predicate_ands_keyword_and_refine():
+    pred = link_predicate("Forum", "apple, pear")
+    assert pred("forum: apple", "")
+    assert not pred("forum", "")
+    assert not pred("apple", "")
+    assert pred.terms == ("forum", "apple", "pear")
+    assert link_predicate("", "")("anything", "") and not link_predicate("", "")
+    assert link_predicate("forum", "", match_text=False)("", "http://x/forum")
+    assert not link_predicate("forum", "", match_text=False, match_url=False)("forum", "forum")
@@ -0,0 +1,33 @@
+from app.blueprints.main.rate_limit import DEFAULT_RPS, MAX_RPS, RateLimiter, rate_from_pause
+
+URL = "http://forum.example.com/"
+
+
+def test_pause_to_rate():
+    assert rate_from_pause(0.5) == 2.0
+    assert rate_from_pause(0) == MAX_RPS      # no pause asked for: not the 4 rps default
+    assert rate_from_pause(None) == DEFAULT_RPS
+
+
+def test_new_bucket_starts_at_its_target():
+    limiter = RateLimiter(default_rps=4.0)
+    limiter.configure(URL, target_rate=20.0)
+    assert limiter.snapshot()["forum.example.com"]["rate"] == 20.0
+    limiter.configure(URL, target_rate=2.0)
+    assert limiter.snapshot()["forum.example.com"]["rate"] == 2.0
+
+
+def test_backed_off_bucket_stays_slow():
+    limiter = RateLimiter(default_rps=4.0)
+    limiter.configure(URL, target_rate=10.0)
+    limiter.feedback(URL, 429)
+    limiter.configure(URL, target_rate=20.0)
+    snap = limiter.snapshot()["forum.example.com"]
+    assert (snap["rate"], snap["target"]) == (5.0, 20.0)
+
+
+def test_zero_pause_does_not_pace_a_burst():
+    limiter = RateLimiter(default_rps=4.0)
+    limiter.configure(URL, target_rate=rate_from_pause(0))
+    waits = [limiter.reserve(URL) for _ in range(20)]
+    assert max(waits) < 20 / MAX_RPS + 0.05
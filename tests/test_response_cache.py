@@ -0,0 +1,61 @@
+import os
+import random
+import sqlite3
+import threading
+
+from app.blueprints.main.fetch_utils import FetchResult
+from app.blueprints.main.response_cache import ResponseCache
+
+
+def result(body: bytes, cache_control: str | None = None) -> FetchResult:
+    headers = {"Cache-Control": cache_control} if cache_control else {}
+    return FetchResult(body, 200, headers, "requests", "utf-8")
+
+
+def stored(cache: ResponseCache):
+    db = sqlite3.connect(os.path.join(cache.root, "index.sqlite3"))
+    try:
+        entries = {h for (h,) in db.execute("SELECT body_hash FROM entries")}
+        bodies = {h for (h,) in db.execute("SELECT body_hash FROM bodies")}
+    finally:
+        db.close()
+    files = [f for _dir, _subdirs, names in os.walk(os.path.join(cache.root, "bodies")) for f in names]
+    return entries, bodies, files
+
+
+def test_entries_are_kept_apart_per_cookie_profile(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.put("https://forum.example.com/", "auto", result(b"alice"), cookie_str="sid=a")
+    assert cache.get("https://forum.example.com/", "auto", cookie_str="sid=a")[1] == b"alice"
+    assert cache.get("https://forum.example.com/", "auto", cookie_str="sid=b") == (None, None)
+    assert cache.get("https://forum.example.com/", "auto") == (None, None)
+
+
+def test_cache_control(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.put("https://forum.example.com/p", "auto", result(b"page"))
+    cache.put("https://forum.example.com/p", "auto", result(b"page", "private, max-age=60"))
+    assert cache.get("https://forum.example.com/p", "auto") == (None, None)   # the old copy went too
+    cache.put("https://forum.example.com/n", "auto", result(b"page", "no-cache"))
+    assert cache.get("https://forum.example.com/n", "auto")[0]["revalidate"]
+
+
+def test_concurrent_stores_and_evictions_stay_consistent(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=30_000)
+    bodies = [os.urandom(800) for _ in range(40)]
+
+    def store(seed):
+        rnd = random.Random(seed)
+        for _ in range(200):
+            cache.put(f"https://forum.example.com/{rnd.randint(0, 80)}", "auto", result(rnd.choice(bodies)))
+
+    threads = [threading.Thread(target=store, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    entries, bodies_kept, files = stored(cache)
+    assert entries <= bodies_kept
+    assert sorted(f[:-2] for f in files) == sorted(bodies_kept)   # no orphans, no leftover temp files
+    assert cache.total_bytes() == sum(os.path.getsize(cache._body_path(h)) for h in bodies_kept)
+    assert cache.total_bytes() <= 30_000
@@ -0,0 +1,162 @@
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import requests
+
+from app.blueprints.main.rate_limit import RateLimiter, parse_retry_after
+from app.blueprints.main.retry_policy import (
+    BLOCKED, PERMANENT, TRANSIENT, CircuitBreaker, CircuitOpenError, FetchError, RetryPolicy,
+    classify, run_with_retries,
+)
+
+URL = "http://forum.example.com/t/1"
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def http_error(status):
+    return requests.HTTPError(f"{status} error", response=FakeResponse(status))
+
+
+@pytest.mark.parametrize("status, kind, host_level", [
+    (403, BLOCKED, False),
+    (401, BLOCKED, False),
+    (429, TRANSIENT, False),    # the host is fine, just busy with us
+    (503, TRANSIENT, True),
+    (500, TRANSIENT, True),
+    (404, PERMANENT, False),
+    (410, PERMANENT, False),
+])
+def test_status_classification(status, kind, host_level):
+    err = classify(http_error(status), URL)
+    assert (err.kind, err.status, err.host_level) == (kind, status, host_level)
+    assert isinstance(err.__cause__, requests.HTTPError)
+
+
+@pytest.mark.parametrize("exc, kind", [
+    (requests.ConnectionError("Connection reset by peer"), TRANSIENT),
+    (requests.Timeout("read timed out"), TRANSIENT),
+    (requests.ConnectionError("NameResolutionError: Name or service not known"), PERMANENT),
+    (requests.exceptions.SSLError("certificate verify failed"), PERMANENT),
+    (requests.exceptions.InvalidURL("bad"), PERMANENT),
+])
+def test_exception_classification(exc, kind):
+    err = classify(exc, URL)
+    assert err.kind == kind and err.host_level and err.__cause__ is exc
+
+
+def test_fetch_errors_pass_through():
+    err = FetchError("x", BLOCKED, 403, URL)
+    assert classify(err) is err
+
+
+def no_wait_policy(attempts=3):
+    return RetryPolicy(max_attempts=attempts, base_delay=0.0, max_delay=0.0)
+
+
+def failing(*errors, then=None):
+    calls = []
+
+    def attempt(i):
+        calls.append(i)
+        if i < len(errors):
+            raise errors[i]
+        return then
+    return attempt, calls
+
+
+def test_transient_errors_are_retried():
+    attempt, calls = failing(http_error(503), requests.ConnectionError("reset"), then="page")
+    assert run_with_retries(URL, attempt, policy=no_wait_policy(), breaker=CircuitBreaker()) == "page"
+    assert calls == [0, 1, 2]
+
+
+def test_permanent_errors_are_not_retried():
+    attempt, calls = failing(http_error(404), then="page")
+    with pytest.raises(FetchError) as info:
+        run_with_retries(URL, attempt, policy=no_wait_policy(), breaker=CircuitBreaker())
+    assert info.value.kind == PERMANENT and calls == [0]
+
+
+def test_blocked_is_retried_only_when_asked():
+    attempt, calls = failing(http_error(403), then="page")
+    with pytest.raises(FetchError) as info:
+        run_with_retries(URL, attempt, policy=no_wait_policy(), breaker=CircuitBreaker())
+    assert info.value.kind == BLOCKED and calls == [0]
+
+    attempt, calls = failing(http_error(403), then="page")
+    assert run_with_retries(URL, attempt, retry_blocked=True, policy=no_wait_policy(),
+                            breaker=CircuitBreaker()) == "page"
+
+
+def test_last_error_is_raised_with_its_kind_and_cause():
+    attempt, _calls = failing(*[http_error(503)] * 3)
+    with pytest.raises(FetchError) as info:
+        run_with_retries(URL, attempt, policy=no_wait_policy(), breaker=CircuitBreaker())
+    assert (info.value.kind, info.value.status) == (TRANSIENT, 503)
+    assert isinstance(info.value.__cause__.__cause__, requests.HTTPError)
+
+
+def test_backoff_is_capped_full_jitter():
+    policy = RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=2.0)
+    for attempt in range(6):
+        assert 0 <= policy.delay(attempt) <= min(2.0, 0.5 * 2 ** attempt)
+
+
+def test_breaker_trips_half_opens_and_recovers():
+    breaker = CircuitBreaker(threshold=3, cooldown=0.05)
+    host_down = classify(requests.ConnectionError("refused"), URL)
+    for _ in range(3):
+        breaker.check(URL)
+        breaker.record_failure(URL, host_down)
+    assert breaker.is_open(URL)
+    with pytest.raises(CircuitOpenError):
+        breaker.check(URL)
+
+    time.sleep(0.06)
+    breaker.check(URL)                 # half-open: this call is the probe
+    with pytest.raises(CircuitOpenError):
+        breaker.check(URL)             # ... and the only one
+    breaker.record_failure(URL, host_down)
+    assert breaker.snapshot()["forum.example.com"]["retry_in"] > 0.05   # cooldown doubled
+
+    time.sleep(0.11)
+    breaker.check(URL)
+    breaker.record_success(URL)
+    assert not breaker.is_open(URL)
+    breaker.check(URL)
+
+
+def test_page_level_errors_do_not_trip_the_breaker():
+    breaker = CircuitBreaker(threshold=2)
+    for status in (404, 403, 429, 404):
+        breaker.record_failure(URL, classify(http_error(status), URL))
+    assert not breaker.is_open(URL)
+
+
+def test_open_breaker_fails_fast_without_calling():
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record_failure(URL, classify(requests.ConnectionError("refused"), URL))
+    attempt, calls = failing(then="page")
+    with pytest.raises(CircuitOpenError):
+        run_with_retries(URL, attempt, policy=no_wait_policy(), breaker=breaker)
+    assert calls == []
+
+
+def test_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("100000") == 300.0          # capped
+    assert parse_retry_after("soon") is None
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= parse_retry_after(when) <= 30
+
+    limiter = RateLimiter(default_rps=10.0)
+    limiter.feedback(URL, 429, retry_after="2")
+    assert 1.9 <= limiter.reserve(URL) <= 2.0                # held back for Retry-After
+    assert limiter.snapshot()["forum.example.com"]["rate"] == 5.0   # and halved
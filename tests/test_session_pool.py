@@ -0,0 +1,88 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+from app.blueprints.main.fetch_utils import REQUESTS_POOL, SessionPool, _raw_requests, make_session
+from app.blueprints.main.retry_policy import CIRCUIT_BREAKER, FetchError
+
+
+@pytest.fixture
+def server():
+    """/reset drops the connection with a RST; anything else is a keep-alive 404."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(8)
+
+    def handle(conn):
+        with conn:
+            while True:
+                request = b""
+                while b"\r\n\r\n" not in request:
+                    data = conn.recv(4096)
+                    if not data:
+                        return
+                    request += data
+                if request.startswith(b"GET /reset"):
+                    conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                    return
+                conn.sendall(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+
+    def serve():
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    base = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    yield base
+    sock.close()
+    CIRCUIT_BREAKER.record_success(base)
+
+
+def idle_for(pool, url):
+    return len(pool._idle.get(pool._key(url, None, None), []))
+
+
+def test_reset_connection_evicts_the_session(server):
+    url = server + "/reset"
+    with pytest.raises(FetchError) as info:
+        _raw_requests(url)
+    assert info.value.kind == "transient"
+    assert idle_for(REQUESTS_POOL, url) == 0
+
+
+def test_http_error_status_keeps_the_session(server):
+    url = server + "/missing"
+    with pytest.raises(FetchError) as info:
+        _raw_requests(url)
+    assert info.value.status == 404
+    assert idle_for(REQUESTS_POOL, url) == 1
+
+
+def test_only_transport_errors_break_a_lease():
+    import requests
+
+    pool = SessionPool(make_session)
+    url = "http://forum.example.com/"
+    for exc, kept in [(FetchError("403", "blocked", 403), 1),
+                      (FetchError("wrapped", "transient"), 1),
+                      (requests.ConnectionError("reset"), 0)]:
+        with pytest.raises(type(exc)):
+            with pool.lease(url):
+                raise exc
+        assert idle_for(pool, url) == kept
+
+    wrapped = FetchError("reset", "transient")
+    wrapped.__cause__ = requests.exceptions.ChunkedEncodingError("half-read body")
+    with pool.lease(url):
+        pass
+    with pytest.raises(FetchError):
+        with pool.lease(url):
+            raise wrapped
+    assert idle_for(pool, url) == 0
+    pool.close_all()
@@ -0,0 +1,114 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import threading
+
+import pytest
+
+from app.blueprints.main.retry_policy import CIRCUIT_BREAKER
+from app.blueprints.main.robots import iter_sitemap_urls, sitemap_entries
+
+NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+def urlset(urls):
+    body = "".join(f"<url><loc>{u}</loc><lastmod>2024-01-01</lastmod></url>" for u in urls)
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="{NS}">{body}</urlset>'.encode()
+
+
+def test_entries_from_chunks_split_anywhere():
+    urls = [f"http://f.example.com/t/{i}" for i in range(50)]
+    data = urlset(urls)
+    pieces = [data[i:i + 7] for i in range(0, len(data), 7)]
+    assert [loc for _kind, loc in sitemap_entries(pieces)] == urls
+    assert [loc for _kind, loc in sitemap_entries(gzip.compress(data))] == urls
+
+
+def test_plain_text_lines_across_chunks():
+    data = "﻿http://f.example.com/a\r\nhttp://f.example.com/b\rnot a url\nhttp://f.example.com/c".encode()
+    pieces = [data[i:i + 5] for i in range(0, len(data), 5)]
+    assert list(sitemap_entries(pieces)) == [("url", f"http://f.example.com/{c}") for c in "abc"]
+
+
+def test_index_entries():
+    data = (f'<sitemapindex xmlns="{NS}"><sitemap><loc> http://f.example.com/s1.xml </loc></sitemap>'
+            f'</sitemapindex>').encode()
+    assert list(sitemap_entries(data)) == [("sitemap", "http://f.example.com/s1.xml")]
+
+
+class _Sitemaps(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    release = threading.Event()   # the second half of /big.xml waits for this
+    finished = threading.Event()  # ... and this is set once it has been written
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, ctype="application/xml"):
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        if self.path == "/index.xml":
+            self._send((f'<sitemapindex xmlns="{NS}">'
+                        f'<sitemap><loc>{base}/pages.xml.gz</loc></sitemap>'
+                        f'<sitemap><loc>{base}/list.txt</loc></sitemap>'
+                        f'<sitemap><loc>{base}/missing.xml</loc></sitemap>'
+                        f'</sitemapindex>').encode())
+        elif self.path == "/pages.xml.gz":
+            self._send(gzip.compress(urlset([f"{base}/t/{i}" for i in range(3)])), "application/x-gzip")
+        elif self.path == "/list.txt":
+            self._send(f"{base}/p/1\n{base}/p/2\n".encode(), "text/plain")
+        elif self.path == "/big.xml":
+            # chunked, and the second half only once the client has seen a URL of the first
+            data = urlset([f"{base}/t/{i}" for i in range(20000)])
+            self.send_response(200)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            half = len(data) // 2
+            for part in (data[:half], None, data[half:]):
+                if part is None:
+                    self.release.wait(10)
+                    continue
+                for i in range(0, len(part), 8192):
+                    piece = part[i:i + 8192]
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            self.wfile.write(b"0\r\n\r\n")
+            self.finished.set()
+        else:
+            self.send_error(404)
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Sitemaps)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    _Sitemaps.release.clear()
+    _Sitemaps.finished.clear()
+    yield base
+    _Sitemaps.release.set()
+    server.shutdown()
+    CIRCUIT_BREAKER.record_success(base)
+
+
+def test_urls_arrive_while_the_sitemap_downloads(site):
+    urls = iter_sitemap_urls([f"{site}/big.xml"], "requests")
+    assert next(urls) == f"{site}/t/0"
+    assert not _Sitemaps.finished.is_set()   # the first URL came before the file was all sent
+    _Sitemaps.release.set()
+    stats = {}
+    rest = list(iter_sitemap_urls([f"{site}/big.xml"], "requests", stats=stats))
+    assert len(rest) == 20000 and stats == {"sitemaps": 1}
+    urls.close()
+
+
+def test_index_gzip_text_and_failures(site):
+    stats = {}
+    urls = list(iter_sitemap_urls([f"{site}/index.xml"], "requests", stats=stats))
+    assert urls == [*(f"{site}/t/{i}" for i in range(3)), f"{site}/p/1", f"{site}/p/2"]
+    assert stats == {"sitemaps": 3, "sitemap_errors": 1}
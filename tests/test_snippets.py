@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+from app.blueprints.main.snippets import SnippetIndex
+from app.blueprints.main.term_matcher import TermMatcher
+
+
+def test_page_snippet_around_first_term():
+    text = "intro " * 30 + "the apple pie recipe " + "outro " * 30
+    snip = SnippetIndex(text, TermMatcher(["pie", "apple"]), span=20).page_snippet()
+    assert "apple pie" in snip and len(snip) <= 20 + len("pie") + 20
+
+
+def test_offsets_survive_case_folding_that_changes_length():
+    # "İ".lower() is "i̇" - two code points - so the lowered text runs ahead of the original
+    text = "İ" * 50 + " Kaffee und Kuchen " + "x" * 50
+    snippets = SnippetIndex(text, TermMatcher(["KUCHEN"]), span=8)
+    assert snippets.page_snippet() == "und Kuchen"
+
+    start = text.index("Kuchen")
+    assert snippets.hits == [(start, start + len("Kuchen"))]
+    term = SnippetIndex(text, TermMatcher(["i̇"]), span=0)
+    assert term.hits[:2] == [(0, 1), (1, 2)]   # a term that is part of a folded letter
+
+
+def test_anchor_snippet_reaches_for_nearby_term():
+    text = "x " * 40 + "see the apple thread " + "y " * 5 + "LINK TEXT" + " z" * 40
+    a = text.index("LINK TEXT")
+    snippets = SnippetIndex(text, TermMatcher(["apple"]), span=10)
+    snip = snippets.for_anchor(SimpleNamespace(span=(a, a + len("LINK TEXT"))))
+    assert "apple" in snip and "LINK TEXT" in snip
+    assert snippets.for_anchor(SimpleNamespace(span=None)) == snippets.page_snippet()